@@ -0,0 +1,183 @@
+"""Persistent SQLite cache of scraped Reddit activity."""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Set, Tuple
+
+
+class ActivityCache:
+    """On-disk store of posts and comments keyed by username and item id.
+    
+    Lets the scraper refresh a user incrementally: only items newer than the
+    newest stored `created_utc`, plus a recent overlap window whose scores are
+    still changing, need to be fetched, then merged with what is already on
+    disk. Users not refreshed within `ttl_seconds` are dropped, and
+    the least recently refreshed users are evicted once the store holds more
+    than `max_items` rows.
+    """
+    
+    def __init__(self, path: str, ttl_seconds: float, max_items: int):
+        """Open (and create if needed) the cache database at `path`."""
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+        self.lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS activity (
+                    username TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    item_id TEXT NOT NULL,
+                    created_utc REAL NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (username, kind, item_id)
+                );
+                CREATE INDEX IF NOT EXISTS activity_by_time
+                    ON activity (username, kind, created_utc DESC);
+                CREATE TABLE IF NOT EXISTS users (
+                    username TEXT PRIMARY KEY,
+                    refreshed_at REAL NOT NULL
+                );
+            """)
+    
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Yield a connection that commits on success and is always closed."""
+        with self.lock:
+            conn = sqlite3.connect(self.path, timeout=30)
+            try:
+                with conn:
+                    yield conn
+            finally:
+                conn.close()
+    
+    @staticmethod
+    def _key(username: str) -> str:
+        """Normalize usernames, which Reddit treats case-insensitively."""
+        return username.lower()
+    
+    def newest_created_utc(self, username: str, kind: str) -> Optional[float]:
+        """Return the newest stored timestamp for a user's posts or comments."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT MAX(created_utc) FROM activity WHERE username = ? AND kind = ?",
+                (self._key(username), kind)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def item_ids(self, username: str, kind: str) -> Set[str]:
+        """Return the ids of a user's stored posts or comments."""
+        with self._connect() as conn:
+            return {item_id for (item_id,) in conn.execute(
+                "SELECT item_id FROM activity WHERE username = ? AND kind = ?",
+                (self._key(username), kind)
+            )}
+    
+    def store(self, username: str, kind: str, items: List[Dict[str, Any]]) -> None:
+        """Insert or update items for a user."""
+        if not items:
+            return
+        
+        rows = [
+            (self._key(username), kind, item['id'], item['created_utc'], json.dumps(item))
+            for item in items
+        ]
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO activity (username, kind, item_id, created_utc, data) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+    
+    def store_stream(self, username: str, records: Iterable[Tuple[str, Dict[str, Any]]],
+                     batch_size: int = 500) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Pass `(kind, item)` records through, writing them to the cache in batches.
+        
+        Record kinds are singular ('post', 'comment'); they are stored under the
+        plural kinds used elsewhere. Everything buffered is written once the
+        stream is exhausted.
+        """
+        pending: Dict[str, List[Dict[str, Any]]] = {}
+        buffered = 0
+        
+        for kind, item in records:
+            pending.setdefault(f"{kind}s", []).append(item)
+            buffered += 1
+            if buffered >= batch_size:
+                self._flush(username, pending)
+                buffered = 0
+            yield kind, item
+        
+        self._flush(username, pending)
+    
+    def _flush(self, username: str, pending: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Store and clear buffered items, per kind."""
+        for kind, items in pending.items():
+            self.store(username, kind, items)
+            items.clear()
+    
+    def load(self, username: str, kind: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Load a user's stored items, newest first."""
+        query = "SELECT data FROM activity WHERE username = ? AND kind = ? ORDER BY created_utc DESC"
+        params = [self._key(username), kind]
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        
+        with self._connect() as conn:
+            return [json.loads(data) for (data,) in conn.execute(query, params)]
+    
+    def mark_refreshed(self, username: str) -> None:
+        """Record that a user's activity was just refreshed from Reddit."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO users (username, refreshed_at) VALUES (?, ?)",
+                (self._key(username), time.time())
+            )
+    
+    def evict(self) -> int:
+        """Drop expired users, then least recently refreshed users over the size cap.
+        
+        Returns the number of users evicted.
+        """
+        with self._connect() as conn:
+            cutoff = time.time() - self.ttl_seconds
+            evicted = [row[0] for row in conn.execute(
+                "SELECT username FROM users WHERE refreshed_at < ?", (cutoff,)
+            )]
+            for username in evicted:
+                self._delete_user(conn, username)
+            
+            total_items = conn.execute("SELECT COUNT(*) FROM activity").fetchone()[0]
+            if total_items > self.max_items:
+                user_counts = conn.execute("""
+                    SELECT users.username, COUNT(activity.item_id)
+                    FROM users LEFT JOIN activity ON activity.username = users.username
+                    GROUP BY users.username
+                    ORDER BY users.refreshed_at ASC
+                """).fetchall()
+                for username, count in user_counts:
+                    if total_items <= self.max_items:
+                        break
+                    self._delete_user(conn, username)
+                    evicted.append(username)
+                    total_items -= count
+        
+        if evicted:
+            logging.info(f"Evicted cached activity for {len(evicted)} users")
+        return len(evicted)
+    
+    @staticmethod
+    def _delete_user(conn: sqlite3.Connection, username: str) -> None:
+        """Remove every stored row for a user."""
+        conn.execute("DELETE FROM activity WHERE username = ?", (username,))
+        conn.execute("DELETE FROM users WHERE username = ?", (username,))
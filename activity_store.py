@@ -0,0 +1,210 @@
+"""Compact column store for a user's scraped posts and comments."""
+
+import sys
+from array import array
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple, Union
+
+
+# Fields kept in dedicated columns; everything else a kind carries is packed into one tuple per row
+CORE_FIELDS = ('id', 'subreddit', 'score', 'created_utc', 'body', 'permalink')
+EXTRA_FIELDS = {
+    'post': ('title', 'upvote_ratio', 'num_comments', 'url', 'is_self', 'over_18', 'stickied', 'locked'),
+    'comment': ('parent_id', 'is_submitter', 'stickied', 'locked', 'link_id', 'parent_title'),
+}
+EXTRA_POSITIONS = {kind: {field: i for i, field in enumerate(fields)} for kind, fields in EXTRA_FIELDS.items()}
+
+
+class ActivityItem:
+    """Read-only, dict-compatible view of one row in an ActivityTable."""
+    
+    __slots__ = ('_table', '_row')
+    
+    def __init__(self, table: "ActivityTable", row: int):
+        """Point the view at `row` of `table`."""
+        self._table = table
+        self._row = row
+    
+    @property
+    def kind(self) -> str:
+        """Return 'post' or 'comment'."""
+        return self._table.kind
+    
+    def __getitem__(self, key: str) -> Any:
+        """Return a field value, raising KeyError for fields this kind doesn't have."""
+        return self._table.value(self._row, key)
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return a field value, or `default` for fields this kind doesn't have."""
+        try:
+            return self._table.value(self._row, key)
+        except KeyError:
+            return default
+    
+    def __contains__(self, key: str) -> bool:
+        """Check whether this kind has a field."""
+        return key in self._table.fields
+    
+    def keys(self) -> Tuple[str, ...]:
+        """Return the field names of this kind."""
+        return self._table.fields
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Materialize the row as a plain dict."""
+        return {key: self[key] for key in self._table.fields}
+    
+    def __repr__(self) -> str:
+        """Show the row like the dict it replaces."""
+        return f"ActivityItem({self.to_dict()!r})"
+
+
+class ActivityTable:
+    """Column storage for one kind of activity, in scrape order (newest first).
+    
+    Ids, timestamps, scores and subreddit codes live in flat columns; rows are
+    read through ActivityItem views, so existing code that indexes items like
+    dicts keeps working while no per-item dict is kept alive.
+    """
+    
+    def __init__(self, kind: str, subreddits: List[str], subreddit_codes: Dict[str, int]):
+        """Create an empty table sharing the store's subreddit interning."""
+        self.kind = kind
+        self.fields = CORE_FIELDS + EXTRA_FIELDS[kind]
+        self._extra_positions = EXTRA_POSITIONS[kind]
+        self._subreddits = subreddits
+        self._subreddit_codes = subreddit_codes
+        self.ids: List[str] = []
+        self.created_utc = array('d')
+        self.scores = array('q')
+        self.subreddit_codes = array('I')
+        self.bodies: List[str] = []
+        self.permalinks: List[str] = []
+        self.extras: List[tuple] = []
+    
+    def append(self, item: Dict[str, Any]) -> int:
+        """Store an item and return its row number."""
+        subreddit = item['subreddit']
+        code = self._subreddit_codes.get(subreddit)
+        if code is None:
+            code = self._subreddit_codes[subreddit] = len(self._subreddits)
+            self._subreddits.append(sys.intern(subreddit))
+        
+        self.ids.append(item['id'])
+        self.created_utc.append(item['created_utc'])
+        self.scores.append(item['score'])
+        self.subreddit_codes.append(code)
+        self.bodies.append(item['body'])
+        self.permalinks.append(item['permalink'])
+        self.extras.append(tuple(item.get(field) for field in EXTRA_FIELDS[self.kind]))
+        return len(self.ids) - 1
+    
+    def value(self, row: int, key: str) -> Any:
+        """Return one field of one row."""
+        if key == 'id':
+            return self.ids[row]
+        if key == 'subreddit':
+            return self._subreddits[self.subreddit_codes[row]]
+        if key == 'score':
+            return self.scores[row]
+        if key == 'created_utc':
+            return self.created_utc[row]
+        if key == 'body':
+            return self.bodies[row]
+        if key == 'permalink':
+            return self.permalinks[row]
+        return self.extras[row][self._extra_positions[key]]
+    
+    def __len__(self) -> int:
+        """Return the number of rows."""
+        return len(self.ids)
+    
+    def __getitem__(self, index: Union[int, slice]) -> Union[ActivityItem, List[ActivityItem]]:
+        """Return a row view, or a list of views for a slice."""
+        if isinstance(index, slice):
+            return [ActivityItem(self, row) for row in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("activity row out of range")
+        return ActivityItem(self, index)
+    
+    def __iter__(self) -> Iterator[ActivityItem]:
+        """Iterate over row views in stored order."""
+        return (ActivityItem(self, row) for row in range(len(self)))
+
+
+class ActivityStore:
+    """A user's posts and comments with O(1) id lookup and running aggregates.
+    
+    Subreddit names are interned to small integer codes shared by both
+    tables, and per-subreddit activity counts are updated as items are added,
+    so statistics never need another pass over the data.
+    """
+    
+    def __init__(self):
+        """Create an empty store."""
+        self.subreddits: List[str] = []
+        self._subreddit_codes: Dict[str, int] = {}
+        self.posts = ActivityTable('post', self.subreddits, self._subreddit_codes)
+        self.comments = ActivityTable('comment', self.subreddits, self._subreddit_codes)
+        self._rows_by_id: Dict[str, Tuple[ActivityTable, int]] = {}
+        self.subreddit_counts = array('I')
+    
+    @classmethod
+    def from_items(cls, posts: Iterable[Dict[str, Any]], comments: Iterable[Dict[str, Any]]) -> "ActivityStore":
+        """Build a store from lists of post and comment dicts."""
+        store = cls()
+        store.extend('post', posts)
+        store.extend('comment', comments)
+        return store
+    
+    @classmethod
+    def from_reddit_data(cls, reddit_data: Dict[str, Any]) -> "ActivityStore":
+        """Return the store attached to scraped data, building one if it only has lists."""
+        store = reddit_data.get('activity')
+        if isinstance(store, cls):
+            return store
+        return cls.from_items(reddit_data['posts'], reddit_data['comments'])
+    
+    def add(self, kind: str, item: Dict[str, Any]) -> None:
+        """Add a post or comment."""
+        table = self.posts if kind == 'post' else self.comments
+        row = table.append(item)
+        # Post and comment ids come from separate sequences; the first item stored wins lookups
+        self._rows_by_id.setdefault(item['id'], (table, row))
+        
+        code = table.subreddit_codes[row]
+        if code == len(self.subreddit_counts):
+            self.subreddit_counts.append(0)
+        self.subreddit_counts[code] += 1
+    
+    def extend(self, kind: str, items: Iterable[Dict[str, Any]]) -> None:
+        """Add every item of one kind."""
+        for item in items:
+            self.add(kind, item)
+    
+    def get(self, item_id: str) -> Optional[ActivityItem]:
+        """Look up a post or comment by id."""
+        location = self._rows_by_id.get(item_id)
+        return ActivityItem(*location) if location else None
+    
+    def __len__(self) -> int:
+        """Return the total number of posts and comments."""
+        return len(self.posts) + len(self.comments)
+    
+    @property
+    def subreddit_activity(self) -> Dict[str, int]:
+        """Return activity counts keyed by subreddit name."""
+        return {self.subreddits[code]: count for code, count in enumerate(self.subreddit_counts)}
+    
+    def top_subreddits(self, limit: int = 10) -> List[Tuple[str, int]]:
+        """Return the most active subreddits, busiest first."""
+        return sorted(self.subreddit_activity.items(), key=lambda x: x[1], reverse=True)[:limit]
+    
+    def statistics(self) -> Dict[str, Any]:
+        """Return statistics in the shape used by `scrape_user_data`."""
+        return {
+            'total_posts': len(self.posts),
+            'total_comments': len(self.comments),
+            'total_activity': len(self),
+            'top_subreddits': self.top_subreddits()
+        }
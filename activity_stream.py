@@ -0,0 +1,118 @@
+"""Streaming activity records with incrementally computed statistics."""
+
+import heapq
+from array import array
+from typing import Dict, Any, Iterable, Iterator, List, Tuple
+
+from activity_store import ActivityStore
+from behavior_analytics import analyze_behavior
+from prompt_builder import item_signal
+
+
+ActivityRecord = Tuple[str, Dict[str, Any]]  # ('post' | 'comment', cleaned item)
+
+# How many of the most informative items of each kind are kept for persona analysis
+SAMPLE_POSTS = 500
+SAMPLE_COMMENTS = 1000
+
+
+class ActivityStatistics:
+    """Activity statistics accumulated one item at a time."""
+    
+    def __init__(self):
+        """Start with empty counters."""
+        self.total_posts = 0
+        self.total_comments = 0
+        self.subreddit_activity: Dict[str, int] = {}
+        # Compact numeric columns over every item, for behavioral analytics
+        self.created_utc = array('d')
+        self.scores = array('q')
+        self.post_flags = array('b')
+    
+    def add(self, kind: str, item: Dict[str, Any]) -> None:
+        """Count a single post or comment."""
+        if kind == 'post':
+            self.total_posts += 1
+        else:
+            self.total_comments += 1
+        subreddit = item['subreddit']
+        self.subreddit_activity[subreddit] = self.subreddit_activity.get(subreddit, 0) + 1
+        self.created_utc.append(item['created_utc'])
+        self.scores.append(item['score'])
+        self.post_flags.append(kind == 'post')
+    
+    def add_many(self, kind: str, items: Iterable[Dict[str, Any]]) -> None:
+        """Count every item of one kind."""
+        for item in items:
+            self.add(kind, item)
+    
+    def top_subreddits(self, limit: int = 10) -> List[Tuple[str, int]]:
+        """Return the most active subreddits, busiest first."""
+        return sorted(self.subreddit_activity.items(), key=lambda x: x[1], reverse=True)[:limit]
+    
+    def behavior(self) -> Dict[str, Any]:
+        """Compute behavioral analytics from the columns collected so far."""
+        return analyze_behavior(self.created_utc, self.scores, self.post_flags, list(self.subreddit_activity.values()))
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Return statistics in the shape used by `scrape_user_data`."""
+        return {
+            'total_posts': self.total_posts,
+            'total_comments': self.total_comments,
+            'total_activity': self.total_posts + self.total_comments,
+            'top_subreddits': self.top_subreddits()
+        }
+
+
+class ActivityStream:
+    """Lazily scraped activity for one user.
+    
+    Iterating yields `(kind, item)` records as they are scraped; `statistics`
+    is updated as each record flows past and is complete once the stream has
+    been exhausted. A stream can only be consumed once.
+    """
+    
+    def __init__(self, profile: Dict[str, Any], records: Iterator[ActivityRecord]):
+        """Wrap a record iterator for a user profile."""
+        self.profile = profile
+        self.statistics = ActivityStatistics()
+        self._records = records
+    
+    def __iter__(self) -> Iterator[ActivityRecord]:
+        """Yield records, counting each one."""
+        for kind, item in self._records:
+            self.statistics.add(kind, item)
+            yield kind, item
+
+
+def sample_activity_stream(stream: ActivityStream, max_posts: int = SAMPLE_POSTS,
+                           max_comments: int = SAMPLE_COMMENTS) -> Dict[str, Any]:
+    """Consume a stream, keeping only the items most worth analyzing.
+    
+    Bounded heaps retain the `max_posts` posts and `max_comments` comments with
+    the highest standalone signal, so the prompt builder still ranks across the
+    whole history while memory stays fixed. Returns a dict shaped like
+    `RedditScraper.scrape_user_data` output, items newest first, with
+    statistics covering the whole stream.
+    """
+    limits = {'post': max_posts, 'comment': max_comments}
+    heaps: Dict[str, List[Tuple[float, int, Dict[str, Any]]]] = {'post': [], 'comment': []}
+    
+    for seq, (kind, item) in enumerate(stream):
+        entry = (item_signal(kind, item), seq, item)
+        if len(heaps[kind]) < limits[kind]:
+            heapq.heappush(heaps[kind], entry)
+        elif entry[0] > heaps[kind][0][0]:
+            heapq.heapreplace(heaps[kind], entry)
+    
+    def newest_first(kind: str) -> List[Dict[str, Any]]:
+        return sorted((item for _, _, item in heaps[kind]), key=lambda item: item['created_utc'], reverse=True)
+    
+    activity = ActivityStore.from_items(newest_first('post'), newest_first('comment'))
+    return {
+        'profile': stream.profile,
+        'posts': activity.posts,
+        'comments': activity.comments,
+        'statistics': stream.statistics.to_dict(),
+        'activity': activity
+    }
@@ -3,25 +3,56 @@ Flask web application for Reddit Persona Generator
 """
 import os
 import logging
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+import json
+from flask import Flask, Response, render_template, request, jsonify, redirect, stream_with_context, url_for
 from werkzeug.exceptions import RequestEntityTooLarge
 import traceback
 from datetime import datetime
 
-from reddit_scraper import RedditScraper
-from persona_analyzer import PersonaAnalyzer
-from utils import extract_username_from_url, validate_reddit_data
-from config import OUTPUT_DIR
+from clients import get_analyzer, get_scraper_pool, warm_up_clients
+from pipeline import run_persona_pipeline
+from job_queue import JobQueue, JOB_DONE, JOB_FAILED
+from metrics import registry, span
+from persona_store import PersonaStore
+from utils import parse_profile_input
+from config import (OUTPUT_DIR, JOB_WORKERS, JOB_STORE_PATH, JOB_QUEUE_DURABLE,
+                    PERSONA_STORE_ENABLED, PERSONA_STORE_PATH, PERSONA_FRESH_SECONDS,
+                    PERSONA_INCOMPLETE_FRESH_SECONDS)
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+SSE_HEARTBEAT_SECONDS = 15  # Keep idle event streams alive through proxies
+SSE_MAX_IDLE_SECONDS = 600  # Close event streams that see no events for this long; clients can poll /jobs/<id>
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+persona_store = (PersonaStore(PERSONA_STORE_PATH, PERSONA_FRESH_SECONDS, PERSONA_INCOMPLETE_FRESH_SECONDS)
+                 if PERSONA_STORE_ENABLED else None)
+
+def run_persona_job(job):
+    """Run the full persona pipeline for a queued job using pooled clients and store the result"""
+    with span('persona_job'), get_scraper_pool().acquire() as scraper:
+        result = run_persona_pipeline(job.username, scraper, get_analyzer(), on_event=job.emit)
+    if persona_store:
+        persona_store.put(job.username, result)
+    return result
+
+job_queue = JobQueue(
+    run_persona_job,
+    workers=JOB_WORKERS,
+    store_path=JOB_STORE_PATH if JOB_QUEUE_DURABLE else None
+)
+# Authenticate once at import, so every server (gunicorn, flask run or __main__) fails fast on bad
+# credentials and the first request doesn't pay for client setup
+warm_up_clients()
+# Start workers now so durable jobs interrupted by a restart resume without waiting for a new request
+job_queue.start()
+
 @app.route('/')
 def index():
     """Main page with input form"""
@@ -29,7 +60,7 @@ def index():
 
 @app.route('/generate', methods=['POST'])
 def generate_persona():
-    """Generate persona from Reddit profile"""
+    """Serve a stored persona for a Reddit profile or queue its generation"""
     try:
         data = request.get_json()
         profile_input = data.get('profile_input', '').strip()
@@ -38,54 +69,45 @@ def generate_persona():
             return jsonify({'error': 'Please provide a Reddit username or profile URL'}), 400
         
         # Extract username from input
-        if profile_input.startswith('http'):
-            username = extract_username_from_url(profile_input)
-        else:
-            # Assume it's just a username
-            username = profile_input.replace('u/', '').replace('/u/', '').replace('@', '')
+        username = parse_profile_input(profile_input)
         
         if not username:
             return jsonify({'error': 'Invalid Reddit username or URL'}), 400
         
         logging.info(f"Processing request for username: {username}")
         
-        # Initialize components
-        scraper = RedditScraper()
-        analyzer = PersonaAnalyzer()
-        
-        # Scrape Reddit data
-        logging.info(f"Scraping Reddit data for user: {username}")
-        reddit_data = scraper.scrape_user_data(username)
+        # Serve a stored persona instantly; a stale one is refreshed in the background
+        stored = persona_store.get(username) if persona_store and not data.get('refresh') else None
+        if stored:
+            response = {
+                'username': stored.username,
+                'status': 'done',
+                'result': stored.result,
+                'generated_at': stored.generated_at,
+                'stale': not persona_store.is_fresh(stored),
+                'success': True
+            }
+            if response['stale']:
+                logging.info(f"Serving stale persona for {username} and refreshing it")
+                job = job_queue.submit(username)
+                response.update({
+                    'job_id': job.id,
+                    'status_url': url_for('job_status', job_id=job.id),
+                    'events_url': url_for('job_events', job_id=job.id)
+                })
+            return jsonify(response)
         
-        if not validate_reddit_data(reddit_data):
-            return jsonify({'error': f'No data found for user {username} or user does not exist'}), 404
-        
-        total_activities = len(reddit_data.get('posts', [])) + len(reddit_data.get('comments', []))
-        logging.info(f"Found {total_activities} total activities for {username}")
-        
-        # Generate persona
-        logging.info("Generating AI persona analysis...")
-        persona = analyzer.generate_persona(reddit_data)
-        
-        # Generate citations
-        logging.info("Generating citations...")
-        citations = analyzer.generate_citations(reddit_data, persona)
-        
-        # Format response
-        response_data = {
-            'username': username,
-            'total_activities': total_activities,
-            'posts_count': len(reddit_data.get('posts', [])),
-            'comments_count': len(reddit_data.get('comments', [])),
-            'persona': persona,
-            'citations': citations,
-            'timestamp': datetime.now().isoformat(),
+        # Queue the pipeline and return immediately; clients poll /jobs/<id>
+        job = job_queue.submit(username)
+        return jsonify({
+            'job_id': job.id,
+            'username': job.username,
+            'status': job.status,
+            'status_url': url_for('job_status', job_id=job.id),
+            'events_url': url_for('job_events', job_id=job.id),
             'success': True
-        }
-        
-        logging.info(f"Successfully generated persona for {username}")
-        return jsonify(response_data)
-        
+        }), 202
+    
     except Exception as e:
         error_msg = str(e)
         logging.error(f"Error generating persona: {error_msg}")
@@ -96,11 +118,76 @@ def generate_persona():
             'success': False
         }), 500
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Status of a persona generation job, including its result once done"""
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': f'Job {job_id} not found', 'success': False}), 404
+    
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Stream a job's progress events as Server-Sent Events"""
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': f'Job {job_id} not found', 'success': False}), 404
+    
+    def stream():
+        # Jobs restored from the durable store have no event history, only a final status
+        if not job.events and job.status == JOB_DONE:
+            yield format_sse('done', job.result)
+            return
+        if not job.events and job.status == JOB_FAILED:
+            yield format_sse('failed', {'error': job.error})
+            return
+        
+        sent = 0
+        idle = 0
+        while True:
+            events = job.wait_for_events(sent, timeout=SSE_HEARTBEAT_SECONDS)
+            if not events:
+                # A job looked up from the durable store gets no events; report its final status instead
+                if job.status == JOB_DONE:
+                    yield format_sse('done', job.result)
+                    return
+                if job.status == JOB_FAILED:
+                    yield format_sse('failed', {'error': job.error})
+                    return
+                idle += SSE_HEARTBEAT_SECONDS
+                if idle >= SSE_MAX_IDLE_SECONDS:
+                    logging.info(f"Closing idle event stream for job {job.id}")
+                    return
+                yield ": heartbeat\n\n"
+                continue
+            idle = 0
+            for event in events:
+                yield format_sse(event['event'], event['data'])
+                if event['event'] in ('done', 'failed'):
+                    return
+            sent += len(events)
+    
+    return Response(
+        stream_with_context(stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def format_sse(event, data):
+    """Format a single Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.route('/health')
 def health():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
 
+@app.route('/metrics')
+def metrics():
+    """Pipeline spans and counters in the Prometheus text format"""
+    return Response(registry.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.errorhandler(RequestEntityTooLarge)
 def handle_file_too_large(e):
     return jsonify({'error': 'File too large'}), 413
@@ -0,0 +1,184 @@
+"""Deterministic behavioral statistics computed locally from activity timestamps and scores."""
+
+from typing import Dict, Any, List, Optional, Sequence
+
+import numpy as np
+
+from activity_store import ActivityStore
+
+
+HOURS_PER_WEEK = 168
+EPOCH_WEEKDAY = 3  # 1970-01-01 was a Thursday (Monday = 0)
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+QUIET_WINDOW_HOURS = 8  # Length of the daily low-activity window taken as sleep
+ASSUMED_SLEEP_MIDPOINT = 4  # Local hour at the middle of a typical night's sleep
+MIN_ITEMS_FOR_TIMEZONE = 30  # Too few timestamps make the quiet window meaningless
+
+
+def analyze_behavior(created_utc: np.ndarray, scores: np.ndarray, is_post: np.ndarray,
+                     subreddit_counts: Sequence[int]) -> Dict[str, Any]:
+    """Compute posting rhythm, cadence, community spread and karma statistics.
+    
+    Every input is a flat column over all scraped activity; the result only
+    contains plain ints, floats, strings and lists so it can go straight into
+    JSON responses and prompts.
+    """
+    created_utc = np.asarray(created_utc, dtype=np.float64)
+    scores = np.asarray(scores, dtype=np.float64)
+    is_post = np.asarray(is_post, dtype=bool)
+    
+    hours = (created_utc // 3600).astype(np.int64)
+    hour_of_week = np.bincount((hours + EPOCH_WEEKDAY * 24) % HOURS_PER_WEEK, minlength=HOURS_PER_WEEK)
+    hourly = hour_of_week.reshape(7, 24).sum(axis=0)
+    weekday = hour_of_week.reshape(7, 24).sum(axis=1)
+    
+    return {
+        'total_items': int(created_utc.size),
+        'hour_of_week_utc': hour_of_week.tolist(),
+        'hourly_utc': hourly.tolist(),
+        'weekday_utc': dict(zip(WEEKDAYS, weekday.tolist())),
+        'peak_hours_utc': [int(hour) for hour in np.argsort(-hourly, kind='stable')[:3] if hourly[hour]],
+        'timezone': _infer_timezone(hourly),
+        'cadence': _cadence(created_utc),
+        'subreddits': _subreddit_spread(np.asarray(subreddit_counts, dtype=np.float64)),
+        'karma': {
+            'posts': _score_distribution(scores[is_post]),
+            'comments': _score_distribution(scores[~is_post])
+        }
+    }
+
+
+def analyze_activity_store(activity: ActivityStore) -> Dict[str, Any]:
+    """Compute behavioral statistics over every item in an ActivityStore."""
+    created_utc = np.concatenate((np.frombuffer(activity.posts.created_utc, dtype=np.float64),
+                                  np.frombuffer(activity.comments.created_utc, dtype=np.float64)))
+    scores = np.concatenate((np.frombuffer(activity.posts.scores, dtype=np.int64),
+                             np.frombuffer(activity.comments.scores, dtype=np.int64)))
+    is_post = np.arange(created_utc.size) < len(activity.posts)
+    return analyze_behavior(created_utc, scores, is_post, activity.subreddit_counts)
+
+
+def ensure_behavior_analytics(reddit_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the behavioral statistics attached to scraped data, computing them once."""
+    if 'behavior' not in reddit_data:
+        reddit_data['behavior'] = analyze_activity_store(ActivityStore.from_reddit_data(reddit_data))
+    return reddit_data['behavior']
+
+
+def _infer_timezone(hourly: np.ndarray) -> Optional[Dict[str, Any]]:
+    """Take the quietest daily window as sleep and derive a likely UTC offset."""
+    if hourly.sum() < MIN_ITEMS_FOR_TIMEZONE:
+        return None
+    
+    wrapped = np.concatenate((hourly, hourly[:QUIET_WINDOW_HOURS - 1]))
+    window_totals = np.convolve(wrapped, np.ones(QUIET_WINDOW_HOURS, dtype=np.int64), mode='valid')[:24]
+    quiet_start = int(np.argmin(window_totals))
+    midpoint = (quiet_start + QUIET_WINDOW_HOURS / 2) % 24
+    offset = int(round(ASSUMED_SLEEP_MIDPOINT - midpoint))
+    offset = (offset + 12) % 24 - 12  # Normalize to UTC-12..UTC+11
+    
+    return {
+        'quiet_window_utc': [quiet_start, (quiet_start + QUIET_WINDOW_HOURS) % 24],
+        'quiet_window_share': round(float(window_totals[quiet_start] / hourly.sum()), 3),
+        'estimated_utc_offset': offset
+    }
+
+
+def _cadence(created_utc: np.ndarray) -> Dict[str, Any]:
+    """Summarize how often and how evenly the user posts."""
+    if created_utc.size < 2:
+        return {'active_days': int(np.unique(created_utc // 86400).size), 'span_days': 0.0,
+                'items_per_active_day': float(created_utc.size), 'items_per_week': None,
+                'median_gap_hours': None, 'longest_gap_days': None, 'burstiness': None}
+    
+    times = np.sort(created_utc)
+    gaps = np.diff(times)
+    span_days = float((times[-1] - times[0]) / 86400)
+    active_days = int(np.unique(times // 86400).size)
+    mean_gap, std_gap = gaps.mean(), gaps.std()
+    
+    return {
+        'active_days': active_days,
+        'span_days': round(span_days, 1),
+        'items_per_active_day': round(times.size / active_days, 2),
+        'items_per_week': round(times.size / max(span_days / 7, 1 / 7), 2),
+        'median_gap_hours': round(float(np.median(gaps) / 3600), 2),
+        'longest_gap_days': round(float(gaps.max() / 86400), 1),
+        # -1 perfectly regular, 0 random (Poisson), towards 1 bursty
+        'burstiness': round(float((std_gap - mean_gap) / (std_gap + mean_gap)), 3) if std_gap + mean_gap > 0 else 0.0
+    }
+
+
+def _subreddit_spread(counts: np.ndarray) -> Dict[str, Any]:
+    """Measure how activity is spread across communities."""
+    counts = counts[counts > 0]
+    if counts.size == 0:
+        return {'distinct': 0, 'entropy_bits': 0.0, 'normalized_entropy': 0.0, 'top_share': 0.0}
+    
+    shares = counts / counts.sum()
+    entropy = float(-(shares * np.log2(shares)).sum())
+    return {
+        'distinct': int(counts.size),
+        'entropy_bits': round(entropy, 3),
+        'normalized_entropy': round(entropy / np.log2(counts.size), 3) if counts.size > 1 else 0.0,
+        'top_share': round(float(shares.max()), 3)
+    }
+
+
+def _score_distribution(scores: np.ndarray) -> Optional[Dict[str, Any]]:
+    """Summarize a score distribution."""
+    if scores.size == 0:
+        return None
+    p50, p90 = np.percentile(scores, [50, 90])
+    return {
+        'count': int(scores.size),
+        'mean': round(float(scores.mean()), 2),
+        'median': round(float(p50), 2),
+        'p90': round(float(p90), 2),
+        'max': int(scores.max()),
+        'negative_share': round(float((scores < 0).mean()), 3)
+    }
+
+
+def format_behavior_summary(behavior: Dict[str, Any]) -> str:
+    """Render behavioral statistics as plain text for prompts and reports."""
+    lines: List[str] = []
+    
+    if behavior['peak_hours_utc']:
+        lines.append("Peak Hours (UTC): " + ", ".join(f"{hour:02d}:00" for hour in behavior['peak_hours_utc']))
+    weekday = behavior['weekday_utc']
+    if behavior['total_items']:
+        lines.append("Activity By Weekday (UTC): " + ", ".join(f"{day} {count}" for day, count in weekday.items()))
+    
+    timezone = behavior['timezone']
+    if timezone:
+        start, end = timezone['quiet_window_utc']
+        offset = timezone['estimated_utc_offset']
+        lines.append(
+            f"Quiet Window: {start:02d}:00-{end:02d}:00 UTC ({timezone['quiet_window_share']:.0%} of activity), "
+            f"consistent with UTC{offset:+d} if that is when they sleep"
+        )
+    
+    cadence = behavior['cadence']
+    if cadence['items_per_week'] is not None:
+        lines.append(
+            f"Cadence: {cadence['items_per_week']} items/week over {cadence['span_days']} days, "
+            f"active on {cadence['active_days']} days ({cadence['items_per_active_day']} items per active day), "
+            f"median gap {cadence['median_gap_hours']}h, longest gap {cadence['longest_gap_days']} days"
+        )
+        lines.append(f"Burstiness: {cadence['burstiness']} (-1 regular, 0 random, 1 bursty)")
+    
+    subreddits = behavior['subreddits']
+    lines.append(
+        f"Community Spread: {subreddits['distinct']} subreddits, entropy {subreddits['entropy_bits']} bits "
+        f"(normalized {subreddits['normalized_entropy']}), top subreddit {subreddits['top_share']:.0%} of activity"
+    )
+    
+    for kind, distribution in behavior['karma'].items():
+        if distribution:
+            lines.append(
+                f"{kind[:-1].capitalize()} Scores: mean {distribution['mean']}, median {distribution['median']}, "
+                f"p90 {distribution['p90']}, max {distribution['max']}, {distribution['negative_share']:.0%} negative"
+            )
+    
+    return "\n".join(lines)
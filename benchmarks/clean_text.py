@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for utils.clean_reddit_text.
+
+Checks that the cleaner's output is byte-identical to the original
+eleven-pass implementation on the fixture corpus, then times both.
+
+Usage:
+    python benchmarks/clean_text.py
+    python benchmarks/clean_text.py --repeat 50 --batch 20000
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from utils import clean_many, clean_reddit_text
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "reddit_text_corpus.json")
+
+
+def legacy_clean_reddit_text(text: str) -> str:
+    """The original cleaner, kept as the reference output."""
+    if not text:
+        return ""
+    
+    text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)
+    text = re.sub(r'\*(.*?)\*', r'\1', text)
+    text = re.sub(r'~~(.*?)~~', r'\1', text)
+    text = re.sub(r'`(.*?)`', r'\1', text)
+    text = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', text)
+    text = re.sub(r'&gt;', '>', text)
+    text = re.sub(r'&lt;', '<', text)
+    text = re.sub(r'&amp;', '&', text)
+    
+    text = re.sub(r'\n\s*\n', '\n\n', text)
+    text = re.sub(r' +', ' ', text)
+    
+    return text.strip()
+
+
+def time_it(fn, texts, repeat: int) -> float:
+    """Return the best wall time of `repeat` runs of `fn` over `texts`."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Reddit text cleaner")
+    parser.add_argument('--repeat', type=int, default=20, help='Timing runs per implementation')
+    parser.add_argument('--batch', type=int, default=0, help='Also time clean_many on a batch of this many texts')
+    args = parser.parse_args()
+    
+    with open(FIXTURE_PATH, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+    
+    mismatches = [text for text in corpus if clean_reddit_text(text) != legacy_clean_reddit_text(text)]
+    if mismatches:
+        print(f"{len(mismatches)}/{len(corpus)} fixtures differ from the reference output, e.g. {mismatches[0]!r}")
+        return 1
+    print(f"Output identical on all {len(corpus)} fixtures")
+    
+    legacy_time = time_it(legacy_clean_reddit_text, corpus, args.repeat)
+    current_time = time_it(clean_reddit_text, corpus, args.repeat)
+    print(f"legacy:  {legacy_time * 1e6 / len(corpus):.2f} us/text")
+    print(f"current: {current_time * 1e6 / len(corpus):.2f} us/text ({legacy_time / current_time:.2f}x)")
+    
+    if args.batch:
+        texts = (corpus * (args.batch // len(corpus) + 1))[:args.batch]
+        start = time.perf_counter()
+        clean_many(texts, workers=1)
+        serial_time = time.perf_counter() - start
+        start = time.perf_counter()
+        pooled = clean_many(texts, workers=os.cpu_count() or 1)
+        pool_time = time.perf_counter() - start
+        if pooled != [clean_reddit_text(text) for text in texts]:
+            print("clean_many output differs from clean_reddit_text")
+            return 1
+        print(f"clean_many x{len(texts)}: {serial_time:.3f}s in-process, {pool_time:.3f}s with process pool")
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
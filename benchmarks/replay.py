@@ -0,0 +1,367 @@
+"""
+Record/replay transports for running the scraper and analyzer offline.
+
+Reddit traffic is served through a `requests.Session`-compatible object passed
+to `RedditScraper(session=...)`, so PRAW, prawcore and the rate-limited
+requestor all run unmodified. Gemini traffic is served through a client passed
+to `PersonaAnalyzer(client=...)`. Both can inject a fixed latency per call.
+
+- `SyntheticRedditSession` generates a deterministic user with N items.
+- `CassetteSession` replays recorded Reddit traffic; `RecordingSession`
+  records a real session into a cassette.
+- `ReplayGeminiClient` answers from a recorded cassette when possible and
+  otherwise synthesizes a schema-valid response; `RecordingGeminiClient`
+  records a real client into a cassette.
+"""
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Iterator, List, Optional, Tuple, get_args, get_origin
+from urllib.parse import urlparse
+
+from pydantic import BaseModel
+
+
+SUBREDDITS = ('python', 'rust', 'cooking', 'nba', 'askreddit', 'personalfinance', 'gaming', 'travel',
+              'homeimprovement', 'datascience', 'running', 'books')
+WORDS = ('really', 'think', 'work', 'code', 'game', 'team', 'recipe', 'trip', 'budget', 'weekend', 'release',
+         'problem', 'library', 'season', 'training', 'house', 'kids', 'coffee', 'job', 'interview', 'data',
+         'model', 'bug', 'deploy', 'marathon', 'novel', 'flight', 'garden', 'salary', 'rent', 'because',
+         'honestly', 'maybe', 'always', 'never', 'great', 'terrible', 'learned', 'tried', 'finally')
+HISTORY_SECONDS = 2 * 365 * 86400
+STREAM_CHUNK_CHARS = 200  # Size of each chunk when replaying a streamed Gemini response
+
+
+class ReplayResponse:
+    """The subset of `requests.Response` that prawcore reads."""
+    
+    def __init__(self, status_code: int, body: Any, headers: Optional[Dict[str, str]] = None):
+        """Wrap a decoded JSON body."""
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._body = body
+        self.text = json.dumps(body)
+    
+    def json(self) -> Any:
+        """Return the decoded body."""
+        return self._body
+
+
+class ReplaySession(ABC):
+    """Base `requests.Session` stand-in that answers requests locally after a fixed latency."""
+    
+    def __init__(self, latency: float = 0.0):
+        """Create a session that sleeps `latency` seconds per request."""
+        self.latency = latency
+        self.headers: Dict[str, str] = {}
+        self.lock = threading.Lock()
+        self.request_count = 0
+    
+    def request(self, method: str, url: str, params: Any = None, data: Any = None, **kwargs) -> ReplayResponse:
+        """Serve one request."""
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.request_count += 1
+        parsed = urlparse(url)
+        status, body = self.respond(method.upper(), parsed.path.rstrip('/'), dict(params or {}), data)
+        return ReplayResponse(status, body)
+    
+    @abstractmethod
+    def respond(self, method: str, path: str, params: Dict[str, Any], data: Any) -> Tuple[int, Any]:
+        """Return the status and JSON body for a request."""
+    
+    def close(self) -> None:
+        """Nothing to release."""
+
+
+class SyntheticRedditSession(ReplaySession):
+    """Serves a deterministic synthetic Reddit user with `items` posts and comments."""
+    
+    def __init__(self, username: str, items: int, latency: float = 0.0, seed: int = 0):
+        """Generate the user's activity up front so every run sees identical data."""
+        super().__init__(latency)
+        self.username = username
+        rng = random.Random(seed)
+        now = 1_700_000_000
+        post_count = items // 3
+        # Spread activity over about two years whatever the size
+        post_step = HISTORY_SECONDS // max(1, post_count)
+        comment_step = HISTORY_SECONDS // max(1, items - post_count)
+        
+        self.posts = []
+        for i in range(post_count):
+            self.posts.append({
+                'id': f"p{i:x}", 'name': f"t3_p{i:x}", 'title': self._sentence(rng, 4, 12),
+                'selftext': self._sentence(rng, 0, 120), 'subreddit': rng.choice(SUBREDDITS),
+                'score': int(rng.paretovariate(1.2)) - 1, 'upvote_ratio': round(rng.uniform(0.5, 1.0), 2),
+                'num_comments': rng.randint(0, 200), 'created_utc': now - i * post_step - rng.randint(0, post_step),
+                'permalink': f"/r/x/comments/p{i:x}/", 'url': f"https://reddit.com/p{i:x}", 'is_self': True,
+                'over_18': False, 'stickied': False, 'locked': False, 'author': username
+            })
+        
+        self.threads = {f"t3_l{i:x}": self._sentence(rng, 4, 10) for i in range(max(1, items // 10))}
+        thread_ids = list(self.threads)
+        self.comments = []
+        for i in range(items - post_count):
+            link_id = rng.choice(thread_ids)
+            comment = {
+                'id': f"c{i:x}", 'name': f"t1_c{i:x}", 'body': self._sentence(rng, 1, 80),
+                'subreddit': rng.choice(SUBREDDITS), 'score': int(rng.paretovariate(1.5)) - 1,
+                'created_utc': now - i * comment_step - rng.randint(0, comment_step), 'permalink': f"/r/x/comments/{link_id[3:]}/_/c{i:x}/",
+                'parent_id': link_id, 'link_id': link_id, 'is_submitter': False, 'stickied': False,
+                'locked': False, 'author': username
+            }
+            # About half of listing payloads carry the thread title, like live Reddit
+            if rng.random() < 0.5:
+                comment['link_title'] = self.threads[link_id]
+            self.comments.append(comment)
+    
+    @staticmethod
+    def _sentence(rng: random.Random, low: int, high: int) -> str:
+        """Return a random sentence of `low` to `high` words."""
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+    
+    def respond(self, method: str, path: str, params: Dict[str, Any], data: Any) -> Tuple[int, Any]:
+        """Route a request to the synthetic user's endpoints."""
+        user_path = f"/user/{self.username}"
+        if path == '/api/v1/access_token':
+            return 200, {'access_token': 'replay-token', 'token_type': 'bearer', 'expires_in': 86400, 'scope': '*'}
+        if path == '/api/v1/me':
+            return 200, {'name': 'replay', 'id': 'replay'}
+        if path == f"{user_path}/about":
+            return 200, {'kind': 't2', 'data': {
+                'name': self.username, 'id': 'u1', 'created_utc': 1_500_000_000, 'comment_karma': 12345,
+                'link_karma': 678, 'is_gold': False, 'is_mod': False, 'has_verified_email': True
+            }}
+        if path == f"{user_path}/submitted":
+            return 200, self._listing('t3', self.posts, params)
+        if path == f"{user_path}/comments":
+            return 200, self._listing('t1', self.comments, params)
+        if path == user_path:
+            newest = sorted(self.posts[:1] + self.comments[:1], key=lambda item: -item['created_utc'])
+            return 200, self._listing('t3' if newest and newest[0] in self.posts else 't1', newest, params)
+        if path == '/api/info':
+            children = [
+                {'kind': 't3', 'data': {'id': fullname[3:], 'name': fullname, 'title': self.threads[fullname],
+                                        'subreddit': 'x', 'created_utc': 0, 'permalink': f"/r/x/{fullname}"}}
+                for fullname in str(params.get('id', '')).split(',') if fullname in self.threads
+            ]
+            return 200, {'kind': 'Listing', 'data': {'after': None, 'children': children}}
+        return 404, {'message': 'Not Found', 'error': 404}
+    
+    @staticmethod
+    def _listing(kind: str, items: List[Dict[str, Any]], params: Dict[str, Any]) -> Dict[str, Any]:
+        """Return one page of a listing, honoring `limit` and `after`."""
+        limit = int(params.get('limit', 25))
+        start = 0
+        after = params.get('after')
+        if after:
+            start = next((i + 1 for i, item in enumerate(items) if item['name'] == after), len(items))
+        page = items[start:start + limit]
+        next_after = page[-1]['name'] if start + limit < len(items) and page else None
+        return {'kind': 'Listing', 'data': {'after': next_after, 'children': [{'kind': kind, 'data': item} for item in page]}}
+
+
+def _request_key(method: str, path: str, params: Dict[str, Any]) -> str:
+    """Key a request by method, path and sorted query parameters."""
+    return f"{method} {path}?" + "&".join(f"{key}={params[key]}" for key in sorted(params))
+
+
+class CassetteSession(ReplaySession):
+    """Replays Reddit responses recorded by RecordingSession."""
+    
+    def __init__(self, path: str, latency: float = 0.0):
+        """Load a cassette of JSON lines."""
+        super().__init__(latency)
+        self.responses: Dict[str, Tuple[int, Any]] = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                self.responses[entry['key']] = (entry['status'], entry['body'])
+    
+    def respond(self, method: str, path: str, params: Dict[str, Any], data: Any) -> Tuple[int, Any]:
+        """Return the recorded response, or a 404 for requests that were never recorded."""
+        if path == '/api/v1/access_token':
+            return 200, {'access_token': 'replay-token', 'token_type': 'bearer', 'expires_in': 86400, 'scope': '*'}
+        return self.responses.get(_request_key(method, path, params), (404, {'message': 'Not recorded', 'error': 404}))
+
+
+class RecordingSession:
+    """Wraps a real `requests.Session` and appends every API response to a cassette."""
+    
+    def __init__(self, session: Any, path: str):
+        """Record traffic from `session` into the JSON lines file at `path`."""
+        self.session = session
+        self.headers = session.headers
+        self.path = path
+        self.lock = threading.Lock()
+        self.request_count = 0
+    
+    def request(self, method: str, url: str, params: Any = None, **kwargs) -> Any:
+        """Issue a real request and record it, except for token exchanges."""
+        response = self.session.request(method, url, params=params, **kwargs)
+        path = urlparse(url).path.rstrip('/')
+        with self.lock:
+            self.request_count += 1
+            if path != '/api/v1/access_token':
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({
+                        'key': _request_key(method.upper(), path, dict(params or {})),
+                        'status': response.status_code,
+                        'body': response.json()
+                    }) + "\n")
+        return response
+    
+    def close(self) -> None:
+        """Close the wrapped session."""
+        self.session.close()
+
+
+class ReplayGeminiResponse:
+    """The subset of a Gemini response the analyzer reads."""
+    
+    def __init__(self, text: Optional[str]):
+        """Wrap response text."""
+        self.text = text
+        self.usage_metadata = None
+
+
+def _prompt_text(contents: Any) -> str:
+    """Extract the prompt text from `generate_content` contents."""
+    return "".join(part.text or "" for content in contents for part in content.parts)
+
+
+def _gemini_key(model: str, contents: Any, config: Any) -> str:
+    """Key a Gemini call by model, system instruction and prompt."""
+    payload = json.dumps([model, str(getattr(config, 'system_instruction', '')), _prompt_text(contents)])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def synthesize_response(schema: Any, prompt: str) -> str:
+    """Build a schema-valid JSON response, citing ids that appear in the prompt."""
+    item_ids = re.findall(r'(?:POST|COMMENT)_ID: (\S+)', prompt)
+    
+    if schema is not None and schema.__name__ == 'CitationResponse':
+        return json.dumps({'relevant_ids': item_ids[:3]})
+    if schema is not None and schema.__name__ == 'BatchCitationResponse':
+        keys = re.findall(r'^- (\w+\.\w+):', prompt, re.MULTILINE)
+        return json.dumps({'citations': [
+            {'characteristic': key, 'relevant_ids': item_ids[i % max(1, len(item_ids)):][:3]}
+            for i, key in enumerate(keys)
+        ]})
+    if isinstance(schema, type) and issubclass(schema, BaseModel):
+        # Echo words from the activity so local citation retrieval finds evidence, as it would for real output
+        vocabulary = re.findall(r'\b[a-z]{4,}\b', prompt[-20000:]) or ['activity']
+        return json.dumps(_synthesize_model(schema, vocabulary))
+    return json.dumps({})
+
+
+def _synthesize_model(schema: type, vocabulary: List[str]) -> Dict[str, Any]:
+    """Fill every field of a Pydantic model with placeholder text drawn from `vocabulary`."""
+    values = {}
+    for i, (name, field) in enumerate(schema.model_fields.items()):
+        annotation = field.annotation
+        words = " ".join(vocabulary[(i * 37 + j * 101) % len(vocabulary)] for j in range(12))
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            values[name] = _synthesize_model(annotation, vocabulary[i + 1:] or vocabulary)
+        elif get_origin(annotation) in (list, List):
+            item_type = (get_args(annotation) or (str,))[0]
+            values[name] = [f"Mentions {words}"] if item_type is str else []
+        else:
+            values[name] = f"Synthetic analysis of {name.replace('_', ' ')}: often discusses {words}. " * 3
+    return values
+
+
+class _ReplayModels:
+    """The `client.models` namespace of ReplayGeminiClient."""
+    
+    def __init__(self, client: "ReplayGeminiClient"):
+        """Bind to the owning client."""
+        self.client = client
+    
+    def generate_content(self, model: str, contents: Any, config: Any) -> ReplayGeminiResponse:
+        """Return the recorded or synthesized response after the configured latency."""
+        if self.client.latency:
+            time.sleep(self.client.latency)
+        return ReplayGeminiResponse(self._respond(model, contents, config))
+    
+    def generate_content_stream(self, model: str, contents: Any, config: Any) -> Iterator[ReplayGeminiResponse]:
+        """Yield the response in chunks, spreading the latency over them like a streamed response."""
+        text = self._respond(model, contents, config) or ""
+        chunks = [text[start:start + STREAM_CHUNK_CHARS] for start in range(0, len(text), STREAM_CHUNK_CHARS)]
+        for chunk in chunks:
+            if self.client.latency:
+                time.sleep(self.client.latency / len(chunks))
+            yield ReplayGeminiResponse(chunk)
+    
+    def _respond(self, model: str, contents: Any, config: Any) -> Optional[str]:
+        """Count the call and return the recorded or synthesized response text."""
+        with self.client.lock:
+            self.client.call_count += 1
+        recorded = self.client.responses.get(_gemini_key(model, contents, config))
+        if recorded is not None:
+            return recorded
+        return synthesize_response(getattr(config, 'response_schema', None), _prompt_text(contents))
+
+
+class ReplayGeminiClient:
+    """Offline stand-in for `genai.Client`, usable as `PersonaAnalyzer(client=...)`."""
+    
+    def __init__(self, latency: float = 0.0, cassette_path: Optional[str] = None):
+        """Create a client with a fixed per-call latency and optional recorded responses."""
+        self.latency = latency
+        self.call_count = 0
+        self.lock = threading.Lock()
+        self.responses: Dict[str, str] = {}
+        if cassette_path:
+            with open(cassette_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.responses[entry['key']] = entry['text']
+        self.models = _ReplayModels(self)
+
+
+class _RecordingModels:
+    """The `client.models` namespace of RecordingGeminiClient."""
+    
+    def __init__(self, client: "RecordingGeminiClient"):
+        """Bind to the owning client."""
+        self.client = client
+    
+    def generate_content(self, model: str, contents: Any, config: Any) -> Any:
+        """Call the real client and record the response text."""
+        response = self.client.client.models.generate_content(model=model, contents=contents, config=config)
+        self._record(model, contents, config, response.text)
+        return response
+    
+    def generate_content_stream(self, model: str, contents: Any, config: Any) -> Iterator[Any]:
+        """Stream from the real client and record the assembled response text."""
+        parts = []
+        for chunk in self.client.client.models.generate_content_stream(model=model, contents=contents, config=config):
+            parts.append(chunk.text or "")
+            yield chunk
+        self._record(model, contents, config, "".join(parts))
+    
+    def _record(self, model: str, contents: Any, config: Any, text: Optional[str]) -> None:
+        """Append one response to the cassette."""
+        with self.client.lock, open(self.client.path, 'a', encoding='utf-8') as f:
+            self.client.call_count += 1
+            f.write(json.dumps({'key': _gemini_key(model, contents, config), 'text': text}) + "\n")
+
+
+class RecordingGeminiClient:
+    """Wraps a real `genai.Client` and records every response to a cassette."""
+    
+    def __init__(self, client: Any, path: str):
+        """Record responses from `client` into the JSON lines file at `path`."""
+        self.client = client
+        self.path = path
+        self.lock = threading.Lock()
+        self.call_count = 0
+        self.models = _RecordingModels(self)
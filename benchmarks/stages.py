@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Stage-level benchmark for the persona pipeline, run fully offline.
+
+Scrapes a synthetic Reddit user through the real PRAW/prawcore stack via a
+replay session, then runs analysis, persona generation, citations and report
+formatting against a replay Gemini client. Each stage is timed separately
+for every user size and the results are written as a JSON report.
+
+Usage:
+    python benchmarks/stages.py
+    python benchmarks/stages.py --sizes 10 1000 --reddit-latency 0.05 --gemini-latency 1.5
+    python benchmarks/stages.py --output after.json --compare before.json
+    python benchmarks/stages.py --username someone --record-reddit reddit.jsonl --record-gemini gemini.jsonl
+    python benchmarks/stages.py --username someone --reddit-cassette reddit.jsonl --gemini-cassette gemini.jsonl
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Any, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+# Configure the pipeline for offline runs before config.py reads the environment
+os.environ.update({
+    'REDDIT_CLIENT_ID': os.getenv('REDDIT_CLIENT_ID', 'replay'),
+    'REDDIT_CLIENT_SECRET': os.getenv('REDDIT_CLIENT_SECRET', 'replay'),
+    'GEMINI_API_KEY': os.getenv('GEMINI_API_KEY', 'replay'),
+    'ACTIVITY_CACHE_ENABLED': 'false',
+    'RESPONSE_CACHE_BACKEND': 'none',
+    'REQUEST_DELAY': '0',
+    'MAX_POSTS': 'None',
+    'MAX_COMMENTS': 'None',
+    'GEMINI_REQUESTS_PER_MINUTE': os.getenv('GEMINI_REQUESTS_PER_MINUTE', '1000000'),
+})
+
+import requests
+from google import genai
+
+from config import GEMINI_API_KEY
+from persona_analyzer import PersonaAnalyzer
+from reddit_persona_generator import format_persona_output
+from reddit_scraper import RedditScraper
+from replay import (
+    CassetteSession, RecordingGeminiClient, RecordingSession, ReplayGeminiClient, SyntheticRedditSession
+)
+
+STAGES = ('scrape_user_data', 'prepare_analysis_data', 'generate_persona', 'generate_citations', 'format_persona_output')
+REGRESSION_THRESHOLD = 1.10  # Flag stages more than 10% slower than the baseline
+NOISE_FLOOR = 0.001  # Ignore absolute differences below this many seconds
+
+
+def run_once(size: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """Run every stage once for a user of `size` items and return the timings."""
+    username = args.username or f"synthetic_{size}"
+    if args.record_reddit:
+        session = RecordingSession(requests.Session(), args.record_reddit)
+    elif args.reddit_cassette:
+        session = CassetteSession(args.reddit_cassette, latency=args.reddit_latency)
+    else:
+        session = SyntheticRedditSession(username, size, latency=args.reddit_latency)
+    if args.record_gemini:
+        gemini = RecordingGeminiClient(genai.Client(api_key=GEMINI_API_KEY), args.record_gemini)
+    else:
+        gemini = ReplayGeminiClient(latency=args.gemini_latency, cassette_path=args.gemini_cassette)
+    
+    scraper = RedditScraper(session=session, validate=False)
+    analyzer = PersonaAnalyzer(client=gemini)
+    timings: Dict[str, float] = {}
+    
+    def timed(stage: str, fn, *fn_args):
+        start = time.perf_counter()
+        result = fn(*fn_args)
+        timings[stage] = time.perf_counter() - start
+        return result
+    
+    reddit_data = timed('scrape_user_data', scraper.scrape_user_data, username)
+    timed('prepare_analysis_data', analyzer.prepare_analysis_data, reddit_data)
+    persona = timed('generate_persona', analyzer.generate_persona, reddit_data)
+    citations = timed('generate_citations', analyzer.generate_citations, reddit_data, persona)
+    timed('format_persona_output', format_persona_output, username, persona, citations, reddit_data)
+    
+    return {
+        'timings': timings,
+        'items': reddit_data['statistics']['total_activity'],
+        'reddit_requests': session.request_count,
+        'gemini_calls': gemini.call_count
+    }
+
+
+def benchmark_size(size: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """Run `args.repeat` times for one size and summarize each stage."""
+    runs = [run_once(size, args) for _ in range(args.repeat)]
+    result = {
+        'size': size,
+        'items': runs[0]['items'],
+        'reddit_requests': runs[0]['reddit_requests'],
+        'gemini_calls': runs[0]['gemini_calls'],
+        'stages': {}
+    }
+    for stage in STAGES:
+        samples = [run['timings'][stage] for run in runs]
+        result['stages'][stage] = {
+            'median_s': round(statistics.median(samples), 6),
+            'min_s': round(min(samples), 6),
+            'max_s': round(max(samples), 6)
+        }
+    result['total_median_s'] = round(sum(stage['median_s'] for stage in result['stages'].values()), 6)
+    return result
+
+
+def compare_reports(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Describe per-stage changes against a baseline report and return the regressions."""
+    baseline_sizes = {entry['size']: entry for entry in baseline['results']}
+    regressions = []
+    for entry in current['results']:
+        previous = baseline_sizes.get(entry['size'])
+        if previous is None:
+            continue
+        for stage in STAGES:
+            before = previous['stages'][stage]['median_s']
+            after = entry['stages'][stage]['median_s']
+            ratio = after / before if before else float('inf') if after else 1.0
+            line = f"  size {entry['size']:>6} {stage:<22} {before:10.4f}s -> {after:10.4f}s ({ratio:.2f}x)"
+            print(line)
+            if ratio > REGRESSION_THRESHOLD and after - before > NOISE_FLOOR:
+                regressions.append(line.strip())
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark each persona pipeline stage offline")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000],
+                        help='Synthetic user sizes in posts plus comments')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per size; the median is reported')
+    parser.add_argument('--reddit-latency', type=float, default=0.0, help='Injected seconds per Reddit request')
+    parser.add_argument('--gemini-latency', type=float, default=0.0, help='Injected seconds per Gemini call')
+    parser.add_argument('--reddit-cassette', help='Replay recorded Reddit traffic instead of a synthetic user')
+    parser.add_argument('--gemini-cassette', help='Replay recorded Gemini responses where prompts match')
+    parser.add_argument('--record-reddit', help='Scrape live Reddit and record the traffic to this cassette')
+    parser.add_argument('--record-gemini', help='Call live Gemini and record the responses to this cassette')
+    parser.add_argument('--username', help='Username to request (required with a Reddit cassette)')
+    parser.add_argument('--output', default='benchmark_report.json', help='Where to write the JSON report')
+    parser.add_argument('--compare', help='Baseline report to compare against; exits 1 on regressions')
+    parser.add_argument('--verbose', action='store_true', help='Show pipeline logging')
+    args = parser.parse_args()
+    
+    if (args.reddit_cassette or args.record_reddit) and not args.username:
+        parser.error("--reddit-cassette and --record-reddit require --username")
+    if args.record_reddit or args.record_gemini:
+        args.repeat = 1  # Live calls are recorded once
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    
+    report = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {
+            'repeat': args.repeat,
+            'reddit_latency_s': args.reddit_latency,
+            'gemini_latency_s': args.gemini_latency,
+            'reddit_cassette': args.reddit_cassette or args.record_reddit,
+            'gemini_cassette': args.gemini_cassette or args.record_gemini,
+            'live': bool(args.record_reddit or args.record_gemini)
+        },
+        'results': []
+    }
+    
+    sizes = [0] if args.reddit_cassette or args.record_reddit else args.sizes
+    for size in sizes:
+        entry = benchmark_size(size, args)
+        report['results'].append(entry)
+        stages = ", ".join(f"{stage} {entry['stages'][stage]['median_s']:.4f}s" for stage in STAGES)
+        print(f"size {size} ({entry['items']} items, {entry['reddit_requests']} Reddit requests, "
+              f"{entry['gemini_calls']} Gemini calls): {stages}")
+    
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+    
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare}:")
+        regressions = compare_reports(report, baseline)
+        if regressions:
+            print(f"{len(regressions)} stage(s) regressed by more than {REGRESSION_THRESHOLD - 1:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
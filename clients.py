@@ -0,0 +1,125 @@
+"""Process-wide, thread-safe pools of Reddit and Gemini clients."""
+
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+from config import (
+    REQUEST_DELAY, REDDIT_CLIENT_POOL_SIZE,
+    ACTIVITY_CACHE_ENABLED, ACTIVITY_CACHE_PATH, ACTIVITY_CACHE_TTL, ACTIVITY_CACHE_MAX_ITEMS
+)
+from activity_cache import ActivityCache
+from persona_analyzer import PersonaAnalyzer
+from rate_limiter import RedditRateLimiter
+from reddit_scraper import RedditScraper
+
+
+class ClientPool:
+    """Thread-safe pool that lends out long-lived client instances.
+    
+    Instances are created lazily up to `size` and handed back to the pool
+    after use, so their HTTP sessions and keep-alive connections are reused
+    across requests instead of being rebuilt each time.
+    """
+    
+    def __init__(self, factory: Callable[[], Any], size: int):
+        """Create a pool that builds clients with `factory`, holding at most `size`."""
+        self.factory = factory
+        self.size = max(1, size)
+        self.idle: "queue.LifoQueue[Any]" = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+    
+    def add(self, client: Any) -> None:
+        """Hand an already-built client to the pool, counting it against its size."""
+        with self.lock:
+            self.created += 1
+        self.idle.put(client)
+    
+    @contextmanager
+    def acquire(self) -> Iterator[Any]:
+        """Borrow a client for the duration of a `with` block."""
+        client = self._checkout()
+        try:
+            yield client
+        finally:
+            self.idle.put(client)
+    
+    def _checkout(self) -> Any:
+        """Take an idle client, build a new one while under capacity, or wait."""
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        
+        with self.lock:
+            should_create = self.created < self.size
+            if should_create:
+                self.created += 1
+        
+        if should_create:
+            try:
+                return self.factory()
+            except Exception:
+                with self.lock:
+                    self.created -= 1
+                raise
+        return self.idle.get()
+
+
+_lock = threading.Lock()
+_reddit_validated = False
+_reddit_rate_limiter: Optional[RedditRateLimiter] = None
+_activity_cache: Optional[ActivityCache] = None
+_scraper_pool: Optional[ClientPool] = None
+_analyzer: Optional[PersonaAnalyzer] = None
+
+
+def _create_scraper() -> RedditScraper:
+    """Build a scraper sharing the process-wide rate limiter and activity cache.
+    
+    Credentials are validated only for the first scraper in the process.
+    """
+    global _reddit_validated
+    with _lock:
+        validate = not _reddit_validated
+    scraper = RedditScraper(rate_limiter=_reddit_rate_limiter, activity_cache=_activity_cache, validate=validate)
+    with _lock:
+        _reddit_validated = True
+    return scraper
+
+
+def get_scraper_pool() -> ClientPool:
+    """Return the process-wide pool of Reddit scrapers."""
+    global _scraper_pool, _reddit_rate_limiter, _activity_cache
+    with _lock:
+        if _scraper_pool is None:
+            # Every scraper shares one limiter since Reddit's quota is per OAuth client
+            _reddit_rate_limiter = RedditRateLimiter(min_interval=REQUEST_DELAY)
+            if ACTIVITY_CACHE_ENABLED:
+                _activity_cache = ActivityCache(ACTIVITY_CACHE_PATH, ACTIVITY_CACHE_TTL, ACTIVITY_CACHE_MAX_ITEMS)
+            _scraper_pool = ClientPool(_create_scraper, REDDIT_CLIENT_POOL_SIZE)
+        return _scraper_pool
+
+
+def get_analyzer() -> PersonaAnalyzer:
+    """Return the process-wide persona analyzer.
+    
+    A single instance is shared across threads: its Gemini client keeps one
+    connection pool and its rate limiter and response cache are thread-safe.
+    """
+    global _analyzer
+    with _lock:
+        if _analyzer is None:
+            _analyzer = PersonaAnalyzer()
+        return _analyzer
+
+
+def warm_up_clients() -> None:
+    """Create and validate the shared clients so configuration errors surface at startup."""
+    with get_scraper_pool().acquire():
+        pass
+    get_analyzer()
+    logging.info("Reddit and Gemini clients initialized")
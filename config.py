@@ -18,12 +18,61 @@ REDDIT_USER_AGENT = "PersonaGenerator/1.0"
 
 # Gemini Configuration
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+GEMINI_REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60"))  # Client-side request quota
+GEMINI_MAX_ATTEMPTS = int(os.getenv("GEMINI_MAX_ATTEMPTS", "4"))  # Attempts per Gemini call for throttling, server errors and timeouts
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "1.0"))  # Seconds before the first retry, doubled per attempt with full jitter
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "30"))  # Longest backoff unless the server asks for more
+GEMINI_CALL_DEADLINE = float(os.getenv("GEMINI_CALL_DEADLINE", "180"))  # Seconds a Gemini call may take including retries (0 = none)
+GEMINI_HEDGE = os.getenv("GEMINI_HEDGE", "false").lower() == "true"  # Send a duplicate request when a call runs past the p95 latency
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "0.95"))  # Latency percentile that triggers a hedge
+GEMINI_BREAKER_THRESHOLD = int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5"))  # Consecutive failures that open the circuit breaker (0 = never)
+GEMINI_BREAKER_COOLDOWN = float(os.getenv("GEMINI_BREAKER_COOLDOWN", "30"))  # Seconds the circuit stays open before a probe call
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "12000"))  # Approximate tokens of activity sent for persona analysis
+PERSONA_MODE = os.getenv("PERSONA_MODE", "single")  # "single", "map_reduce" or "auto" (map-reduce above the threshold)
+MAP_REDUCE_THRESHOLD = int(os.getenv("MAP_REDUCE_THRESHOLD", "500"))  # Posts + comments before auto mode switches to map-reduce
+MAP_CHUNK_TOKENS = int(os.getenv("MAP_CHUNK_TOKENS", "8000"))  # Approximate tokens of activity per map chunk
+MAP_CONCURRENCY = int(os.getenv("MAP_CONCURRENCY", "4"))  # Parallel map calls
+PERSONA_GENERATION = os.getenv("PERSONA_GENERATION", "single")  # "single" (one call writes every section) or "sections" (one concurrent call per section)
+SECTION_CONCURRENCY = int(os.getenv("SECTION_CONCURRENCY", "6"))  # Parallel per-section persona calls
+SECTION_RETRIES = int(os.getenv("SECTION_RETRIES", "1"))  # Extra attempts for a section call that fails or is cut off
+TOKEN_BUDGET_PER_USER = int(os.getenv("TOKEN_BUDGET_PER_USER", "0"))  # Gemini tokens per persona before degrading (0 = unlimited)
+TOKEN_BUDGET_PER_BATCH = int(os.getenv("TOKEN_BUDGET_PER_BATCH", "0"))  # Gemini tokens per CLI run before degrading (0 = unlimited)
 
 # Scraping Configuration
 MAX_POSTS = None if os.getenv("MAX_POSTS") == "None" else int(os.getenv("MAX_POSTS", "1000"))  # High default limit
 MAX_COMMENTS = None if os.getenv("MAX_COMMENTS") == "None" else int(os.getenv("MAX_COMMENTS", "2000"))  # High default limit
-REQUEST_DELAY = float(os.getenv("REQUEST_DELAY", "0.5"))  # Reduced delay
+REQUEST_DELAY = float(os.getenv("REQUEST_DELAY", "0.5"))  # Minimum delay between Reddit HTTP requests
+SCRAPE_STREAMING = os.getenv("SCRAPE_STREAMING", "false").lower() == "true"  # Stream activity instead of collecting full lists
+
+# Cache Configuration
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+ACTIVITY_CACHE_ENABLED = os.getenv("ACTIVITY_CACHE_ENABLED", "true").lower() == "true"
+ACTIVITY_CACHE_PATH = os.path.join(CACHE_DIR, "activity.db")
+ACTIVITY_CACHE_TTL = float(os.getenv("ACTIVITY_CACHE_TTL", str(7 * 24 * 3600)))  # Seconds before a user's cache is discarded
+ACTIVITY_CACHE_MAX_ITEMS = int(os.getenv("ACTIVITY_CACHE_MAX_ITEMS", "500000"))  # Evict oldest users beyond this
+ACTIVITY_REFRESH_OVERLAP = float(os.getenv("ACTIVITY_REFRESH_OVERLAP", str(24 * 3600)))  # Seconds of cached activity re-fetched on refresh
+PERSONA_STORE_ENABLED = os.getenv("PERSONA_STORE_ENABLED", "true").lower() == "true"  # Keep each user's latest persona result
+PERSONA_STORE_PATH = os.path.join(CACHE_DIR, "personas.db")
+PERSONA_FRESH_SECONDS = float(os.getenv("PERSONA_FRESH_SECONDS", str(24 * 3600)))  # Seconds a stored persona is served without a refresh
+PERSONA_INCOMPLETE_FRESH_SECONDS = float(os.getenv("PERSONA_INCOMPLETE_FRESH_SECONDS", "3600"))  # Same, for personas with repaired or missing sections
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "tiered")  # "memory", "disk", "tiered" or "none"
+RESPONSE_CACHE_DIR = os.path.join(CACHE_DIR, "responses")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))  # In-memory LRU size
 
 # Output Configuration
 OUTPUT_DIR = "personas"
 CITATION_LIMIT = 5  # Maximum citations per characteristic
+CITATION_MODE = os.getenv("CITATION_MODE", "batch")  # "batch" (one call per persona) or "individual"
+CITATION_CONCURRENCY = int(os.getenv("CITATION_CONCURRENCY", "4"))  # Parallel per-characteristic citation calls
+CITATION_RETRIEVAL = os.getenv("CITATION_RETRIEVAL", "llm")  # "llm" (model picks from local candidates) or "local" (cite top hits directly)
+CITATION_CANDIDATES = int(os.getenv("CITATION_CANDIDATES", "6"))  # Locally retrieved candidates per characteristic
+
+# Web App Configuration
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # Background persona generation workers
+REDDIT_CLIENT_POOL_SIZE = int(os.getenv("REDDIT_CLIENT_POOL_SIZE", "4"))  # Reusable Reddit clients per process
+JOB_QUEUE_DURABLE = os.getenv("JOB_QUEUE_DURABLE", "false").lower() == "true"  # Persist jobs to SQLite
+JOB_STORE_PATH = os.path.join(CACHE_DIR, "jobs.db")
+
+# Batch CLI Configuration
+BATCH_SCRAPE_WORKERS = int(os.getenv("BATCH_SCRAPE_WORKERS", "4"))  # Users scraped concurrently
+BATCH_LLM_WORKERS = int(os.getenv("BATCH_LLM_WORKERS", "2"))  # Users in persona generation concurrently
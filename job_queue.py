@@ -0,0 +1,259 @@
+"""Background job queue for persona generation requests."""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Iterator, List, Optional
+
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+ACTIVE_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+
+
+class Job:
+    """A single persona generation job."""
+    
+    def __init__(self, job_id: str, username: str, status: str = JOB_QUEUED,
+                 result: Optional[Dict[str, Any]] = None, error: Optional[str] = None,
+                 created_at: Optional[float] = None, updated_at: Optional[float] = None):
+        """Create a job record."""
+        self.id = job_id
+        self.username = username
+        self.status = status
+        self.result = result
+        self.error = error
+        self.created_at = created_at or time.time()
+        self.updated_at = updated_at or self.created_at
+        self.events: List[Dict[str, Any]] = []
+        self.events_dropped = 0  # Progress events released when the job finished
+        self.events_changed = threading.Condition()
+    
+    def emit(self, event: str, data: Dict[str, Any]) -> None:
+        """Append a progress event and wake up anyone streaming this job."""
+        with self.events_changed:
+            self.events.append({'event': event, 'data': data})
+            self.events_changed.notify_all()
+    
+    def finish_events(self, event: str, data: Dict[str, Any]) -> None:
+        """Emit the final event, releasing the progress events before it.
+        
+        Finished jobs stay in memory for status lookups, so only the final
+        event, which carries the result or error, is kept. Streams that had not
+        caught up skip straight to it.
+        """
+        with self.events_changed:
+            self.events_dropped += len(self.events)
+            self.events = [{'event': event, 'data': data}]
+            self.events_changed.notify_all()
+    
+    def wait_for_events(self, start: int, timeout: float) -> List[Dict[str, Any]]:
+        """Return events from index `start`, waiting up to `timeout` seconds for new ones."""
+        with self.events_changed:
+            self.events_changed.wait_for(lambda: self.events_dropped + len(self.events) > start, timeout)
+            return self.events[max(0, start - self.events_dropped):]
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the job for API responses."""
+        return {
+            'job_id': self.id,
+            'username': self.username,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
+
+
+class JobStore:
+    """SQLite persistence for jobs so queued work survives a restart."""
+    
+    def __init__(self, path: str):
+        """Open (and create if needed) the job database at `path`."""
+        self.path = path
+        self.lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    username TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+    
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Yield a connection that commits on success and is always closed."""
+        with self.lock:
+            conn = sqlite3.connect(self.path, timeout=30)
+            try:
+                with conn:
+                    yield conn
+            finally:
+                conn.close()
+    
+    def save(self, job: Job) -> None:
+        """Insert or update a job."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, username, status, result, error, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.username, job.status, json.dumps(job.result) if job.result is not None else None,
+                 job.error, job.created_at, job.updated_at)
+            )
+    
+    def get(self, job_id: str) -> Optional[Job]:
+        """Load a job by id."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, username, status, result, error, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+    
+    def load_unfinished(self) -> List[Job]:
+        """Load jobs that were queued or running when the process stopped."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, username, status, result, error, created_at, updated_at FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                ACTIVE_STATUSES
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+    
+    @staticmethod
+    def _row_to_job(row: tuple) -> Job:
+        """Convert a database row into a Job."""
+        job_id, username, status, result, error, created_at, updated_at = row
+        return Job(job_id, username, status, json.loads(result) if result else None, error, created_at, updated_at)
+
+
+class JobQueue:
+    """In-process job queue served by a pool of background worker threads.
+    
+    Submitting a username that already has a queued or running job returns
+    that job instead of starting a duplicate pipeline. With a `store_path`,
+    jobs are persisted to SQLite and unfinished ones are resumed on start.
+    """
+    
+    def __init__(self, handler: Callable[[Job], Dict[str, Any]], workers: int = 2,
+                 store_path: Optional[str] = None, history_limit: int = 1000):
+        """Create a queue whose workers run `handler(job)` and store its return value."""
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.store = JobStore(store_path) if store_path else None
+        self.history_limit = history_limit
+        self.queue: "queue.Queue[Job]" = queue.Queue()
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.active_by_username: Dict[str, Job] = {}
+        self.lock = threading.Lock()
+        self.started = False
+    
+    def start(self) -> None:
+        """Start worker threads and resume unfinished durable jobs. Safe to call repeatedly."""
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+            
+            if self.store:
+                for job in self.store.load_unfinished():
+                    job.status = JOB_QUEUED
+                    self._track(job)
+                    self.queue.put(job)
+                    logging.info(f"Resumed job {job.id} for {job.username}")
+        
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"persona-worker-{i}", daemon=True).start()
+    
+    def submit(self, username: str) -> Job:
+        """Queue a job for `username`, coalescing onto an active job for the same user."""
+        self.start()
+        key = username.lower()
+        
+        with self.lock:
+            active = self.active_by_username.get(key)
+            if active and active.status in ACTIVE_STATUSES:
+                logging.info(f"Coalescing request for {username} onto job {active.id}")
+                return active
+            
+            job = Job(uuid.uuid4().hex, username)
+            self._track(job)
+        
+        self._save(job)
+        self.queue.put(job)
+        return job
+    
+    def get(self, job_id: str) -> Optional[Job]:
+        """Look up a job by id, falling back to the durable store."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None and self.store:
+            job = self.store.get(job_id)
+        return job
+    
+    def _track(self, job: Job) -> None:
+        """Register a job in memory, pruning the oldest finished jobs. Caller holds the lock."""
+        self.jobs[job.id] = job
+        self.active_by_username[job.username.lower()] = job
+        
+        finished = [job_id for job_id, tracked in self.jobs.items() if tracked.status not in ACTIVE_STATUSES]
+        for job_id in finished[:max(0, len(self.jobs) - self.history_limit)]:
+            del self.jobs[job_id]
+    
+    def _save(self, job: Job) -> None:
+        """Persist a job when running in durable mode."""
+        if self.store:
+            self.store.save(job)
+    
+    def _set_status(self, job: Job, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        """Update a job's status and persist it."""
+        with self.lock:
+            job.status = status
+            job.result = result
+            job.error = error
+            job.updated_at = time.time()
+            if status not in ACTIVE_STATUSES and self.active_by_username.get(job.username.lower()) is job:
+                del self.active_by_username[job.username.lower()]
+        self._save(job)
+        
+        if status == JOB_DONE:
+            job.finish_events('done', result)
+        elif status == JOB_FAILED:
+            job.finish_events('failed', {'error': error})
+        else:
+            job.emit('status', {'status': status})
+    
+    def _work(self) -> None:
+        """Worker loop: run queued jobs until the process exits."""
+        while True:
+            job = self.queue.get()
+            self._set_status(job, JOB_RUNNING)
+            try:
+                result = self.handler(job)
+                self._set_status(job, JOB_DONE, result=result)
+            except Exception as e:
+                logging.error(f"Job {job.id} for {job.username} failed: {e}")
+                logging.error(traceback.format_exc())
+                self._set_status(job, JOB_FAILED, error=str(e))
+            finally:
+                self.queue.task_done()
@@ -0,0 +1,208 @@
+"""Incremental parsing and structural repair of streamed JSON objects."""
+
+import json
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+
+LITERAL_PATTERN = re.compile(r'-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null')
+PARTIAL_ESCAPE_PATTERN = re.compile(r'\\u[0-9a-fA-F]{0,3}$')
+
+
+class IncrementalObjectParser:
+    """Parses a JSON object as it streams in, yielding each top-level member once its value closes.
+    
+    Text before the opening brace (such as a markdown code fence) is skipped.
+    Only one pass is made over the input no matter how it is chunked. Call
+    `finish()` at the end of the stream to recover a value cut off mid-way.
+    """
+    
+    def __init__(self):
+        """Create a parser waiting for the opening brace."""
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.started = False
+        self.complete = False
+        self.state = 'key'  # What the top-level object expects next: key, colon, value or comma
+        self.key_start: Optional[int] = None
+        self.key: Optional[str] = None
+        self.value_start: Optional[int] = None
+        self.members: Dict[str, Any] = {}
+    
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """Add streamed text and return the top-level members it completed."""
+        self.buffer += text
+        completed = []
+        buffer = self.buffer
+        
+        while self.pos < len(buffer) and not self.complete:
+            ch = buffer[self.pos]
+            
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.state == 'key':
+                        self.key = json.loads(buffer[self.key_start:self.pos + 1])
+                        self.state = 'colon'
+                    elif self.depth == 1 and self.state == 'value':
+                        self._complete(self.pos + 1, completed)
+            elif not self.started:
+                if ch == '{':
+                    self.started = True
+                    self.depth = 1
+            elif ch == '"':
+                self.in_string = True
+                if self.depth == 1 and self.state == 'key':
+                    self.key_start = self.pos
+                elif self.depth == 1 and self.state == 'value':
+                    self.value_start = self.pos
+            elif ch in '{[':
+                if self.depth == 1 and self.state == 'value':
+                    self.value_start = self.pos
+                self.depth += 1
+            elif ch in '}]':
+                self.depth -= 1
+                if self.depth == 1 and self.value_start is not None:
+                    self._complete(self.pos + 1, completed)
+                elif self.depth == 0:
+                    # Closing the object also ends a number or literal value
+                    if self.value_start is not None:
+                        self._complete(self.pos, completed)
+                    self.complete = True
+            elif self.depth == 1:
+                if ch == ':':
+                    self.state = 'value'
+                elif ch == ',':
+                    if self.value_start is not None:
+                        self._complete(self.pos, completed)
+                    self.state = 'key'
+                elif not ch.isspace() and self.state == 'value' and self.value_start is None:
+                    self.value_start = self.pos
+            
+            self.pos += 1
+        
+        return completed
+    
+    def _complete(self, end: int, completed: List[Tuple[str, Any]]) -> None:
+        """Decode the current member's value, which ends before `end`."""
+        raw_value = self.buffer[self.value_start:end].strip()
+        self.value_start = None
+        self.state = 'comma'
+        try:
+            value = json.loads(raw_value)
+        except ValueError:
+            return
+        self.members[self.key] = value
+        completed.append((self.key, value))
+    
+    def finish(self) -> Tuple[Dict[str, Any], Optional[str]]:
+        """Return every member, repairing a value cut off by the end of the stream.
+        
+        The second element names the member whose value was repaired, if any.
+        """
+        if self.complete or self.value_start is None or self.key is None:
+            return dict(self.members), None
+        
+        try:
+            value = json.loads(repair_json(self.buffer[self.value_start:]))
+        except ValueError:
+            return dict(self.members), None
+        return {**self.members, self.key: value}, self.key
+
+
+def repair_json(text: str) -> str:
+    """Close a truncated JSON document so it parses.
+    
+    Every complete value is kept, as is a string value cut off mid-way; a
+    dangling key, trailing comma or partial number or literal is dropped, and
+    the open containers are closed in order.
+    """
+    closers: List[str] = []  # Closing brackets of the open containers, innermost last
+    states: List[str] = []  # What each open container expects next: key, colon, value or comma
+    safe_end, safe_suffix = 0, ""
+    
+    starts = [index for index in (text.find('{'), text.find('[')) if index >= 0]
+    i = min(starts) if starts else len(text)
+    text_end = len(text)
+    
+    def complete_value(end: int) -> Tuple[int, str]:
+        if states:
+            states[-1] = 'comma'
+        return end, "".join(reversed(closers))
+    
+    while i < text_end:
+        ch = text[i]
+        if ch.isspace():
+            i += 1
+            continue
+        
+        expecting = states[-1] if states else 'value'
+        if ch == '"':
+            end = _string_end(text, i)
+            if end is None:
+                if expecting != 'value':
+                    break
+                # Keep a cut-off string value, minus any half-written escape
+                body = PARTIAL_ESCAPE_PATTERN.sub('', text[i:])
+                if (len(body) - len(body.rstrip('\\'))) % 2:
+                    body = body[:-1]
+                return text[:i] + body + '"' + "".join(reversed(closers))
+            if expecting == 'key':
+                states[-1] = 'colon'
+            elif expecting == 'value':
+                safe_end, safe_suffix = complete_value(end)
+            else:
+                break
+            i = end
+        elif ch in '{[':
+            if expecting != 'value':
+                break
+            closers.append('}' if ch == '{' else ']')
+            states.append('key' if ch == '{' else 'value')
+            i += 1
+            safe_end, safe_suffix = i, "".join(reversed(closers))
+        elif ch in '}]':
+            if not closers or closers[-1] != ch:
+                break
+            closers.pop()
+            states.pop()
+            i += 1
+            safe_end, safe_suffix = complete_value(i)
+            if not closers:
+                break
+        elif ch == ':' and expecting == 'colon':
+            states[-1] = 'value'
+            i += 1
+        elif ch == ',' and expecting == 'comma':
+            states[-1] = 'key' if closers[-1] == '}' else 'value'
+            i += 1
+        else:
+            match = LITERAL_PATTERN.match(text, i)
+            # A number or literal running into the end of the text may itself be truncated
+            if expecting != 'value' or match is None or match.end() >= text_end:
+                break
+            i = match.end()
+            safe_end, safe_suffix = complete_value(i)
+    
+    return text[:safe_end] + safe_suffix
+
+
+def _string_end(text: str, start: int) -> Optional[int]:
+    """Return the index just past the string opening at `start`, or None if it is unterminated."""
+    i = start + 1
+    while i < len(text):
+        ch = text[i]
+        if ch == '\\':
+            i += 2
+            continue
+        if ch == '"':
+            return i + 1
+        i += 1
+    return None
@@ -0,0 +1,179 @@
+"""Process-wide timing spans and counters, exported as Prometheus text or a JSON summary."""
+
+import bisect
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Iterator, List, Tuple
+
+
+# Histogram bucket upper bounds in seconds, from single HTTP requests to whole persona runs
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+METRIC_PREFIX = "persona_"
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    """Bucketed durations for one span and label set."""
+    
+    __slots__ = ('buckets', 'count', 'total', 'max')
+    
+    def __init__(self):
+        """Create an empty histogram."""
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+    
+    def observe(self, seconds: float) -> None:
+        """Record one duration."""
+        index = bisect.bisect_left(DURATION_BUCKETS, seconds)
+        if index < len(self.buckets):
+            self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+class MetricsRegistry:
+    """Thread-safe store of counters and span duration histograms.
+    
+    Spans and counters are identified by a name plus keyword labels, e.g.
+    `span('gemini_call', model='gemini-2.0-flash')`. Keep label values to a
+    small fixed set (models, endpoints, stages), never usernames or ids.
+    """
+    
+    def __init__(self):
+        """Create an empty registry."""
+        self.counters: Dict[Tuple[str, LabelSet], float] = {}
+        self.histograms: Dict[Tuple[str, LabelSet], _Histogram] = {}
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> Tuple[str, LabelSet]:
+        """Build a hashable key from a metric name and its labels."""
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+    
+    def increment(self, name: str, amount: float = 1, **labels) -> None:
+        """Add `amount` to a counter."""
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+    
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        """Record a span duration."""
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = _Histogram()
+            histogram.observe(seconds)
+    
+    @contextmanager
+    def span(self, name: str, **labels) -> Iterator[None]:
+        """Time the enclosed block, recording it even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe(name, seconds, **labels)
+            logging.debug(f"Span {_format_key(name, labels)} took {seconds:.3f}s")
+    
+    def reset(self) -> None:
+        """Drop every recorded value."""
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+    
+    def summary(self) -> Dict[str, Any]:
+        """Return spans and counters as a JSON-serializable summary."""
+        with self.lock:
+            spans = {
+                _format_key(name, dict(labels)): {
+                    'count': histogram.count,
+                    'total_seconds': round(histogram.total, 4),
+                    'mean_seconds': round(histogram.total / histogram.count, 4),
+                    'max_seconds': round(histogram.max, 4)
+                }
+                for (name, labels), histogram in sorted(self.histograms.items())
+            }
+            counters = {
+                _format_key(name, dict(labels)): value
+                for (name, labels), value in sorted(self.counters.items())
+            }
+        return {'spans': spans, 'counters': counters}
+    
+    def render_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(h.buckets), h.count, h.total)) for key, h in self.histograms.items())
+        
+        family = None
+        for (name, labels), value in counters:
+            metric = f"{METRIC_PREFIX}{name}_total"
+            if metric != family:
+                family = metric
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_format_labels(labels)} {_format_value(value)}")
+        
+        metric = f"{METRIC_PREFIX}span_duration_seconds"
+        if histograms:
+            lines.append(f"# HELP {metric} Duration of instrumented pipeline spans.")
+            lines.append(f"# TYPE {metric} histogram")
+        for (name, labels), (buckets, count, total) in histograms:
+            span_labels = (('span', name),) + labels
+            cumulative = 0
+            for bound, bucket_count in zip(DURATION_BUCKETS, buckets):
+                cumulative += bucket_count
+                lines.append(f"{metric}_bucket{_format_labels(span_labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{metric}_bucket{_format_labels(span_labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{metric}_sum{_format_labels(span_labels)} {total:.6f}")
+            lines.append(f"{metric}_count{_format_labels(span_labels)} {count}")
+        
+        return "\n".join(lines) + "\n"
+
+
+def _format_key(name: str, labels: Dict[str, Any]) -> str:
+    """Render a metric name and labels as `name{key=value,...}`."""
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{key}={value}" for key, value in sorted(labels.items())) + "}"
+
+
+def _format_labels(labels: LabelSet) -> str:
+    """Render Prometheus labels, escaping values."""
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for key, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    """Render counters without a trailing .0 for whole numbers."""
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+# Process-wide registry shared by the scraper, analyzer, web app and CLI
+registry = MetricsRegistry()
+span = registry.span
+increment = registry.increment
+
+
+def timed(name: str, **labels) -> Callable[[Callable], Callable]:
+    """Decorate a function so every call is recorded as a span."""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with registry.span(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
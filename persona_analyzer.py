@@ -2,16 +2,68 @@
 
 import json
 import logging
-from typing import Dict, List, Any, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterable, List, Any, Optional, Tuple
 from google import genai
 from google.genai import types
 import os
 from pydantic import BaseModel, Field
 
-from config import CITATION_LIMIT
+from activity_store import ActivityStore
+from behavior_analytics import ensure_behavior_analytics
+from config import (CITATION_LIMIT, CITATION_MODE, CITATION_CONCURRENCY, GEMINI_REQUESTS_PER_MINUTE, PROMPT_TOKEN_BUDGET,
+                    GEMINI_MAX_ATTEMPTS, GEMINI_BACKOFF_BASE, GEMINI_BACKOFF_MAX, GEMINI_CALL_DEADLINE,
+                    GEMINI_HEDGE, GEMINI_HEDGE_PERCENTILE, GEMINI_BREAKER_THRESHOLD, GEMINI_BREAKER_COOLDOWN,
+                    PERSONA_MODE, MAP_REDUCE_THRESHOLD, MAP_CHUNK_TOKENS, MAP_CONCURRENCY,
+                    PERSONA_GENERATION, SECTION_CONCURRENCY, SECTION_RETRIES,
+                    CITATION_RETRIEVAL, CITATION_CANDIDATES, TOKEN_BUDGET_PER_USER)
+from json_stream import IncrementalObjectParser, repair_json
+from metrics import increment, registry, span, timed
+from prompt_builder import ActivityChunk, PromptBuilder, chunk_activity, estimate_tokens, format_profile_summary
+from rate_limiter import TokenBucket
+from resilience import CircuitBreaker, ResilientCaller
+from response_cache import ResponseCache, get_default_response_cache
+from retrieval import CitationIndex
+from usage import UsageTracker
 from utils import format_citation, truncate_text
 
 
+# Output caps per call, also used to reserve token budget before each stage
+MAP_OUTPUT_TOKENS = 1500
+PERSONA_OUTPUT_TOKENS = 8000
+BATCH_CITATION_OUTPUT_TOKENS = 4000
+CITATION_OUTPUT_TOKENS = 500
+PROMPT_OVERHEAD_TOKENS = 1000  # System prompt and profile header sent with every persona or map call
+CITATION_RESERVE_TOKENS = 6000  # Left for citations when sizing the persona prompt under a token budget
+MIN_PROMPT_TOKENS = 1000  # Smallest activity budget a persona prompt is shrunk to
+# Per-section output caps in "sections" mode, sized by field count to add up to about the single call's cap
+SECTION_OUTPUT_TOKENS = {
+    'demographics': 1500,
+    'behavior_habits': 1500,
+    'motivations': 1200,
+    'personality': 1500,
+    'goals_needs': 1200,
+    'frustrations': 1200
+}
+UNAVAILABLE = "Unable to determine from available data"  # Placeholder for persona fields with no analysis
+
+
+class PersonaSections(dict):
+    """A generated persona keyed by section name, noting which sections are incomplete.
+    
+    `incomplete` lists the sections that were structurally repaired after
+    being cut off or that hold placeholders because they never arrived or
+    could not be parsed.
+    """
+    
+    def __init__(self, sections: Dict[str, Dict[str, Any]], incomplete: Iterable[str] = ()):
+        """Wrap merged persona sections."""
+        super().__init__(sections)
+        self.incomplete = list(incomplete)
+
+
 class Demographics(BaseModel):
     """Demographics section of persona analysis."""
     age_estimate: str = Field(description="Age estimate with reasoning")
@@ -67,18 +119,64 @@ class PersonaAnalysis(BaseModel):
     frustrations: Frustrations
 
 
+class ChunkEvidence(BaseModel):
+    """Evidence extracted from one chronological chunk of activity in map-reduce mode."""
+    topics: List[str] = Field(description="Main subjects and communities discussed")
+    demographic_clues: List[str] = Field(description="Clues about age, occupation, location and lifestyle")
+    behavior: List[str] = Field(description="Observations about posting habits and interaction style")
+    motivations_interests: List[str] = Field(description="Values, drivers and interests shown")
+    personality_signals: List[str] = Field(description="Signals about personality and communication style")
+    goals_needs: List[str] = Field(description="Goals and information or social needs expressed")
+    frustrations: List[str] = Field(description="Frustrations, pain points and challenges mentioned")
+    notable_quotes: List[str] = Field(description="A few short verbatim quotes that best characterize the user")
+
+
 class CitationResponse(BaseModel):
     """Citation response structure."""
     relevant_ids: List[str] = Field(description="List of relevant post/comment IDs")
 
 
+class CharacteristicCitation(BaseModel):
+    """Citation IDs for a single persona characteristic."""
+    characteristic: str = Field(description="Characteristic key in 'section.characteristic' form")
+    relevant_ids: List[str] = Field(description="List of relevant post/comment IDs")
+
+
+class BatchCitationResponse(BaseModel):
+    """Batched citation response covering every persona characteristic."""
+    citations: List[CharacteristicCitation] = Field(description="Citation IDs for each characteristic")
+
+
 class PersonaAnalyzer:
     """Handles AI analysis of Reddit data to generate user personas."""
     
-    def __init__(self):
-        """Initialize Gemini client."""
-        self.client = None
-        self.setup_gemini_client()
+    def __init__(self, response_cache: Optional[ResponseCache] = None, client: Optional[Any] = None,
+                 usage: Optional[UsageTracker] = None, caller: Optional[ResilientCaller] = None):
+        """Initialize Gemini client, defaulting to the process-wide response cache.
+        
+        Pass a `client` exposing `models.generate_content` to use it instead of
+        a Gemini client built from GEMINI_API_KEY, e.g. to replay responses.
+        Token usage is recorded in `usage`, which defaults to a tracker with
+        only the per-user budget. Every Gemini request goes through `caller`,
+        which defaults to retries, hedging and a circuit breaker as configured.
+        """
+        self.client = client
+        self.response_cache = response_cache or get_default_response_cache()
+        self.usage = usage or UsageTracker(user_budget=TOKEN_BUDGET_PER_USER)
+        self.caller = caller or ResilientCaller(
+            max_attempts=GEMINI_MAX_ATTEMPTS,
+            backoff_base=GEMINI_BACKOFF_BASE,
+            backoff_max=GEMINI_BACKOFF_MAX,
+            deadline=GEMINI_CALL_DEADLINE,
+            hedge=GEMINI_HEDGE,
+            hedge_percentile=GEMINI_HEDGE_PERCENTILE,
+            breaker=CircuitBreaker(GEMINI_BREAKER_THRESHOLD, GEMINI_BREAKER_COOLDOWN)
+        )
+        self.rate_limiter = TokenBucket.per_minute(GEMINI_REQUESTS_PER_MINUTE,
+                                                   burst=max(CITATION_CONCURRENCY, SECTION_CONCURRENCY))
+        self.prompt_builder = PromptBuilder(PROMPT_TOKEN_BUDGET)
+        if self.client is None:
+            self.setup_gemini_client()
     
     def setup_gemini_client(self) -> None:
         """Set up Gemini API client."""
@@ -89,61 +187,206 @@ class PersonaAnalyzer:
             )
         
         try:
-            self.client = genai.Client(api_key=gemini_api_key)
+            http_options = None
+            if GEMINI_CALL_DEADLINE:
+                # Bound each HTTP request so a hung connection cannot outlive the call deadline
+                http_options = types.HttpOptions(timeout=int(GEMINI_CALL_DEADLINE * 1000))
+            self.client = genai.Client(api_key=gemini_api_key, http_options=http_options)
         except Exception as e:
             logging.error(f"Failed to initialize Gemini client: {e}")
             raise
     
-    def prepare_analysis_data(self, reddit_data: Dict[str, Any]) -> str:
-        """Prepare Reddit data for AI analysis."""
-        profile = reddit_data['profile']
-        posts = reddit_data['posts']
-        comments = reddit_data['comments']
-        stats = reddit_data['statistics']
-        
-        # Create summary text for analysis
-        analysis_text = f"""
-USER PROFILE SUMMARY:
-Username: {profile['username']}
-Account Age: {profile['account_age_days']:.0f} days
-Comment Karma: {profile['comment_karma']}
-Link Karma: {profile['link_karma']}
-Total Posts: {stats['total_posts']}
-Total Comments: {stats['total_comments']}
-
-TOP SUBREDDITS:
-{chr(10).join([f"r/{subreddit}: {count} activities" for subreddit, count in stats['top_subreddits']])}
-
-RECENT POSTS:
+    def _generate_content(self, model: str, prompt: str, config: types.GenerateContentConfig,
+                          stage: str, username: Optional[str] = None,
+                          on_text: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """Send a single-turn prompt to Gemini and return the response text.
+        
+        Responses are served from the response cache when possible; fresh
+        responses are cached only if they validate against the response schema.
+        Token usage is recorded against `username` and `stage`. With `on_text`,
+        the response is streamed and each text chunk is passed to it as it
+        arrives (a cached response arrives as one chunk). Transient failures
+        are retried by `self.caller`; streamed calls are only retried until
+        their first chunk arrives, after which an interrupted stream returns
+        the text received so far.
+        """
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = ResponseCache.make_key(model, prompt, config)
+            cached_text = self.response_cache.get(cache_key)
+            if cached_text is not None:
+                increment('response_cache_hits', model=model)
+                self.usage.record_cache_hit(username, stage)
+                logging.info(f"Response cache hit for {model} ({self.response_cache.stats()})")
+                if on_text:
+                    on_text(cached_text)
+                return cached_text
+            increment('response_cache_misses', model=model)
+        
+        contents = [types.Content(role="user", parts=[types.Part(text=prompt)])]
+        deadline_at = time.monotonic() + GEMINI_CALL_DEADLINE if GEMINI_CALL_DEADLINE else None
+        
+        def request() -> Any:
+            # Each attempt, retry or hedge takes its own slot in the request quota
+            self.rate_limiter.acquire()
+            increment('gemini_requests', model=model)
+            if on_text:
+                return self._stream_content(model, contents, config, on_text, deadline_at)
+            return self.client.models.generate_content(model=model, contents=contents, config=config)
+        
+        try:
+            with span('gemini_call', model=model):
+                response = self.caller.call(request, (model, stage), streaming=on_text is not None)
+        except Exception:
+            increment('gemini_errors', model=model)
+            raise
+        self._record_token_usage(model, response, f"{config.system_instruction or ''}\n{prompt}", stage, username)
+        
+        if cache_key is not None and response.text is not None and self._matches_schema(response.text, config):
+            self.response_cache.set(cache_key, response.text)
+        return response.text
+    
+    def _stream_content(self, model: str, contents: List[types.Content], config: types.GenerateContentConfig,
+                        on_text: Callable[[str], None], deadline_at: Optional[float] = None) -> SimpleNamespace:
+        """Stream a response, passing each text chunk to `on_text`, and return the assembled text and usage.
+        
+        Errors before the first chunk are raised so the call can be retried.
+        Once text has been passed on, a failure or the deadline ends the stream
+        early and the partial text is returned for repair.
+        """
+        parts = []
+        usage_metadata = None
+        try:
+            for chunk in self.client.models.generate_content_stream(model=model, contents=contents, config=config):
+                # Usage is reported cumulatively, so the last chunk carrying it has the totals
+                if chunk.usage_metadata is not None:
+                    usage_metadata = chunk.usage_metadata
+                if chunk.text:
+                    parts.append(chunk.text)
+                    on_text(chunk.text)
+                if deadline_at is not None and time.monotonic() >= deadline_at:
+                    logging.warning(f"Gemini stream for {model} passed its deadline; keeping the partial response")
+                    increment('gemini_stream_interruptions', model=model, reason='deadline')
+                    break
+        except Exception as e:
+            if not parts:
+                raise
+            logging.warning(f"Gemini stream for {model} was interrupted ({e}); keeping the partial response")
+            increment('gemini_stream_interruptions', model=model, reason='error')
+        return SimpleNamespace(text="".join(parts) if parts else None, usage_metadata=usage_metadata)
+    
+    def _record_token_usage(self, model: str, response: Any, prompt: str, stage: str, username: Optional[str]) -> None:
+        """Record the tokens a response used in the usage tracker and metrics."""
+        counts = self.usage.record_response(username, stage, response, prompt)
+        increment('gemini_tokens', counts['prompt'], model=model, direction='input')
+        increment('gemini_tokens', counts['output'] + counts['thoughts'], model=model, direction='output')
+    
+    def _matches_schema(self, text: str, config: types.GenerateContentConfig) -> bool:
+        """Check whether response text validates against the requested schema."""
+        schema = config.response_schema
+        if not (isinstance(schema, type) and issubclass(schema, BaseModel)):
+            return True
+        try:
+            schema.model_validate_json(self._strip_code_fences(text))
+            return True
+        except Exception:
+            return False
+    
+    @timed('prompt_build')
+    def prepare_analysis_data(self, reddit_data: Dict[str, Any], token_budget: Optional[int] = None) -> str:
+        """Prepare Reddit data for AI analysis within the prompt token budget."""
+        built = self.prompt_builder.build(reddit_data, token_budget)
+        logging.info(
+            f"Analysis prompt uses ~{built.tokens_used}/{built.token_budget} tokens "
+            f"({built.posts_included} posts, {built.comments_included} comments)"
+        )
+        return built.text
+    
+    def use_map_reduce(self, reddit_data: Dict[str, Any]) -> bool:
+        """Decide whether a history is large enough for map-reduce analysis."""
+        if PERSONA_MODE == "auto":
+            return len(reddit_data['posts']) + len(reddit_data['comments']) > MAP_REDUCE_THRESHOLD
+        return PERSONA_MODE == "map_reduce"
+    
+    @timed('map_reduce')
+    def prepare_map_reduce_data(self, reddit_data: Dict[str, Any]) -> str:
+        """Summarize the full history chunk by chunk and combine the evidence for the reduce step.
+        
+        Chunks are mapped concurrently. Each map prompt is derived only from its
+        chunk's text, so the response cache keys by chunk content and a refresh
+        re-maps only chunks that contain new activity.
+        """
+        username = reddit_data['profile']['username']
+        chunks = chunk_activity(reddit_data['posts'], reddit_data['comments'], MAP_CHUNK_TOKENS)
+        logging.info(f"Mapping {len(chunks)} activity chunks for {username}")
+        
+        with ThreadPoolExecutor(max_workers=MAP_CONCURRENCY) as executor:
+            evidence = list(executor.map(lambda chunk: self._map_chunk(chunk, username), chunks))
+        
+        analysis_text = format_profile_summary(reddit_data)
+        analysis_text += (
+            "\nEVIDENCE FROM FULL HISTORY:\n"
+            "Each record below summarizes one chronological slice of the user's activity, oldest first.\n"
+        )
+        parts = [analysis_text]
+        for i, (chunk, chunk_evidence) in enumerate(zip(chunks, evidence)):
+            if chunk_evidence is None:
+                continue
+            parts.append(
+                f"\nSlice {i+1} ({chunk.first_day} to {chunk.last_day}, {len(chunk.lines)} items):\n"
+                f"{chunk_evidence.model_dump_json()}\n"
+            )
+        return "".join(parts)
+    
+    def _map_chunk(self, chunk: ActivityChunk, username: Optional[str] = None) -> Optional[ChunkEvidence]:
+        """Extract persona evidence from one chunk of activity."""
+        prompt = "REDDIT ACTIVITY:\n" + "\n".join(chunk.lines)
+        system_prompt = """
+You are analyzing one slice of a Reddit user's post and comment history as part of building a user persona.
+Extract concise evidence from this slice only. Each list entry should be a short, specific observation grounded in the activity.
+Leave a list empty when the slice offers no evidence for it. Do not speculate beyond what the activity shows.
 """
         
-        # Add recent posts
-        for i, post in enumerate(posts[:50]):  # Increased for more analysis data
-            analysis_text += f"\nPost {i+1}:\n"
-            analysis_text += f"Title: {post['title']}\n"
-            analysis_text += f"Subreddit: r/{post['subreddit']}\n"
-            analysis_text += f"Score: {post['score']}\n"
-            if post['body']:
-                analysis_text += f"Content: {truncate_text(post['body'], 300)}\n"
-            analysis_text += f"---\n"
-        
-        analysis_text += "\nRECENT COMMENTS:\n"
-        
-        # Add recent comments
-        for i, comment in enumerate(comments[:100]):  # Increased for more analysis data
-            analysis_text += f"\nComment {i+1}:\n"
-            analysis_text += f"Subreddit: r/{comment['subreddit']}\n"
-            analysis_text += f"Score: {comment['score']}\n"
-            if comment.get('parent_title'):
-                analysis_text += f"Post: {comment['parent_title']}\n"
-            analysis_text += f"Content: {truncate_text(comment['body'], 200)}\n"
-            analysis_text += f"---\n"
-        
-        return analysis_text
+        try:
+            raw_response = self._generate_content(
+                model="gemini-2.0-flash",
+                prompt=prompt,
+                config=types.GenerateContentConfig(
+                    system_instruction=system_prompt,
+                    response_mime_type="application/json",
+                    response_schema=ChunkEvidence,
+                    temperature=0.2,
+                    max_output_tokens=MAP_OUTPUT_TOKENS
+                ),
+                stage='map',
+                username=username
+            )
+            if raw_response is None:
+                logging.warning("Received None response for activity chunk")
+                return None
+            return ChunkEvidence.model_validate_json(self._strip_code_fences(raw_response))
+        except Exception as e:
+            logging.warning(f"Failed to map activity chunk: {e}")
+            return None
     
-    def generate_persona(self, reddit_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Generate user persona using AI analysis."""
-        analysis_data = self.prepare_analysis_data(reddit_data)
+    @timed('persona')
+    def generate_persona(self, reddit_data: Dict[str, Any],
+                         on_section: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> PersonaSections:
+        """Generate user persona using AI analysis.
+        
+        The response is streamed; if given, `on_section(section_name, analysis)`
+        is called as each persona section arrives and validates. In "sections"
+        mode each section is generated by its own concurrent call instead. The
+        returned persona's `incomplete` lists sections that were repaired or
+        hold placeholders.
+        """
+        ensure_behavior_analytics(reddit_data)
+        username = reddit_data['profile']['username']
+        use_map_reduce, use_sections, token_budget = self._plan_persona(reddit_data, username)
+        if use_map_reduce:
+            analysis_data = self.prepare_map_reduce_data(reddit_data)
+        else:
+            analysis_data = self.prepare_analysis_data(reddit_data, token_budget)
         
         system_prompt = """
 You are an expert user experience researcher and behavioral psychologist specializing in creating detailed user personas from social media data. 
@@ -187,84 +430,275 @@ Be thorough, analytical, and provide insights that would be valuable for UX desi
 Generate comprehensive, detailed responses - aim for depth and specificity rather than brevity.
 """
         
+        if use_sections:
+            return self._generate_sections(analysis_data, system_prompt, username, on_section)
+        
+        parser = IncrementalObjectParser()
+        sections: Dict[str, Dict[str, Any]] = {}
+        started = time.perf_counter()
+        
+        def on_text(text: str) -> None:
+            # Validate and publish each section as soon as its closing brace streams in
+            for section_name, value in parser.feed(text):
+                section = self._validate_section(section_name, value)
+                if section is None or section_name in sections:
+                    continue
+                if not sections:
+                    registry.observe('persona_first_section', time.perf_counter() - started)
+                sections[section_name] = section
+                if on_section:
+                    on_section(section_name, section)
+        
         try:
             # Note that the newest Gemini model series is "gemini-2.5-flash" or "gemini-2.5-pro"
             # do not change this unless explicitly requested by the user
-            response = self.client.models.generate_content(
+            raw_response = self._generate_content(
                 model="gemini-2.0-flash",
-                contents=[
-                    types.Content(role="user", parts=[types.Part(text=analysis_data)])
-                ],
+                prompt=analysis_data,
                 config=types.GenerateContentConfig(
                     system_instruction=system_prompt,
                     response_mime_type="application/json",
                     response_schema=PersonaAnalysis,
                     temperature=0.7,
-                    max_output_tokens=8000
-                )
+                    max_output_tokens=PERSONA_OUTPUT_TOKENS
+                ),
+                stage='persona',
+                username=username,
+                on_text=on_text
             )
+        except Exception as e:
+            logging.error(f"Failed to generate persona: {e}")
+            raise
+        
+        # Check if response is None
+        if raw_response is None:
+            logging.error("Received None response from Gemini API")
+            return self._create_fallback_persona("No response received from Gemini API")
+        
+        logging.info(f"Raw Gemini response length: {len(raw_response)}")
+        return self._assemble_persona(parser, sections, raw_response)
+    
+    def _validate_section(self, section_name: str, value: Any, fill_missing: bool = False) -> Optional[Dict[str, Any]]:
+        """Validate one streamed persona section against its model, or return None if it doesn't fit.
+        
+        With `fill_missing`, fields absent from a repaired section are filled
+        with the same placeholder the fallback persona uses.
+        """
+        field = PersonaAnalysis.model_fields.get(section_name)
+        if field is None or not isinstance(value, dict):
+            return None
+        if fill_missing:
+            value = {**{name: UNAVAILABLE for name in field.annotation.model_fields}, **value}
+        try:
+            return field.annotation.model_validate(value).model_dump()
+        except Exception as e:
+            logging.warning(f"Invalid persona section {section_name}: {e}")
+            return None
+    
+    def _assemble_persona(self, parser: IncrementalObjectParser, sections: Dict[str, Dict[str, Any]],
+                          raw_response: str) -> PersonaSections:
+        """Build the persona from streamed sections, repairing a truncated tail.
+        
+        Sections that closed during the stream are kept as validated. A section
+        cut off by the end of the response is closed structurally and its
+        missing fields filled; sections that never started get placeholders.
+        """
+        members, repaired_name = parser.finish()
+        repaired = []
+        if repaired_name and repaired_name not in sections:
+            section = self._validate_section(repaired_name, members[repaired_name], fill_missing=True)
+            if section is not None:
+                sections[repaired_name] = section
+                repaired.append(repaired_name)
+                logging.warning(f"Persona response was cut off; repaired the {repaired_name} section")
+        
+        return self._merge_sections(sections, raw_response, repaired)
+    
+    def _merge_sections(self, sections: Dict[str, Dict[str, Any]], raw_response: str,
+                        repaired: List[str]) -> PersonaSections:
+        """Merge validated sections into the persona, with placeholders for any that are missing.
+        
+        `repaired` names the sections that were closed structurally; they and
+        the missing sections are recorded as incomplete.
+        """
+        if not sections:
+            logging.error(f"No persona section could be parsed. Raw response: {raw_response[:1000]}...")
+            return self._create_fallback_persona(raw_response)
+        
+        missing = [name for name in PersonaAnalysis.model_fields if name not in sections]
+        if missing:
+            logging.warning(f"Persona response is missing sections: {', '.join(missing)}")
+        if repaired or missing:
+            increment('persona_repairs')
+        else:
+            logging.info("Successfully parsed structured Gemini response")
+        
+        return PersonaSections(
+            {
+                name: sections.get(name) or {field: UNAVAILABLE for field in model_field.annotation.model_fields}
+                for name, model_field in PersonaAnalysis.model_fields.items()
+            },
+            incomplete=[name for name in PersonaAnalysis.model_fields if name in repaired or name in missing]
+        )
+    
+    def _generate_sections(self, analysis_data: str, system_prompt: str, username: str,
+                           on_section: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> PersonaSections:
+        """Generate every persona section with its own concurrent call and merge the results.
+        
+        All calls share the system prompt and prepared activity, so only the
+        closing request and response schema differ; wall-clock time is about
+        that of the slowest section. A failed or cut-off section is retried on
+        its own.
+        """
+        sections: Dict[str, Dict[str, Any]] = {}
+        repaired = []
+        errors = []
+        started = time.perf_counter()
+        
+        with ThreadPoolExecutor(max_workers=SECTION_CONCURRENCY) as executor:
+            futures = {
+                executor.submit(self._generate_section, section_name, number, analysis_data, system_prompt, username):
+                    section_name
+                for number, section_name in enumerate(PersonaAnalysis.model_fields, 1)
+            }
+            for future in as_completed(futures):
+                section_name = futures[future]
+                try:
+                    section, was_repaired = future.result()
+                except Exception as e:
+                    logging.error(f"Failed to generate persona section {section_name}: {e}")
+                    errors.append(e)
+                    continue
+                if section is None:
+                    continue
+                if was_repaired:
+                    repaired.append(section_name)
+                if not sections:
+                    registry.observe('persona_first_section', time.perf_counter() - started)
+                sections[section_name] = section
+                if on_section:
+                    on_section(section_name, section)
+        
+        if not sections and errors:
+            raise errors[0]
+        return self._merge_sections(sections, "", repaired)
+    
+    def _generate_section(self, section_name: str, number: int, analysis_data: str, system_prompt: str,
+                          username: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Generate one persona section, retrying up to SECTION_RETRIES times.
+        
+        A response that is cut off or fails validation is retried; if the last
+        attempt is still cut off, it is repaired structurally. Returns the
+        section, or None, and whether it was repaired. Raises the last error if
+        every attempt raised.
+        """
+        model = PersonaAnalysis.model_fields[section_name].annotation
+        prompt = (
+            f"{analysis_data}\n\nWrite only section {number} ({section_name}) of the persona, "
+            f"following the instructions for that section."
+        )
+        raw_response = None
+        last_error = None
+        
+        for attempt in range(SECTION_RETRIES + 1):
+            if attempt:
+                increment('persona_section_retries')
+                logging.info(f"Retrying persona section {section_name} (attempt {attempt + 1})")
+            try:
+                raw_response = self._generate_content(
+                    model="gemini-2.0-flash",
+                    prompt=prompt,
+                    config=types.GenerateContentConfig(
+                        system_instruction=system_prompt,
+                        response_mime_type="application/json",
+                        response_schema=model,
+                        temperature=0.7,
+                        max_output_tokens=SECTION_OUTPUT_TOKENS[section_name]
+                    ),
+                    stage='persona',
+                    username=username
+                )
+            except Exception as e:
+                logging.warning(f"Persona section {section_name} failed: {e}")
+                last_error = e
+                continue
             
-            raw_response = response.text
-            
-            # Check if response is None
             if raw_response is None:
-                logging.error("Received None response from Gemini API")
-                return self._create_fallback_persona("No response received from Gemini API")
-            
-            logging.info(f"Raw Gemini response length: {len(raw_response)}")
-            
-            # Parse using Pydantic with structured output
+                logging.warning(f"Received None response for persona section {section_name}")
+                continue
             try:
-                persona_analysis = PersonaAnalysis.model_validate_json(raw_response)
-                logging.info("Successfully parsed structured Gemini response")
-                return persona_analysis.model_dump()
+                return model.model_validate_json(self._strip_code_fences(raw_response)).model_dump(), False
             except Exception as e:
-                logging.warning(f"Pydantic parsing failed: {e}")
-                
-                # Try to fix JSON truncation issues
-                cleaned_response = raw_response.strip()
-                if cleaned_response.startswith('```json'):
-                    cleaned_response = cleaned_response[7:]
-                if cleaned_response.endswith('```'):
-                    cleaned_response = cleaned_response[:-3]
-                cleaned_response = cleaned_response.strip()
-                
-                # Try to fix truncated JSON by adding missing closing braces
-                if not cleaned_response.endswith('}'):
-                    # Count open braces and add corresponding closing braces
-                    open_braces = cleaned_response.count('{')
-                    close_braces = cleaned_response.count('}')
-                    missing_braces = open_braces - close_braces
-                    
-                    if missing_braces > 0:
-                        # Add missing quotes if the string ends abruptly
-                        if cleaned_response.endswith('"') or cleaned_response.endswith("'"):
-                            pass  # Already properly quoted
-                        elif cleaned_response[-1].isalnum():
-                            cleaned_response += '"'
-                        
-                        # Add missing closing braces
-                        cleaned_response += '}' * missing_braces
-                        logging.info(f"Added {missing_braces} missing closing braces")
-                
-                try:
-                    import json as json_module
-                    raw_data = json_module.loads(cleaned_response)
-                    persona_analysis = PersonaAnalysis.model_validate(raw_data)
-                    logging.info("Successfully parsed with fallback JSON parsing")
-                    return persona_analysis.model_dump()
-                except Exception as fallback_error:
-                    logging.error(f"Fallback JSON parsing failed: {fallback_error}")
-                    logging.error(f"Raw response: {raw_response[:1000]}...")
-                    return self._create_fallback_persona(raw_response)
-            
-        except Exception as e:
-            logging.error(f"Failed to generate persona: {e}")
-            raise
+                logging.warning(f"Invalid persona section {section_name}: {e}")
+        
+        if raw_response is not None:
+            try:
+                value = json.loads(repair_json(self._strip_code_fences(raw_response)))
+            except ValueError:
+                return None, False
+            section = self._validate_section(section_name, value, fill_missing=True)
+            if section is not None:
+                logging.warning(f"Persona section {section_name} was cut off; repaired it")
+            return section, section is not None
+        if last_error is not None:
+            raise last_error
+        return None, False
     
-    def _create_fallback_persona(self, raw_response: str) -> Dict[str, Any]:
+    def _plan_persona(self, reddit_data: Dict[str, Any], username: str) -> Tuple[bool, bool, Optional[int]]:
+        """Choose between map-reduce and a single prompt, per-section calls, and the prompt's activity budget.
+        
+        Without a token budget these are just `use_map_reduce`, the configured
+        PERSONA_GENERATION and the default prompt size. Under a budget,
+        per-section calls are dropped first since each resends the whole
+        prompt, then map-reduce when mapping the whole history would not fit,
+        and the single prompt is shrunk so the persona call and citations still
+        fit in what is left.
+        """
+        use_map_reduce = self.use_map_reduce(reddit_data)
+        use_sections = PERSONA_GENERATION == "sections"
+        remaining = self.usage.remaining(username)
+        if remaining is None:
+            return use_map_reduce, use_sections, None
+        
+        map_tokens = reduce_tokens = 0
+        if use_map_reduce:
+            chunks = chunk_activity(reddit_data['posts'], reddit_data['comments'], MAP_CHUNK_TOKENS)
+            map_tokens = sum(estimate_tokens(line) for chunk in chunks for line in chunk.lines)
+            map_tokens += len(chunks) * (PROMPT_OVERHEAD_TOKENS + MAP_OUTPUT_TOKENS)
+            # Every map output is resent in the reduce prompt
+            reduce_tokens = len(chunks) * MAP_OUTPUT_TOKENS
+        
+        if use_sections:
+            prompt_tokens = reduce_tokens if use_map_reduce else self.prompt_builder.token_budget
+            section_tokens = (len(SECTION_OUTPUT_TOKENS) * (PROMPT_OVERHEAD_TOKENS + prompt_tokens)
+                              + sum(SECTION_OUTPUT_TOKENS.values()))
+            needed = map_tokens + section_tokens + CITATION_RESERVE_TOKENS
+            if needed <= remaining:
+                return use_map_reduce, True, None
+            self._degrade(username, f"per-section generation skipped: ~{needed} tokens needed, {remaining} left")
+        
+        available = remaining - PROMPT_OVERHEAD_TOKENS - PERSONA_OUTPUT_TOKENS - CITATION_RESERVE_TOKENS
+        if use_map_reduce:
+            if map_tokens + reduce_tokens <= available:
+                return True, False, None
+            self._degrade(username, f"map-reduce skipped: ~{map_tokens + reduce_tokens} tokens needed, {remaining} left")
+        
+        if available >= self.prompt_builder.token_budget:
+            return False, False, None
+        token_budget = max(MIN_PROMPT_TOKENS, available)
+        self._degrade(username, f"persona prompt shrunk to {token_budget} activity tokens")
+        return False, False, token_budget
+    
+    def _degrade(self, username: Optional[str], message: str) -> None:
+        """Log and record a cutback made to stay within the token budget."""
+        logging.warning(f"Token budget for {username}: {message}")
+        increment('budget_degradations')
+        self.usage.note_degradation(username, message)
+    
+    def _create_fallback_persona(self, raw_response: str) -> PersonaSections:
         """Create a fallback persona when JSON parsing fails."""
         logging.warning("Creating fallback persona due to JSON parsing failure")
+        increment('persona_fallbacks')
         
         # Try to extract some basic info from the raw response
         fallback_text = "Analysis unavailable due to response parsing error"
@@ -275,7 +709,7 @@ Generate comprehensive, detailed responses - aim for depth and specificity rathe
             if text_fragments:
                 fallback_text = " ".join(text_fragments[:3])
         
-        return {
+        return PersonaSections({
             "demographics": {
                 "age_estimate": f"Unable to determine from available data. {fallback_text}",
                 "occupation_guess": "Unable to determine from available data",
@@ -309,98 +743,281 @@ Generate comprehensive, detailed responses - aim for depth and specificity rathe
                 "pain_points": "Unable to determine from available data",
                 "challenges": "Unable to determine from available data"
             }
-        }
+        }, incomplete=PersonaAnalysis.model_fields)
     
-    def generate_citations(self, reddit_data: Dict[str, Any], persona: Dict[str, Any]) -> Dict[str, List[str]]:
-        """Generate citations linking persona characteristics to specific posts/comments."""
+    @timed('citations')
+    def generate_citations(self, reddit_data: Dict[str, Any], persona: Dict[str, Any],
+                           on_section: Optional[Callable[[str, List[str]], None]] = None) -> Dict[str, List[str]]:
+        """Generate citations linking persona characteristics to specific posts/comments.
+        
+        If given, `on_section(section_name, citations)` is called as soon as each
+        section's citations are complete, before the remaining sections finish.
+        """
         posts = reddit_data['posts']
         comments = reddit_data['comments']
+        username = reddit_data['profile']['username']
+        
+        characteristics = [
+            (section_name, characteristic, analysis)
+            for section_name, section_data in persona.items()
+            for characteristic, analysis in section_data.items()
+        ]
+        
+        # Pre-select candidate evidence for every characteristic from the whole history
+        index = CitationIndex(posts, comments)
+        matches = {
+            f"{section_name}.{characteristic}": index.search(f"{characteristic.replace('_', ' ')} {analysis}", CITATION_CANDIDATES)
+            for section_name, characteristic, analysis in characteristics
+        }
+        
+        retrieval = CITATION_RETRIEVAL
+        remaining = self.usage.remaining(username)
+        if retrieval != "local" and remaining is not None:
+            needed = self._estimate_citation_tokens(characteristics, matches)
+            if needed > remaining:
+                self._degrade(username, f"citations chosen locally: ~{needed} tokens needed, {remaining} left")
+                retrieval = "local"
+        
+        if retrieval == "local":
+            # Cite the best local hits directly without asking the model
+            citation_ids = {key: [item['id'] for _, item in key_matches[:3]] for key, key_matches in matches.items()}
+        else:
+            # Characteristics with no matching activity have nothing for the model to choose from
+            citation_ids = {key: [] for key, key_matches in matches.items() if not key_matches}
+            searchable = [c for c in characteristics if f"{c[0]}.{c[1]}" not in citation_ids]
+            if CITATION_MODE == "batch" and searchable:
+                # Resolve as many characteristics as possible with a single batched call
+                candidate_posts, candidate_comments = self._split_matches(
+                    [match for key_matches in matches.values() for match in key_matches]
+                )
+                citation_ids.update(
+                    self._generate_batch_citation_ids(searchable, candidate_posts, candidate_comments, username)
+                )
+        
+        # Fall back to one call per characteristic for anything the batch missed
+        pending = [
+            (section_name, characteristic, analysis)
+            for section_name, characteristic, analysis in characteristics
+            if f"{section_name}.{characteristic}" not in citation_ids
+        ]
+        pending_per_section = {section_name: 0 for section_name in persona}
+        for section_name, _, _ in pending:
+            pending_per_section[section_name] += 1
         
         citations = {}
+        activity = ActivityStore.from_reddit_data(reddit_data)
+        
+        def finish_section(section_name: str) -> None:
+            citations[section_name] = self._format_section_citations(
+                section_name, persona[section_name], citation_ids, activity
+            )
+            if on_section:
+                on_section(section_name, citations[section_name])
         
-        # Create citation prompt for each persona section
-        for section_name, section_data in persona.items():
-            section_citations = []
+        for section_name, pending_count in pending_per_section.items():
+            if pending_count == 0:
+                finish_section(section_name)
+        
+        if pending:
+            with ThreadPoolExecutor(max_workers=max(1, min(CITATION_CONCURRENCY, len(pending)))) as executor:
+                futures = {
+                    executor.submit(
+                        self._generate_characteristic_citation_ids, characteristic, analysis,
+                        *self._split_matches(matches[f"{section_name}.{characteristic}"]), username
+                    ): (section_name, characteristic)
+                    for section_name, characteristic, analysis in pending
+                }
+                for future in as_completed(futures):
+                    section_name, characteristic = futures[future]
+                    relevant_ids = future.result()
+                    if relevant_ids is not None:
+                        citation_ids[f"{section_name}.{characteristic}"] = relevant_ids
+                    
+                    pending_per_section[section_name] -= 1
+                    if pending_per_section[section_name] == 0:
+                        finish_section(section_name)
+        
+        # Return sections in persona order regardless of completion order
+        return {section_name: citations[section_name] for section_name in persona}
+    
+    def _estimate_citation_tokens(self, characteristics: List[Tuple[str, str, str]],
+                                  matches: Dict[str, List[Tuple[str, Dict[str, Any]]]]) -> int:
+        """Estimate the tokens model-chosen citations would use for these matches."""
+        posts, comments = self._split_matches([match for key_matches in matches.values() for match in key_matches])
+        prompt_tokens = estimate_tokens(self._format_posts_for_citation(posts) + self._format_comments_for_citation(comments))
+        prompt_tokens += sum(estimate_tokens(truncate_text(str(analysis), 500)) for _, _, analysis in characteristics)
+        if CITATION_MODE == "batch":
+            return prompt_tokens + BATCH_CITATION_OUTPUT_TOKENS
+        # Individual calls split the same candidates between them, each with its own output cap
+        return prompt_tokens + len(characteristics) * CITATION_OUTPUT_TOKENS
+    
+    @staticmethod
+    def _split_matches(matches: List[Tuple[str, Dict[str, Any]]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Split retrieved `(kind, item)` matches into unique posts and comments, keeping rank order."""
+        seen = set()
+        posts, comments = [], []
+        for kind, item in matches:
+            if item['id'] in seen:
+                continue
+            seen.add(item['id'])
+            (posts if kind == 'post' else comments).append(item)
+        return posts, comments
+    
+    def _format_section_citations(self, section_name: str, section_data: Dict[str, Any], citation_ids: Dict[str, List[str]],
+                                  activity: ActivityStore) -> List[str]:
+        """Format the citations of one persona section, capped at CITATION_LIMIT."""
+        section_citations = []
+        for characteristic in section_data:
+            for item_id in citation_ids.get(f"{section_name}.{characteristic}", []):
+                citation = self._find_and_format_citation(item_id, activity)
+                if citation:
+                    section_citations.append(f"{characteristic}: {citation}")
+        return section_citations[:CITATION_LIMIT]
+    
+    def _generate_batch_citation_ids(self, characteristics: List[Tuple[str, str, str]], posts: List[Dict[str, Any]], comments: List[Dict[str, Any]],
+                                     username: Optional[str] = None) -> Dict[str, List[str]]:
+        """Find citation IDs for every characteristic with one structured Gemini call.
+        
+        Returns a mapping of ``section.characteristic`` keys to IDs. Characteristics
+        whose entries are missing or fail validation are left out so the caller can
+        retry them individually.
+        """
+        expected_keys = {f"{section_name}.{characteristic}" for section_name, characteristic, _ in characteristics}
+        characteristic_lines = "\n".join(
+            f"- {section_name}.{characteristic}: \"{truncate_text(str(analysis), 500)}\""
+            for section_name, characteristic, analysis in characteristics
+        )
+        
+        citation_prompt = f"""
+For each persona characteristic below, find the most relevant Reddit posts and comments that support its analysis.
+Look for specific examples that directly relate to each characteristic.
+
+Persona Characteristics:
+{characteristic_lines}
+
+Reddit Posts:
+{self._format_posts_for_citation(posts)}
+
+Reddit Comments:
+{self._format_comments_for_citation(comments)}
+
+Return one entry per characteristic, using the exact characteristic key shown above.
+Format as JSON: {{"citations": [{{"characteristic": "section.characteristic", "relevant_ids": ["post_id1", "comment_id2", ...]}}, ...]}}
+Limit each characteristic to maximum 3 most relevant items.
+"""
+        
+        try:
+            # Note that the newest Gemini model series is "gemini-2.5-flash" or "gemini-2.5-pro"
+            # do not change this unless explicitly requested by the user
+            raw_citation_response = self._generate_content(
+                model="gemini-2.5-flash",
+                prompt=citation_prompt,
+                config=types.GenerateContentConfig(
+                    system_instruction="You are a citation expert. Find the most relevant source material for each given analysis.",
+                    response_mime_type="application/json",
+                    response_schema=BatchCitationResponse,
+                    temperature=0.3,
+                    max_output_tokens=BATCH_CITATION_OUTPUT_TOKENS
+                ),
+                stage='citations',
+                username=username
+            )
             
-            # Analyze each characteristic in the section
-            for characteristic, analysis in section_data.items():
-                citation_prompt = f"""
+            if raw_citation_response is None:
+                logging.warning("Received None response from Gemini for batched citations")
+                return {}
+            
+            raw_entries = json.loads(self._strip_code_fences(raw_citation_response)).get('citations', [])
+        except Exception as e:
+            logging.warning(f"Batched citation request failed: {e}")
+            return {}
+        
+        # Validate each entry on its own so one bad entry doesn't discard the rest
+        citation_ids = {}
+        for raw_entry in raw_entries:
+            try:
+                entry = CharacteristicCitation.model_validate(raw_entry)
+            except Exception as entry_error:
+                logging.warning(f"Invalid batched citation entry: {entry_error}")
+                continue
+            if entry.characteristic in expected_keys:
+                citation_ids[entry.characteristic] = entry.relevant_ids[:3]
+        
+        logging.info(f"Batched citations resolved {len(citation_ids)}/{len(expected_keys)} characteristics")
+        return citation_ids
+    
+    def _generate_characteristic_citation_ids(self, characteristic: str, analysis: str, posts: List[Dict[str, Any]], comments: List[Dict[str, Any]],
+                                              username: Optional[str] = None) -> Optional[List[str]]:
+        """Find citation IDs for a single characteristic, or None if the call fails."""
+        citation_prompt = f"""
 Based on this persona characteristic analysis: "{analysis}"
 
 Find the most relevant Reddit posts and comments that support this analysis.
 Look for specific examples that directly relate to this characteristic.
 
 Reddit Posts:
-{self._format_posts_for_citation(posts[:10])}
+{self._format_posts_for_citation(posts)}
 
 Reddit Comments:
-{self._format_comments_for_citation(comments[:15])}
+{self._format_comments_for_citation(comments)}
 
 Return the IDs of the most relevant posts/comments that support this analysis.
 Format as JSON: {{"relevant_ids": ["post_id1", "comment_id2", ...]}}
 Limit to maximum 3 most relevant items.
 """
-                
-                try:
-                    # Note that the newest Gemini model series is "gemini-2.5-flash" or "gemini-2.5-pro"
-                    # do not change this unless explicitly requested by the user
-                    response = self.client.models.generate_content(
-                        model="gemini-2.5-flash",
-                        contents=[
-                            types.Content(role="user", parts=[types.Part(text=citation_prompt)])
-                        ],
-                        config=types.GenerateContentConfig(
-                            system_instruction="You are a citation expert. Find the most relevant source material for the given analysis.",
-                            response_mime_type="application/json",
-                            response_schema=CitationResponse,
-                            temperature=0.3,
-                            max_output_tokens=500
-                        )
-                    )
-                    
-                    # Parse citation response with better error handling
-                    raw_citation_response = response.text
-                    if raw_citation_response is None:
-                        logging.warning("Received None response from Gemini for citations")
-                        continue
-                    
-                    cleaned_citation_response = raw_citation_response.strip()
-                    if cleaned_citation_response.startswith('```json'):
-                        cleaned_citation_response = cleaned_citation_response[7:]
-                    if cleaned_citation_response.endswith('```'):
-                        cleaned_citation_response = cleaned_citation_response[:-3]
-                    cleaned_citation_response = cleaned_citation_response.strip()
-                    
-                    try:
-                        # Use Pydantic for structured citation parsing
-                        citation_response = CitationResponse.model_validate_json(cleaned_citation_response)
-                        relevant_ids = citation_response.relevant_ids
-                    except Exception as citation_error:
-                        logging.warning(f"Citation parsing error: {citation_error}")
-                        # Try fallback JSON parsing
-                        try:
-                            import json as json_module
-                            citation_data = json_module.loads(cleaned_citation_response)
-                            relevant_ids = citation_data.get('relevant_ids', [])
-                        except Exception:
-                            # Try regex extraction for citations
-                            import re
-                            id_matches = re.findall(r'"([a-zA-Z0-9_]+)"', cleaned_citation_response)
-                            relevant_ids = id_matches[:3] if id_matches else []
-                    
-                    # Format citations
-                    for item_id in relevant_ids:
-                        citation = self._find_and_format_citation(item_id, posts, comments)
-                        if citation:
-                            section_citations.append(f"{characteristic}: {citation}")
-                    
-                except Exception as e:
-                    logging.warning(f"Failed to generate citations for {characteristic}: {e}")
-                    continue
+        
+        try:
+            # Note that the newest Gemini model series is "gemini-2.5-flash" or "gemini-2.5-pro"
+            # do not change this unless explicitly requested by the user
+            raw_citation_response = self._generate_content(
+                model="gemini-2.5-flash",
+                prompt=citation_prompt,
+                config=types.GenerateContentConfig(
+                    system_instruction="You are a citation expert. Find the most relevant source material for the given analysis.",
+                    response_mime_type="application/json",
+                    response_schema=CitationResponse,
+                    temperature=0.3,
+                    max_output_tokens=CITATION_OUTPUT_TOKENS
+                ),
+                stage='citations',
+                username=username
+            )
             
-            citations[section_name] = section_citations[:CITATION_LIMIT]
+            # Parse citation response with better error handling
+            if raw_citation_response is None:
+                logging.warning("Received None response from Gemini for citations")
+                return None
+            
+            cleaned_citation_response = self._strip_code_fences(raw_citation_response)
+            
+            try:
+                # Use Pydantic for structured citation parsing
+                citation_response = CitationResponse.model_validate_json(cleaned_citation_response)
+                return citation_response.relevant_ids
+            except Exception as citation_error:
+                logging.warning(f"Citation parsing error: {citation_error}")
+                # Try fallback JSON parsing
+                try:
+                    citation_data = json.loads(cleaned_citation_response)
+                    return citation_data.get('relevant_ids', [])
+                except Exception:
+                    # Try regex extraction for citations
+                    import re
+                    id_matches = re.findall(r'"([a-zA-Z0-9_]+)"', cleaned_citation_response)
+                    return id_matches[:3] if id_matches else []
         
-        return citations
+        except Exception as e:
+            logging.warning(f"Failed to generate citations for {characteristic}: {e}")
+            return None
+    
+    def _strip_code_fences(self, raw_response: str) -> str:
+        """Strip markdown code fences that sometimes wrap JSON responses."""
+        cleaned_response = raw_response.strip()
+        if cleaned_response.startswith('```json'):
+            cleaned_response = cleaned_response[7:]
+        if cleaned_response.endswith('```'):
+            cleaned_response = cleaned_response[:-3]
+        return cleaned_response.strip()
     
     def _format_posts_for_citation(self, posts: List[Dict[str, Any]]) -> str:
         """Format posts for citation analysis."""
@@ -424,16 +1041,9 @@ Limit to maximum 3 most relevant items.
             formatted += "---\n"
         return formatted
     
-    def _find_and_format_citation(self, item_id: str, posts: List[Dict[str, Any]], comments: List[Dict[str, Any]]) -> Optional[str]:
+    def _find_and_format_citation(self, item_id: str, activity: ActivityStore) -> Optional[str]:
         """Find and format a citation for a specific post or comment ID."""
-        # Check posts
-        for post in posts:
-            if post['id'] == item_id:
-                return format_citation(post, "post")
-        
-        # Check comments
-        for comment in comments:
-            if comment['id'] == item_id:
-                return format_citation(comment, "comment")
-        
-        return None
+        item = activity.get(item_id)
+        if item is None:
+            return None
+        return format_citation(item, item.kind)
@@ -0,0 +1,108 @@
+"""Persistent SQLite store of the latest generated persona for each user."""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, Optional
+
+from metrics import increment
+
+
+class StoredPersona:
+    """A stored persona result and when it was generated."""
+    
+    def __init__(self, username: str, result: Dict[str, Any], generated_at: float):
+        """Create a stored persona record."""
+        self.username = username
+        self.result = result
+        self.generated_at = generated_at
+    
+    @property
+    def age_seconds(self) -> float:
+        """Seconds since the persona was generated."""
+        return max(0.0, time.time() - self.generated_at)
+
+
+class PersonaStore:
+    """On-disk store of finished persona results keyed by username.
+    
+    Each user keeps only their latest result: the structured persona,
+    citations, profile, statistics and behavior analytics returned by the
+    pipeline. Results younger than `fresh_seconds` can be served as they are;
+    older ones are stale and should be served while a refresh runs. Results
+    with incomplete persona sections use the shorter `incomplete_fresh_seconds`,
+    so a failed or cut-off response is retried sooner.
+    """
+    
+    def __init__(self, path: str, fresh_seconds: float, incomplete_fresh_seconds: Optional[float] = None):
+        """Open (and create if needed) the persona database at `path`."""
+        self.path = path
+        self.fresh_seconds = fresh_seconds
+        self.incomplete_fresh_seconds = fresh_seconds if incomplete_fresh_seconds is None else incomplete_fresh_seconds
+        self.lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS personas (
+                    username TEXT PRIMARY KEY,
+                    display_username TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    generated_at REAL NOT NULL
+                )
+            """)
+    
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Yield a connection that commits on success and is always closed."""
+        with self.lock:
+            conn = sqlite3.connect(self.path, timeout=30)
+            try:
+                with conn:
+                    yield conn
+            finally:
+                conn.close()
+    
+    @staticmethod
+    def _key(username: str) -> str:
+        """Normalize usernames, which Reddit treats case-insensitively."""
+        return username.lower()
+    
+    def get(self, username: str) -> Optional[StoredPersona]:
+        """Load a user's latest stored persona, fresh or not."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT display_username, result, generated_at FROM personas WHERE username = ?",
+                (self._key(username),)
+            ).fetchone()
+        
+        if row is None:
+            increment('store_lookups', result='miss')
+            return None
+        stored = StoredPersona(row[0], json.loads(row[1]), row[2])
+        increment('store_lookups', result='fresh' if self.is_fresh(stored) else 'stale')
+        return stored
+    
+    def put(self, username: str, result: Dict[str, Any]) -> StoredPersona:
+        """Store a freshly generated persona result, replacing the user's previous one."""
+        stored = StoredPersona(username, result, time.time())
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO personas (username, display_username, result, generated_at) VALUES (?, ?, ?, ?)",
+                (self._key(username), username, json.dumps(result), stored.generated_at)
+            )
+        logging.info(f"Stored persona for {username}")
+        return stored
+    
+    def is_fresh(self, stored: StoredPersona) -> bool:
+        """Return whether a stored persona is within its freshness window."""
+        if stored.result.get('incomplete_sections'):
+            return stored.age_seconds < min(self.fresh_seconds, self.incomplete_fresh_seconds)
+        return stored.age_seconds < self.fresh_seconds
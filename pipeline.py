@@ -0,0 +1,100 @@
+"""End-to-end persona generation pipeline shared by the web app and CLI."""
+
+import logging
+from datetime import datetime
+from typing import Callable, Dict, Any, Optional
+
+from activity_stream import sample_activity_stream
+from behavior_analytics import ensure_behavior_analytics
+from config import SCRAPE_STREAMING
+from metrics import span
+from reddit_scraper import RedditScraper
+from persona_analyzer import PersonaAnalyzer, PersonaSections
+from usage import format_usage
+from utils import validate_reddit_data
+
+
+def run_persona_pipeline(username: str, scraper: RedditScraper, analyzer: PersonaAnalyzer,
+                         on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """Scrape a user, generate their persona and citations, and return the response payload.
+    
+    If given, `on_event(event, data)` receives progress as each stage completes:
+    `posts_scraped`, `comments_scraped`, one `persona_section` event per section
+    as the persona streams in, `persona` and one `citations` event per persona
+    section.
+    """
+    emit = on_event or (lambda event, data: None)
+    analyzer.usage.reset_user(username)
+    
+    try:
+        # Scrape Reddit data
+        logging.info(f"Scraping Reddit data for user: {username}")
+        if SCRAPE_STREAMING:
+            # Only a bounded sample is kept in memory; analytics use the columns collected in passing
+            with span('scrape'):
+                stream = scraper.stream_user_data(username)
+                reddit_data = sample_activity_stream(stream)
+                reddit_data['behavior'] = stream.statistics.behavior()
+            emit('posts_scraped', {'count': reddit_data['statistics']['total_posts']})
+            emit('comments_scraped', {'count': reddit_data['statistics']['total_comments']})
+        else:
+            reddit_data = scraper.scrape_user_data(username, on_progress=emit)
+        
+        if not validate_reddit_data(reddit_data):
+            raise ValueError(f"No data found for user {username} or user does not exist")
+        
+        logging.info(f"Found {reddit_data['statistics']['total_activity']} total activities for {username}")
+        
+        # Generate persona
+        logging.info("Generating AI persona analysis...")
+        persona = analyzer.generate_persona(
+            reddit_data,
+            on_section=lambda section, analysis: emit('persona_section', {'section': section, 'analysis': analysis})
+        )
+        
+        response_data = build_persona_result(username, reddit_data, persona)
+        emit('persona', dict(response_data))  # A snapshot; citations and usage are added below
+        
+        # Generate citations
+        logging.info("Generating citations...")
+        response_data['citations'] = analyzer.generate_citations(
+            reddit_data, persona,
+            on_section=lambda section, citations: emit('citations', {'section': section, 'citations': citations})
+        )
+        
+        response_data['usage'] = analyzer.usage.user_summary(username)
+        logging.info(f"Successfully generated persona for {username} using {format_usage(response_data['usage'])}")
+        return response_data
+    finally:
+        # The web app's analyzer lives as long as the process, so per-user counts are dropped once reported
+        analyzer.usage.release_user(username)
+
+
+def build_persona_result(username: str, reddit_data: Dict[str, Any], persona: Dict[str, Any],
+                         citations: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Assemble the result payload returned by the web app and kept in the persona store.
+    
+    It carries the profile and statistics alongside the persona so a report
+    can be rebuilt from a stored result without scraping again, and lists the
+    persona sections that were repaired or left as placeholders.
+    """
+    stats = reddit_data['statistics']
+    return {
+        'username': username,
+        'total_activities': stats['total_activity'],
+        'posts_count': stats['total_posts'],
+        'comments_count': stats['total_comments'],
+        'profile': reddit_data['profile'],
+        'statistics': stats,
+        'behavior': ensure_behavior_analytics(reddit_data),
+        'persona': persona,
+        'incomplete_sections': persona.incomplete if isinstance(persona, PersonaSections) else [],
+        'citations': citations or {},
+        'timestamp': datetime.now().isoformat(),
+        'success': True
+    }
+
+
+def report_data(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Rebuild the scraped-data fields a text report needs from a stored result."""
+    return {'profile': result['profile'], 'statistics': result['statistics'], 'behavior': result['behavior']}
@@ -0,0 +1,270 @@
+"""Token-budgeted prompt assembly for persona analysis."""
+
+import heapq
+import math
+from datetime import datetime, timezone
+from typing import Dict, List, Any, NamedTuple, Optional, Tuple
+
+from behavior_analytics import format_behavior_summary
+from utils import truncate_text
+
+
+CHARS_PER_TOKEN = 4  # Rough average for English text
+MIN_WORDS = 3  # Items with fewer words ("lol", "this", "+1") carry almost no signal
+SUBREDDIT_DECAY = 0.6  # Value multiplier for each item already picked from the same subreddit
+PERIOD_DECAY = 0.8  # Value multiplier for each item already picked from the same time period
+RECENCY_PERIODS = 12  # Slices of the user's history used to spread picks over time
+ITEM_HEADER_CHARS = len("\nComment 10000:\n")  # Numbered item headers are added at assembly
+CANDIDATE_TOKENS = 10  # Keep at most one ranked candidate per this many budget tokens
+POST_BUDGET_SHARE = 0.4  # Share of the budget offered to posts; whatever they leave goes to comments
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of a piece of text."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def item_signal(kind: str, item: Dict[str, Any]) -> float:
+    """Score how informative a post or comment is on its own, 0 for low-value items."""
+    text = f"{item.get('title', '')} {item.get('body', '')}"
+    if len(text.split()) < MIN_WORDS:
+        return 0.0
+    
+    engagement = math.log1p(max(item.get('score', 0), 0))
+    substance = math.log1p(min(len(text), 1500))
+    return (1.0 + engagement) * substance
+
+
+def approximate_count(count: int) -> str:
+    """Round a count to two significant figures, e.g. 12345 -> "~12000"."""
+    if abs(count) < 100:
+        return str(count)
+    return f"~{round(count, 2 - len(str(abs(count))))}"
+
+
+def format_profile_summary(reddit_data: Dict[str, Any]) -> str:
+    """Format the profile and statistics summary that opens analysis prompts.
+    
+    Prompts are cached by their text, so fields that drift daily are coarsened:
+    account age is given in whole years with the creation month, and karma to
+    two significant figures.
+    """
+    profile = reddit_data['profile']
+    stats = reddit_data['statistics']
+    top_subreddits = "\n".join(f"r/{subreddit}: {count} activities" for subreddit, count in stats['top_subreddits'])
+    years = int(profile['account_age_days'] // 365.25)
+    created = datetime.fromtimestamp(profile['created_utc'], timezone.utc).strftime('%Y-%m')
+    summary = f"""
+USER PROFILE SUMMARY:
+Username: {profile['username']}
+Account Age: {f"{years}+ years" if years else "under a year"} (created {created})
+Comment Karma: {approximate_count(profile['comment_karma'])}
+Link Karma: {approximate_count(profile['link_karma'])}
+Total Posts: {stats['total_posts']}
+Total Comments: {stats['total_comments']}
+
+TOP SUBREDDITS:
+{top_subreddits}
+"""
+    if 'behavior' in reddit_data:
+        summary += f"""
+BEHAVIOR ANALYTICS (exact figures computed from all scraped activity; rely on these for posting patterns, activity level and timezone):
+{format_behavior_summary(reddit_data['behavior'])}
+"""
+    return summary
+
+
+class ActivityChunk(NamedTuple):
+    """A chronological slice of formatted activity for map-reduce analysis."""
+    lines: List[str]
+    first_day: str
+    last_day: str
+
+
+def chunk_activity(posts: List[Dict[str, Any]], comments: List[Dict[str, Any]], chunk_tokens: int) -> List[ActivityChunk]:
+    """Split a whole history into chronological chunks of formatted items, oldest first.
+    
+    Chunk boundaries depend only on the activity of the calendar year (UTC)
+    they fall in: a chunk never spans two years, whole months are packed
+    greedily from January up to `chunk_tokens`, and only a month larger than
+    that is split between its items. Chunks leave out volatile fields such as
+    scores, so new activity only changes the current year's last chunks, and
+    when the scrape cap drops the oldest items only the oldest year's chunks
+    change; the text of every other chunk stays identical between runs.
+    """
+    records = [('post', post) for post in posts] + [('comment', comment) for comment in comments]
+    records.sort(key=lambda record: (record[1]['created_utc'], record[1]['id']))
+    
+    entries: List[Tuple[str, str, int]] = []
+    month_tokens: Dict[str, int] = {}
+    for kind, item in records:
+        text = f"{item.get('title', '')} {item.get('body', '')}"
+        if len(text.split()) < MIN_WORDS:
+            continue
+        
+        day = datetime.fromtimestamp(item['created_utc'], timezone.utc).strftime('%Y-%m-%d')
+        if kind == 'post':
+            line = f"[{day}] Post in r/{item['subreddit']}: {item['title']}"
+            if item['body']:
+                line += f" - {truncate_text(item['body'], 300)}"
+        else:
+            line = f"[{day}] Comment in r/{item['subreddit']}"
+            if item.get('parent_title'):
+                line += f" on \"{item['parent_title']}\""
+            line += f": {truncate_text(item['body'], 200)}"
+        
+        cost = estimate_tokens(line) + 1
+        entries.append((day, line, cost))
+        month_tokens[day[:7]] = month_tokens.get(day[:7], 0) + cost
+    
+    chunks: List[ActivityChunk] = []
+    current: List[str] = []
+    days: List[str] = []
+    used = 0
+    
+    for day, line, cost in entries:
+        month = day[:7]
+        if current and (
+            day[:4] != days[-1][:4]
+            or (month != days[-1][:7] and used + month_tokens[month] > chunk_tokens)
+            or used + cost > chunk_tokens
+        ):
+            chunks.append(ActivityChunk(current, days[0], days[-1]))
+            current, days, used = [], [], 0
+        current.append(line)
+        days.append(day)
+        used += cost
+    
+    if current:
+        chunks.append(ActivityChunk(current, days[0], days[-1]))
+    return chunks
+
+
+class BuiltPrompt(NamedTuple):
+    """An assembled analysis prompt and what went into it."""
+    text: str
+    tokens_used: int
+    token_budget: int
+    posts_included: int
+    comments_included: int
+
+
+class PromptBuilder:
+    """Packs the most informative posts and comments into a token budget.
+    
+    Items are ranked by engagement and length, low-value items are dropped,
+    and a greedy pass picks items while discounting subreddits and periods of
+    the history that are already represented, so the prompt covers the breadth
+    of a long history rather than only its newest slice.
+    """
+    
+    def __init__(self, token_budget: int):
+        """Create a builder with a default token budget for the activity prompt."""
+        self.token_budget = token_budget
+    
+    def build(self, reddit_data: Dict[str, Any], token_budget: Optional[int] = None) -> BuiltPrompt:
+        """Build the analysis prompt for `reddit_data` within `token_budget` tokens."""
+        budget = token_budget or self.token_budget
+        header = format_profile_summary(reddit_data) + "\nSELECTED POSTS:\n"
+        comments_heading = "\nSELECTED COMMENTS:\n"
+        remaining = budget - estimate_tokens(header) - estimate_tokens(comments_heading)
+        
+        post_candidates = self._rank_candidates('post', reddit_data['posts'], remaining)
+        comment_candidates = self._rank_candidates('comment', reddit_data['comments'], remaining)
+        selection = _Selection(post_candidates + comment_candidates)
+        
+        posts = selection.pick(post_candidates, int(remaining * POST_BUDGET_SHARE))
+        comments = selection.pick(comment_candidates, remaining - sum(cost for _, _, _, cost in posts))
+        posts.sort(key=lambda c: c[1]['created_utc'], reverse=True)
+        comments.sort(key=lambda c: c[1]['created_utc'], reverse=True)
+        
+        parts = [header]
+        parts.extend(f"\nPost {i + 1}:\n{block}" for i, (_, _, block, _) in enumerate(posts))
+        parts.append(comments_heading)
+        parts.extend(f"\nComment {i + 1}:\n{block}" for i, (_, _, block, _) in enumerate(comments))
+        text = "".join(parts)
+        
+        return BuiltPrompt(text, estimate_tokens(text), budget, len(posts), len(comments))
+    
+    @staticmethod
+    def _format_item(kind: str, item: Dict[str, Any]) -> str:
+        """Format a post or comment block, without its numbered header."""
+        if kind == 'post':
+            lines = [
+                f"Title: {item['title']}",
+                f"Subreddit: r/{item['subreddit']}",
+                f"Score: {item['score']}"
+            ]
+            if item['body']:
+                lines.append(f"Content: {truncate_text(item['body'], 300)}")
+        else:
+            lines = [
+                f"Subreddit: r/{item['subreddit']}",
+                f"Score: {item['score']}"
+            ]
+            if item.get('parent_title'):
+                lines.append(f"Post: {item['parent_title']}")
+            lines.append(f"Content: {truncate_text(item['body'], 200)}")
+        lines.append("---\n")
+        return "\n".join(lines)
+    
+    @staticmethod
+    def _rank_candidates(kind: str, items: List[Dict[str, Any]], budget: int) -> List[Tuple[float, str, Dict[str, Any]]]:
+        """Keep the highest-signal items of one kind, bounded by what the budget could ever hold."""
+        scored = ((item_signal(kind, item), kind, item) for item in items)
+        limit = max(1, budget // CANDIDATE_TOKENS)
+        return [c for c in heapq.nlargest(limit, scored, key=lambda c: c[0]) if c[0] > 0]
+
+
+class _Selection:
+    """Diversity state shared by successive greedy picks for one prompt."""
+    
+    def __init__(self, candidates: List[Tuple[float, str, Dict[str, Any]]]):
+        """Derive the time periods from the span of all candidates."""
+        timestamps = [item['created_utc'] for _, _, item in candidates] or [0.0]
+        self.oldest = min(timestamps)
+        self.span = max(timestamps) - self.oldest or 1.0
+        self.subreddit_counts: Dict[str, int] = {}
+        self.period_counts: Dict[int, int] = {}
+    
+    def _period(self, item: Dict[str, Any]) -> int:
+        """Return which slice of the history an item falls in."""
+        return min(RECENCY_PERIODS - 1, int((item['created_utc'] - self.oldest) / self.span * RECENCY_PERIODS))
+    
+    def _value(self, signal: float, item: Dict[str, Any]) -> float:
+        """Discount an item's signal by how well its subreddit and period are already covered."""
+        return (signal
+                * SUBREDDIT_DECAY ** self.subreddit_counts.get(item['subreddit'], 0)
+                * PERIOD_DECAY ** self.period_counts.get(self._period(item), 0))
+    
+    def pick(self, candidates: List[Tuple[float, str, Dict[str, Any]]],
+             budget: int) -> List[Tuple[str, Dict[str, Any], str, int]]:
+        """Greedily pick candidates by discounted value until `budget` tokens are spent.
+        
+        Discounts only grow as items are picked, so a lazily re-scored heap
+        gives the same picks as re-scoring everything after each selection.
+        """
+        heap = [(-signal, index) for index, (signal, _, _) in enumerate(candidates)]
+        heapq.heapify(heap)
+        selected = []
+        
+        while heap and budget > 0:
+            stale_value, index = heapq.heappop(heap)
+            signal, kind, item = candidates[index]
+            current = self._value(signal, item)
+            if heap and current < -heap[0][0] and current < -stale_value:
+                heapq.heappush(heap, (-current, index))
+                continue
+            
+            block = PromptBuilder._format_item(kind, item)
+            cost = estimate_tokens(block) + ITEM_HEADER_CHARS // CHARS_PER_TOKEN
+            if cost > budget:
+                continue
+            
+            budget -= cost
+            selected.append((kind, item, block, cost))
+            self.subreddit_counts[item['subreddit']] = self.subreddit_counts.get(item['subreddit'], 0) + 1
+            period = self._period(item)
+            self.period_counts[period] = self.period_counts.get(period, 0) + 1
+        
+        return selected
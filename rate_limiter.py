@@ -0,0 +1,95 @@
+"""Rate limiting primitives shared by the Reddit and Gemini clients."""
+
+import threading
+import time
+from typing import Mapping, Optional
+
+
+class TokenBucket:
+    """Thread-safe token bucket that blocks callers until a token is available."""
+
+    def __init__(self, rate: float, capacity: float):
+        """Create a bucket refilled at `rate` tokens per second, holding at most `capacity`."""
+        if rate <= 0:
+            raise ValueError("Token bucket rate must be positive")
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests_per_minute: int, burst: int = 1) -> "TokenBucket":
+        """Build a bucket from a per-minute quota."""
+        return cls(rate=requests_per_minute / 60.0, capacity=burst)
+
+    def _refill(self) -> None:
+        """Add tokens accrued since the last update. Caller must hold the lock."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Take `tokens` from the bucket, sleeping as needed. Returns seconds waited."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class RedditRateLimiter:
+    """Per-request limiter that paces calls using Reddit's X-Ratelimit-* headers.
+    
+    Every HTTP request waits for its slot via `wait()`; responses feed `update()`
+    so the spacing stretches to spread the remaining quota over the reset window
+    and shrinks back to `min_interval` once quota is plentiful.
+    """
+    
+    def __init__(self, min_interval: float = 0.0):
+        """Create a limiter that never issues requests closer than `min_interval` seconds."""
+        self.min_interval = max(min_interval, 0.0)
+        self.interval = self.min_interval
+        self.next_request_at = 0.0
+        self.remaining: Optional[float] = None
+        self.reset_seconds: Optional[float] = None
+        self.lock = threading.Lock()
+    
+    def wait(self) -> float:
+        """Block until the next request may be sent. Returns seconds waited."""
+        with self.lock:
+            now = time.monotonic()
+            start_at = max(now, self.next_request_at)
+            self.next_request_at = start_at + self.interval
+        delay = start_at - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+    
+    def update(self, headers: Mapping[str, str]) -> None:
+        """Adapt pacing to the rate limit headers of a response."""
+        remaining = headers.get('x-ratelimit-remaining')
+        reset = headers.get('x-ratelimit-reset')
+        if remaining is None or reset is None:
+            return
+        
+        try:
+            remaining = float(remaining)
+            reset = float(reset)
+        except ValueError:
+            return
+        
+        with self.lock:
+            self.remaining = remaining
+            self.reset_seconds = reset
+            if remaining < 1:
+                # Quota exhausted: hold everything until the window resets
+                self.interval = self.min_interval
+                self.next_request_at = max(self.next_request_at, time.monotonic() + reset)
+            else:
+                self.interval = max(self.min_interval, reset / remaining)
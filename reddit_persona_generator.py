@@ -8,6 +8,7 @@ with AI analysis and citation support.
 Usage:
     python reddit_persona_generator.py <reddit_user_url>
     python reddit_persona_generator.py https://www.reddit.com/user/username/
+    python reddit_persona_generator.py --batch users.txt
 
 Requirements:
     - Reddit API credentials (REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET)
@@ -15,17 +16,29 @@ Requirements:
 """
 
 import argparse
+import json
 import logging
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any
-
-from config import OUTPUT_DIR
+from typing import Dict, Any, List, Optional, TextIO, Tuple
+
+from config import (OUTPUT_DIR, BATCH_SCRAPE_WORKERS, BATCH_LLM_WORKERS, TOKEN_BUDGET_PER_USER, TOKEN_BUDGET_PER_BATCH,
+                    PERSONA_STORE_ENABLED, PERSONA_STORE_PATH, PERSONA_FRESH_SECONDS, PERSONA_INCOMPLETE_FRESH_SECONDS)
+from behavior_analytics import ensure_behavior_analytics, format_behavior_summary
+from clients import ClientPool
+from metrics import registry, span
+from persona_store import PersonaStore, StoredPersona
+from pipeline import build_persona_result, report_data
 from reddit_scraper import RedditScraper
 from persona_analyzer import PersonaAnalyzer
+from usage import UsageTracker, format_usage
 from utils import (
     extract_username_from_url, 
+    parse_profile_input,
     sanitize_filename, 
     create_output_directory,
     validate_reddit_data,
@@ -45,10 +58,12 @@ def setup_logging():
     )
 
 
-def format_persona_output(username: str, persona: Dict[str, Any], citations: Dict[str, Any], reddit_data: Dict[str, Any]) -> str:
+def format_persona_output(username: str, persona: Dict[str, Any], citations: Dict[str, Any], reddit_data: Dict[str, Any],
+                          generated_at: Optional[datetime] = None) -> str:
     """Format persona data into readable text output."""
     profile = reddit_data['profile']
     stats = reddit_data['statistics']
+    behavior = ensure_behavior_analytics(reddit_data)
     
     output = f"""
 {'='*80}
@@ -56,7 +71,7 @@ REDDIT USER PERSONA ANALYSIS
 {'='*80}
 
 USERNAME: {username}
-GENERATED ON: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+GENERATED ON: {(generated_at or datetime.now()).strftime('%Y-%m-%d %H:%M:%S')}
 ACCOUNT CREATED: {format_timestamp(profile['created_utc'])}
 ACCOUNT AGE: {profile['account_age_days']:.0f} days
 KARMA: {profile['comment_karma']} comment / {profile['link_karma']} link
@@ -152,6 +167,12 @@ TOP SUBREDDITS
 
 {chr(10).join([f"r/{subreddit}: {count} activities" for subreddit, count in stats['top_subreddits']])}
 
+{'='*80}
+BEHAVIOR ANALYTICS
+{'='*80}
+
+{format_behavior_summary(behavior)}
+
 {'='*80}
 ANALYSIS COMPLETE
 {'='*80}
@@ -166,14 +187,14 @@ Generated by Reddit Persona Generator v1.0
     return output
 
 
-def save_persona_to_file(username: str, persona_text: str) -> str:
+def save_persona_to_file(username: str, persona_text: str, output_dir: str = OUTPUT_DIR) -> str:
     """Save persona text to file and return filename."""
-    create_output_directory(OUTPUT_DIR)
+    create_output_directory(output_dir)
     
     # Create filename
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     filename = f"{sanitize_filename(username)}_persona_{timestamp}.txt"
-    filepath = os.path.join(OUTPUT_DIR, filename)
+    filepath = os.path.join(output_dir, filename)
     
     # Save to file
     with open(filepath, 'w', encoding='utf-8') as f:
@@ -182,6 +203,325 @@ def save_persona_to_file(username: str, persona_text: str) -> str:
     return filepath
 
 
+def create_persona_store() -> Optional[PersonaStore]:
+    """Open the persona store shared with the web app, unless it is disabled."""
+    if not PERSONA_STORE_ENABLED:
+        return None
+    return PersonaStore(PERSONA_STORE_PATH, PERSONA_FRESH_SECONDS, PERSONA_INCOMPLETE_FRESH_SECONDS)
+
+
+def find_fresh_persona(store: Optional[PersonaStore], username: str) -> Optional[StoredPersona]:
+    """Return a user's stored persona if it is still within the freshness window."""
+    stored = store.get(username) if store else None
+    if stored is None or not store.is_fresh(stored):
+        return None
+    logging.info(f"Using stored persona for {username} generated {stored.age_seconds / 3600:.1f}h ago")
+    return stored
+
+
+def save_stored_report(stored: StoredPersona, output_dir: str) -> str:
+    """Write the report for a stored persona without scraping or calling Gemini."""
+    result = stored.result
+    with span('format_report'):
+        persona_text = format_persona_output(stored.username, result['persona'], result['citations'],
+                                             report_data(result), datetime.fromtimestamp(stored.generated_at))
+    return save_persona_to_file(stored.username, persona_text, output_dir)
+
+
+def create_analyzer() -> PersonaAnalyzer:
+    """Create an analyzer that enforces the per-user and per-run token budgets."""
+    return PersonaAnalyzer(usage=UsageTracker(TOKEN_BUDGET_PER_USER, TOKEN_BUDGET_PER_BATCH))
+
+
+def save_run_timings(path: str, **details) -> Dict[str, Any]:
+    """Write this run's timing spans and counters to a JSON file and return the summary."""
+    summary = {'generated_at': datetime.now().isoformat(), **details, **registry.summary()}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def format_stage_timings(summary: Dict[str, Any]) -> str:
+    """Summarize total time per top-level stage on one line."""
+    spans = summary['spans']
+    return ", ".join(
+        f"{stage} {spans[stage]['total_seconds']:.2f}s"
+        for stage in ('scrape', 'persona', 'citations', 'format_report')
+        if stage in spans
+    )
+
+
+def scrape_user(username: str, scraper: RedditScraper) -> Dict[str, Any]:
+    """Scrape and validate Reddit data for a user."""
+    logging.info(f"Scraping Reddit data for user: {username}")
+    reddit_data = scraper.scrape_user_data(username)
+    
+    if not validate_reddit_data(reddit_data):
+        raise ValueError("Invalid Reddit data structure")
+    
+    logging.info(f"Successfully scraped {reddit_data['statistics']['total_activity']} total activities")
+    return reddit_data
+
+
+def analyze_and_save(username: str, reddit_data: Dict[str, Any], analyzer: PersonaAnalyzer, output_dir: str,
+                     store: Optional[PersonaStore] = None) -> Tuple[str, Dict[str, Any]]:
+    """Generate the persona and citations for scraped data, save the report and update the persona store.
+    
+    Returns the output file path and the persona.
+    """
+    analyzer.usage.reset_user(username)
+    
+    # Generate persona
+    logging.info("Generating AI persona analysis...")
+    try:
+        persona = analyzer.generate_persona(reddit_data)
+        logging.info("Successfully generated persona")
+    except Exception as e:
+        logging.error(f"Failed to generate persona: {e}")
+        raise
+    
+    # Generate citations
+    logging.info("Generating citations...")
+    try:
+        citations = analyzer.generate_citations(reddit_data, persona)
+        logging.info("Successfully generated citations")
+    except Exception as e:
+        logging.warning(f"Failed to generate citations: {e}")
+        # Continue with empty citations if citation generation fails
+        citations = {}
+    
+    # Format output
+    logging.info("Formatting persona output...")
+    with span('format_report'):
+        persona_text = format_persona_output(username, persona, citations, reddit_data)
+    
+    # Save to file
+    logging.info("Saving persona to file...")
+    filepath = save_persona_to_file(username, persona_text, output_dir)
+    if store:
+        result = build_persona_result(username, reddit_data, persona, citations)
+        result['usage'] = analyzer.usage.user_summary(username)
+        store.put(username, result)
+    return filepath, persona
+
+
+def read_batch_inputs(stream: TextIO) -> List[str]:
+    """Read usernames or profile URLs, one per line, skipping blanks and comments."""
+    usernames = []
+    seen = set()
+    for line in stream:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            username = parse_profile_input(line)
+        except ValueError as e:
+            logging.warning(f"Skipping batch entry: {e}")
+            continue
+        if username and username.lower() not in seen:
+            seen.add(username.lower())
+            usernames.append(username)
+    return usernames
+
+
+def load_checkpoint(path: str) -> Dict[str, Dict[str, Any]]:
+    """Load completed batch entries keyed by lowercased username."""
+    completed = {}
+    if not os.path.exists(path):
+        return completed
+    
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A crash can leave a partially written last line
+                continue
+            if entry.get('status') == 'success':
+                completed[entry['username'].lower()] = entry
+    return completed
+
+
+class BatchRunner:
+    """Profiles many users with separate concurrency limits for scraping and LLM stages.
+    
+    Finished users are appended to a checkpoint file as they complete, so a
+    crashed batch can be rerun with the same checkpoint and skip them.
+    """
+    
+    def __init__(self, output_dir: str, checkpoint_path: str, scrape_workers: int, llm_workers: int,
+                 refresh: bool = False):
+        """Set up shared clients for the batch; with `refresh`, fresh stored personas are regenerated too."""
+        self.output_dir = output_dir
+        self.refresh = refresh
+        self.checkpoint_path = checkpoint_path
+        self.scrape_workers = max(1, scrape_workers)
+        self.llm_workers = max(1, llm_workers)
+        self.checkpoint_lock = threading.Lock()
+        self.llm_futures = {}
+        
+        # One authenticated scraper; the pool adds more that share its rate
+        # limiter and activity cache without re-validating credentials
+        first_scraper = RedditScraper()
+        self.scrapers = ClientPool(
+            lambda: RedditScraper(
+                rate_limiter=first_scraper.rate_limiter,
+                activity_cache=first_scraper.activity_cache,
+                validate=False
+            ),
+            self.scrape_workers
+        )
+        self.scrapers.add(first_scraper)
+        self.analyzer = create_analyzer()
+        self.store = create_persona_store()
+    
+    def run(self, usernames: List[str]) -> Dict[str, Any]:
+        """Process every user and return the batch manifest."""
+        started_at = datetime.now()
+        completed = load_checkpoint(self.checkpoint_path)
+        entries = {}
+        
+        for username in usernames:
+            if username.lower() in completed:
+                entries[username] = dict(completed[username.lower()], from_checkpoint=True)
+        pending = [username for username in usernames if username not in entries]
+        logging.info(f"Batch: {len(pending)} users to process, {len(entries)} already done in checkpoint")
+        
+        self.llm_futures = {}
+        with ThreadPoolExecutor(max_workers=self.llm_workers, thread_name_prefix='llm') as llm_executor, \
+                ThreadPoolExecutor(max_workers=self.scrape_workers, thread_name_prefix='scrape') as scrape_executor:
+            scrape_futures = {
+                username: scrape_executor.submit(self._scrape_stage, username, llm_executor)
+                for username in pending
+            }
+            for username, scrape_future in scrape_futures.items():
+                entry = scrape_future.result()
+                entries[username] = entry if entry is not None else self.llm_futures[username].result()
+        
+        ordered_entries = [entries[username] for username in usernames]
+        return {
+            'started_at': started_at.isoformat(),
+            'finished_at': datetime.now().isoformat(),
+            'total_users': len(usernames),
+            'succeeded': sum(1 for entry in ordered_entries if entry['status'] == 'success'),
+            'failed': sum(1 for entry in ordered_entries if entry['status'] == 'failed'),
+            'resumed_from_checkpoint': sum(1 for entry in ordered_entries if entry.get('from_checkpoint')),
+            'served_from_store': sum(1 for entry in ordered_entries if entry.get('from_store')),
+            'usage': self.analyzer.usage.run_summary(),
+            'users': ordered_entries
+        }
+    
+    def _scrape_stage(self, username: str, llm_executor: ThreadPoolExecutor) -> Optional[Dict[str, Any]]:
+        """Scrape a user and hand the data to the LLM stage.
+        
+        Returns a finished entry if scraping failed or a fresh stored persona
+        was reused, or None once the LLM stage has been queued.
+        """
+        started = time.time()
+        stored = None if self.refresh else find_fresh_persona(self.store, username)
+        if stored:
+            try:
+                filepath = save_stored_report(stored, self.output_dir)
+            except Exception as e:
+                logging.warning(f"Batch: could not reuse stored persona for {username}: {e}")
+            else:
+                return self._finish(username, 'success', started, output_file=filepath, from_store=True,
+                                    total_activities=stored.result['total_activities'])
+        
+        try:
+            with self.scrapers.acquire() as scraper:
+                reddit_data = scrape_user(username, scraper)
+        except Exception as e:
+            logging.error(f"Batch: scraping failed for {username}: {e}")
+            return self._finish(username, 'failed', started, scrape_seconds=time.time() - started, error=str(e))
+        
+        scrape_seconds = time.time() - started
+        self.llm_futures[username] = llm_executor.submit(self._llm_stage, username, reddit_data, started, scrape_seconds)
+        return None
+    
+    def _llm_stage(self, username: str, reddit_data: Dict[str, Any], started: float, scrape_seconds: float) -> Dict[str, Any]:
+        """Generate and save a persona for scraped data."""
+        llm_started = time.time()
+        try:
+            filepath, _ = analyze_and_save(username, reddit_data, self.analyzer, self.output_dir, self.store)
+        except Exception as e:
+            logging.error(f"Batch: persona generation failed for {username}: {e}")
+            return self._finish(username, 'failed', started, scrape_seconds=scrape_seconds,
+                                llm_seconds=time.time() - llm_started, error=str(e))
+        
+        usage = self.analyzer.usage.user_summary(username)
+        return self._finish(username, 'success', started, scrape_seconds=scrape_seconds,
+                            llm_seconds=time.time() - llm_started, output_file=filepath,
+                            total_activities=reddit_data['statistics']['total_activity'],
+                            tokens=usage['total'], budget_degraded=usage['degraded'])
+    
+    def _finish(self, username: str, status: str, started: float, **details) -> Dict[str, Any]:
+        """Record a finished user in the checkpoint and return its manifest entry."""
+        entry = {
+            'username': username,
+            'status': status,
+            'total_seconds': round(time.time() - started, 3),
+            **{key: round(value, 3) if isinstance(value, float) else value for key, value in details.items()}
+        }
+        
+        with self.checkpoint_lock:
+            with open(self.checkpoint_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        
+        logging.info(f"Batch: {username} {status} in {entry['total_seconds']}s")
+        return entry
+
+
+def run_batch(args: argparse.Namespace) -> None:
+    """Run batch mode for the parsed command line arguments."""
+    if args.batch == '-':
+        usernames = read_batch_inputs(sys.stdin)
+    else:
+        with open(args.batch, 'r', encoding='utf-8') as f:
+            usernames = read_batch_inputs(f)
+    
+    if not usernames:
+        raise ValueError("No usernames or profile URLs found in batch input")
+    
+    create_output_directory(args.output_dir)
+    checkpoint_path = args.checkpoint or os.path.join(args.output_dir, 'batch_checkpoint.jsonl')
+    manifest_path = args.manifest or os.path.join(
+        args.output_dir, f"batch_manifest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    
+    timings_path = args.timings or os.path.join(
+        args.output_dir, f"batch_timings_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    
+    runner = BatchRunner(args.output_dir, checkpoint_path, args.scrape_workers, args.llm_workers, refresh=args.refresh)
+    manifest = runner.run(usernames)
+    
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    timings = save_run_timings(timings_path, mode='batch', total_users=manifest['total_users'], usage=manifest['usage'])
+    
+    print(f"\n{'='*60}")
+    print("BATCH PERSONA GENERATION COMPLETE!")
+    print(f"{'='*60}")
+    print(f"Users: {manifest['total_users']}")
+    print(f"Succeeded: {manifest['succeeded']} ({manifest['resumed_from_checkpoint']} from checkpoint, "
+          f"{manifest['served_from_store']} from the persona store)")
+    print(f"Failed: {manifest['failed']}")
+    print(f"Gemini usage: {format_usage(manifest['usage'])}")
+    if manifest['usage']['degraded']:
+        print(f"Token budget cutbacks: {sum(len(messages) for messages in manifest['usage']['degraded'].values())} "
+              f"(see manifest)")
+    print(f"Checkpoint: {checkpoint_path}")
+    print(f"Manifest: {manifest_path}")
+    print(f"Timings: {format_stage_timings(timings)} (details in {timings_path})")
+    print(f"{'='*60}")
+    
+    if manifest['failed']:
+        sys.exit(1)
+
+
 def main():
     """Main function to run the Reddit persona generator."""
     parser = argparse.ArgumentParser(
@@ -191,14 +531,59 @@ def main():
 Examples:
     python reddit_persona_generator.py https://www.reddit.com/user/username/
     python reddit_persona_generator.py https://www.reddit.com/u/username/
+    python reddit_persona_generator.py --batch users.txt --scrape-workers 4 --llm-workers 2
+    cat users.txt | python reddit_persona_generator.py --batch -
         """
     )
     
     parser.add_argument(
         'reddit_url',
+        nargs='?',
         help='Reddit user profile URL'
     )
     
+    parser.add_argument(
+        '--batch',
+        metavar='FILE',
+        help='Profile every username or URL listed in FILE, one per line ("-" reads stdin)'
+    )
+    
+    parser.add_argument(
+        '--checkpoint',
+        help='Batch checkpoint file; users already completed in it are skipped (default: <output-dir>/batch_checkpoint.jsonl)'
+    )
+    
+    parser.add_argument(
+        '--manifest',
+        help='Batch summary manifest path (default: <output-dir>/batch_manifest_<timestamp>.json)'
+    )
+    
+    parser.add_argument(
+        '--scrape-workers',
+        type=int,
+        default=BATCH_SCRAPE_WORKERS,
+        help=f'Concurrent users being scraped in batch mode (default: {BATCH_SCRAPE_WORKERS})'
+    )
+    
+    parser.add_argument(
+        '--llm-workers',
+        type=int,
+        default=BATCH_LLM_WORKERS,
+        help=f'Concurrent users in the persona generation stage in batch mode (default: {BATCH_LLM_WORKERS})'
+    )
+    
+    parser.add_argument(
+        '--timings',
+        help='JSON file for per-stage timings and call counters of this run '
+             '(default: <output-dir>/<username>_timings_<timestamp>.json, or batch_timings_<timestamp>.json)'
+    )
+    
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='Regenerate personas even when the persona store holds a fresh one'
+    )
+    
     parser.add_argument(
         '--output-dir',
         default=OUTPUT_DIR,
@@ -212,6 +597,8 @@ Examples:
     )
     
     args = parser.parse_args()
+    if bool(args.reddit_url) == bool(args.batch):
+        parser.error('provide either a Reddit user profile URL or --batch FILE')
     
     # Setup logging
     if args.verbose:
@@ -220,53 +607,44 @@ Examples:
     setup_logging()
     
     try:
+        if args.batch:
+            run_batch(args)
+            return
+        
         # Extract username from URL
         logging.info(f"Extracting username from URL: {args.reddit_url}")
         username = extract_username_from_url(args.reddit_url)
         logging.info(f"Target username: {username}")
         
+        store = create_persona_store()
+        stored = None if args.refresh else find_fresh_persona(store, username)
+        if stored:
+            filepath = save_stored_report(stored, args.output_dir)
+            print(f"\n{'='*60}")
+            print("PERSONA LOADED FROM STORE")
+            print(f"{'='*60}")
+            print(f"Username: {stored.username}")
+            print(f"Output file: {filepath}")
+            print(f"Generated: {datetime.fromtimestamp(stored.generated_at).strftime('%Y-%m-%d %H:%M:%S')} "
+                  f"({stored.age_seconds / 3600:.1f}h ago; use --refresh to regenerate)")
+            print(f"{'='*60}")
+            return
+        
         # Initialize scraper and analyzer
         logging.info("Initializing Reddit scraper...")
         scraper = RedditScraper()
         
         logging.info("Initializing persona analyzer...")
-        analyzer = PersonaAnalyzer()
+        analyzer = create_analyzer()
         
-        # Scrape Reddit data
-        logging.info(f"Scraping Reddit data for user: {username}")
-        reddit_data = scraper.scrape_user_data(username)
-        
-        if not validate_reddit_data(reddit_data):
-            raise ValueError("Invalid Reddit data structure")
-        
-        logging.info(f"Successfully scraped {reddit_data['statistics']['total_activity']} total activities")
-        
-        # Generate persona
-        logging.info("Generating AI persona analysis...")
-        try:
-            persona = analyzer.generate_persona(reddit_data)
-            logging.info("Successfully generated persona")
-        except Exception as e:
-            logging.error(f"Failed to generate persona: {e}")
-            raise
-        
-        # Generate citations
-        logging.info("Generating citations...")
-        try:
-            citations = analyzer.generate_citations(reddit_data, persona)
-            logging.info("Successfully generated citations")
-        except Exception as e:
-            logging.warning(f"Failed to generate citations: {e}")
-            # Continue with empty citations if citation generation fails
-            citations = {}
-        
-        # Format output
-        logging.info("Formatting persona output...")
-        persona_text = format_persona_output(username, persona, citations, reddit_data)
-        
-        # Save to file
-        logging.info("Saving persona to file...")
-        filepath = save_persona_to_file(username, persona_text)
+        # Scrape Reddit data, then generate and save the persona
+        reddit_data = scrape_user(username, scraper)
+        filepath, persona = analyze_and_save(username, reddit_data, analyzer, args.output_dir, store)
+        timings_path = args.timings or os.path.join(
+            args.output_dir, f"{sanitize_filename(username)}_timings_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        )
+        usage = analyzer.usage.user_summary(username)
+        timings = save_run_timings(timings_path, mode='single', username=username, usage=usage)
         
         # Success message
         print(f"\n{'='*60}")
@@ -276,6 +654,10 @@ Examples:
         print(f"Output file: {filepath}")
         print(f"Total activities analyzed: {reddit_data['statistics']['total_activity']}")
         print(f"Analysis timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"Timings: {format_stage_timings(timings)} (details in {timings_path})")
+        print(f"Gemini usage: {format_usage(usage)}")
+        for message in usage['degraded']:
+            print(f"Token budget: {message}")
         print(f"{'='*60}")
         
         # Print summary to console
@@ -289,7 +671,7 @@ Examples:
         print(f"Main Frustrations: {persona['frustrations']['main_frustrations']}")
         
         print(f"\nFull detailed analysis saved to: {filepath}")
-        
+    
     except KeyboardInterrupt:
         logging.info("Process interrupted by user")
         sys.exit(1)
@@ -1,41 +1,109 @@
 """Reddit scraper module for collecting user posts and comments."""
 
 import praw
+import prawcore
 import logging
-from typing import Dict, List, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Any, Optional, Set, Tuple
 from datetime import datetime, timedelta
 import time
+from urllib.parse import urlparse
 
 from config import (
     REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT,
-    MAX_POSTS, MAX_COMMENTS, REQUEST_DELAY
+    MAX_POSTS, MAX_COMMENTS, REQUEST_DELAY,
+    ACTIVITY_CACHE_ENABLED, ACTIVITY_CACHE_PATH, ACTIVITY_CACHE_TTL, ACTIVITY_CACHE_MAX_ITEMS, ACTIVITY_REFRESH_OVERLAP
 )
-from utils import rate_limit_delay, clean_reddit_text, format_timestamp
+from activity_cache import ActivityCache
+from activity_store import ActivityStore
+from activity_stream import ActivityRecord, ActivityStream
+from metrics import increment, registry, span, timed
+from rate_limiter import RedditRateLimiter
+from utils import clean_reddit_text, format_timestamp
+
+
+INFO_BATCH_SIZE = 100  # Maximum fullnames accepted by Reddit's /api/info endpoint
+METRIC_ENDPOINTS = {'about', 'submitted', 'comments', 'info', 'me', 'access_token'}  # Endpoints labelled in metrics
+
+
+def endpoint_label(url: str) -> str:
+    """Map a Reddit API URL to a low-cardinality endpoint name for metrics."""
+    parts = [part for part in urlparse(url).path.split('/') if part]
+    if len(parts) == 2 and parts[0] == 'user':
+        return 'overview'
+    return parts[-1] if parts and parts[-1] in METRIC_ENDPOINTS else 'other'
+
+
+class RateLimitedRequestor(prawcore.Requestor):
+    """PRAW requestor that paces every HTTP request through a shared rate limiter."""
+    
+    def __init__(self, *args, rate_limiter: RedditRateLimiter, **kwargs):
+        """Initialize the requestor with the limiter shared by all requests."""
+        super().__init__(*args, **kwargs)
+        self.rate_limiter = rate_limiter
+    
+    def request(self, method: str, url: str, *args, **kwargs):
+        """Wait for a rate limit slot, issue the request and learn from its headers."""
+        endpoint = endpoint_label(url)
+        registry.observe('reddit_rate_limit_wait', self.rate_limiter.wait(), endpoint=endpoint)
+        with span('reddit_request', endpoint=endpoint):
+            response = super().request(method, url, *args, **kwargs)
+        increment('reddit_requests', endpoint=endpoint, status=response.status_code)
+        self.rate_limiter.update(response.headers)
+        return response
 
 
 class RedditScraper:
     """Handles Reddit API interactions and data collection."""
     
-    def __init__(self):
-        """Initialize Reddit API client."""
+    def __init__(self, rate_limiter: Optional[RedditRateLimiter] = None, activity_cache: Optional[ActivityCache] = None,
+                 validate: bool = True, session: Optional[Any] = None):
+        """Initialize Reddit API client, optionally sharing a rate limiter and activity cache.
+        
+        Pass `validate=False` to skip the authentication round trip when the
+        credentials have already been checked, e.g. by a client pool. A
+        `requests.Session`-compatible `session` replaces the HTTP transport,
+        e.g. to record or replay traffic in benchmarks.
+        """
         self.reddit = None
+        self.comments_reddit = None
+        self.session = session
+        self.rate_limiter = rate_limiter or RedditRateLimiter(min_interval=REQUEST_DELAY)
+        self.activity_cache = activity_cache
+        if self.activity_cache is None and ACTIVITY_CACHE_ENABLED:
+            self.activity_cache = ActivityCache(ACTIVITY_CACHE_PATH, ACTIVITY_CACHE_TTL, ACTIVITY_CACHE_MAX_ITEMS)
         self.setup_reddit_client()
-        
+        if validate:
+            self.validate_credentials()
+    
     def setup_reddit_client(self) -> None:
-        """Set up Reddit API client with credentials."""
+        """Set up Reddit API clients with credentials.
+        
+        PRAW clients are not thread-safe, so the comments listing, which is
+        scraped alongside the posts listing, gets a client of its own.
+        """
         if not REDDIT_CLIENT_ID or not REDDIT_CLIENT_SECRET:
             raise ValueError(
                 "Reddit API credentials not found. Please set REDDIT_CLIENT_ID "
                 "and REDDIT_CLIENT_SECRET environment variables."
             )
         
+        self.reddit = self._create_reddit_client()
+        self.comments_reddit = self._create_reddit_client()
+    
+    def _create_reddit_client(self) -> praw.Reddit:
+        """Build a PRAW client that paces its requests through the shared rate limiter."""
+        return praw.Reddit(
+            client_id=REDDIT_CLIENT_ID,
+            client_secret=REDDIT_CLIENT_SECRET,
+            user_agent=REDDIT_USER_AGENT,
+            requestor_class=RateLimitedRequestor,
+            requestor_kwargs={'rate_limiter': self.rate_limiter, 'session': self.session}
+        )
+    
+    def validate_credentials(self) -> None:
+        """Make one authenticated request to verify the Reddit credentials."""
         try:
-            self.reddit = praw.Reddit(
-                client_id=REDDIT_CLIENT_ID,
-                client_secret=REDDIT_CLIENT_SECRET,
-                user_agent=REDDIT_USER_AGENT
-            )
-            # Test authentication
             self.reddit.user.me()
         except Exception as e:
             logging.error(f"Failed to authenticate with Reddit API: {e}")
@@ -45,6 +113,10 @@ class RedditScraper:
         """Get Reddit user profile object."""
         try:
             user = self.reddit.redditor(username)
+            # Suspended accounts load with only `is_suspended`; shadowbanned ones 404
+            if getattr(user, 'is_suspended', False):
+                logging.error(f"User {username} is suspended")
+                return None
             # Test if user exists by accessing an attribute
             _ = user.created_utc
             return user
@@ -52,97 +124,300 @@ class RedditScraper:
             logging.error(f"Failed to get user profile for {username}: {e}")
             return None
     
-    def scrape_user_posts(self, username: str) -> List[Dict[str, Any]]:
-        """Scrape posts from a Reddit user profile."""
-        user = self.get_user_profile(username)
+    def scrape_user_posts(self, username: str, since_utc: Optional[float] = None,
+                          user: Optional[praw.models.Redditor] = None,
+                          known_ids: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+        """Scrape posts from a Reddit user profile, stopping at `since_utc` if given.
+        
+        Pass an already loaded `user` to avoid fetching the profile again, and
+        see `iter_user_posts` for `known_ids`.
+        """
+        user = user or self.get_user_profile(username)
         if not user:
             return []
         
-        posts = []
         try:
-            submissions = user.submissions.new(limit=MAX_POSTS)
-            
-            for submission in submissions:
-                rate_limit_delay(REQUEST_DELAY)
-                
-                post_data = {
-                    'id': submission.id,
-                    'title': submission.title,
-                    'body': clean_reddit_text(submission.selftext),
-                    'subreddit': str(submission.subreddit),
-                    'score': submission.score,
-                    'upvote_ratio': submission.upvote_ratio,
-                    'num_comments': submission.num_comments,
-                    'created_utc': submission.created_utc,
-                    'permalink': submission.permalink,
-                    'url': submission.url,
-                    'is_self': submission.is_self,
-                    'over_18': submission.over_18,
-                    'stickied': submission.stickied,
-                    'locked': submission.locked
-                }
-                
-                posts.append(post_data)
-                
+            posts = list(self.iter_user_posts(user, since_utc, known_ids))
             logging.info(f"Scraped {len(posts)} posts for user {username}")
             return posts
-            
+        
         except Exception as e:
             logging.error(f"Error scraping posts for {username}: {e}")
             return []
     
-    def scrape_user_comments(self, username: str) -> List[Dict[str, Any]]:
-        """Scrape comments from a Reddit user profile."""
-        user = self.get_user_profile(username)
+    def iter_user_posts(self, user: praw.models.Redditor, since_utc: Optional[float] = None,
+                        known_ids: Optional[Set[str]] = None) -> Iterator[Dict[str, Any]]:
+        """Yield cleaned posts newest first as the listing is paged.
+        
+        With `since_utc`, paging stops at the first post older than it, or with
+        `known_ids`, at the first such post that is already stored.
+        """
+        for submission in user.submissions.new(limit=MAX_POSTS):
+            # Listings are newest first, so everything from here on is already stored
+            if self._reached_stored(submission, since_utc, known_ids):
+                break
+            
+            yield {
+                'id': submission.id,
+                'title': submission.title,
+                'body': clean_reddit_text(submission.selftext),
+                'subreddit': str(submission.subreddit),
+                'score': submission.score,
+                'upvote_ratio': submission.upvote_ratio,
+                'num_comments': submission.num_comments,
+                'created_utc': submission.created_utc,
+                'permalink': submission.permalink,
+                'url': submission.url,
+                'is_self': submission.is_self,
+                'over_18': submission.over_18,
+                'stickied': submission.stickied,
+                'locked': submission.locked
+            }
+    
+    def scrape_user_comments(self, username: str, since_utc: Optional[float] = None,
+                             user: Optional[praw.models.Redditor] = None,
+                             known_ids: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+        """Scrape comments from a Reddit user profile, stopping at `since_utc` if given.
+        
+        Pass an already loaded `user` to avoid fetching the profile again, and
+        see `iter_user_comments` for `known_ids`.
+        """
+        user = user or self.get_user_profile(username)
         if not user:
             return []
         
-        comments = []
         try:
-            user_comments = user.comments.new(limit=MAX_COMMENTS)
-            
-            for comment in user_comments:
-                rate_limit_delay(REQUEST_DELAY)
-                
-                comment_data = {
-                    'id': comment.id,
-                    'body': clean_reddit_text(comment.body),
-                    'subreddit': str(comment.subreddit),
-                    'score': comment.score,
-                    'created_utc': comment.created_utc,
-                    'permalink': comment.permalink,
-                    'parent_id': comment.parent_id,
-                    'is_submitter': comment.is_submitter,
-                    'stickied': comment.stickied,
-                    'locked': getattr(comment, 'locked', False)
-                }
-                
-                # Try to get parent post title for context
-                try:
-                    if hasattr(comment, 'submission'):
-                        comment_data['parent_title'] = comment.submission.title
-                except:
-                    comment_data['parent_title'] = ""
-                
-                comments.append(comment_data)
-                
+            comments = list(self.iter_user_comments(user, since_utc, known_ids))
             logging.info(f"Scraped {len(comments)} comments for user {username}")
             return comments
-            
+        
         except Exception as e:
             logging.error(f"Error scraping comments for {username}: {e}")
             return []
     
-    def scrape_user_data(self, username: str) -> Dict[str, Any]:
-        """Scrape all available data for a Reddit user."""
+    def iter_user_comments(self, user: praw.models.Redditor, since_utc: Optional[float] = None,
+                           known_ids: Optional[Set[str]] = None) -> Iterator[Dict[str, Any]]:
+        """Yield cleaned comments newest first as the listing is paged.
+        
+        Paging stops as in `iter_user_posts`. Comments are held back only until a batch of INFO_BATCH_SIZE is ready,
+        so their parent titles can be resolved with one bulk request, made with
+        the same PRAW client as the listing.
+        """
+        title_cache: Dict[str, str] = {}
+        pending = []
+        
+        for comment in user.comments.new(limit=MAX_COMMENTS):
+            if self._reached_stored(comment, since_utc, known_ids):
+                break
+            
+            pending.append({
+                'id': comment.id,
+                'body': clean_reddit_text(comment.body),
+                'subreddit': str(comment.subreddit),
+                'score': comment.score,
+                'created_utc': comment.created_utc,
+                'permalink': comment.permalink,
+                'parent_id': comment.parent_id,
+                'is_submitter': comment.is_submitter,
+                'stickied': comment.stickied,
+                'locked': getattr(comment, 'locked', False),
+                'link_id': comment.link_id
+            })
+            
+            # Listing payloads usually carry the parent title already; read it
+            # from the raw attributes so PRAW doesn't lazily fetch anything
+            link_title = vars(comment).get('link_title')
+            if link_title:
+                title_cache[comment.link_id] = link_title
+            
+            if len(pending) >= INFO_BATCH_SIZE:
+                yield from self._attach_parent_titles(pending, title_cache, user._reddit)
+                pending = []
+        
+        yield from self._attach_parent_titles(pending, title_cache, user._reddit)
+    
+    @staticmethod
+    def _reached_stored(item: Any, since_utc: Optional[float], known_ids: Optional[Set[str]]) -> bool:
+        """Return whether a listing item is older than `since_utc` and, if ids are known, already stored."""
+        if since_utc is None or item.created_utc >= since_utc:
+            return False
+        return known_ids is None or item.id in known_ids
+    
+    def _attach_parent_titles(self, comments: List[Dict[str, Any]], title_cache: Dict[str, str],
+                              reddit: Optional[praw.Reddit] = None) -> List[Dict[str, Any]]:
+        """Resolve parent post titles for a batch of comments in bulk."""
+        self.resolve_submission_titles([c['link_id'] for c in comments], title_cache, reddit)
+        for comment_data in comments:
+            comment_data['parent_title'] = title_cache.get(comment_data['link_id'], "")
+        return comments
+    
+    def resolve_submission_titles(self, link_ids: List[str], cache: Dict[str, str],
+                                  reddit: Optional[praw.Reddit] = None) -> Dict[str, str]:
+        """Fill `cache` with titles for submission fullnames, fetching missing ones in batches.
+        
+        Pass the thread's own `reddit` client when called outside the main one.
+        """
+        reddit = reddit or self.reddit
+        missing = sorted({link_id for link_id in link_ids if link_id and link_id not in cache})
+        
+        for start in range(0, len(missing), INFO_BATCH_SIZE):
+            batch = missing[start:start + INFO_BATCH_SIZE]
+            try:
+                for submission in reddit.info(fullnames=batch):
+                    cache[submission.fullname] = submission.title
+            except Exception as e:
+                logging.warning(f"Failed to resolve {len(batch)} submission titles: {e}")
+        
+        if missing:
+            logging.info(f"Resolved {len(missing)} parent submission titles via /api/info")
+        return cache
+    
+    def _refresh_cached_activity(self, username: str, user: praw.models.Redditor, kind: str,
+                                 scrape: Callable[..., List[Dict[str, Any]]], limit: Optional[int]) -> List[Dict[str, Any]]:
+        """Fetch only activity newer than what is cached, merge it, and return the merged set."""
+        since_utc, known_ids = self._refresh_window(username, kind)
+        new_items = scrape(username, since_utc=since_utc, user=user, known_ids=known_ids)
+        self.activity_cache.store(username, kind, new_items)
+        
+        if since_utc is not None:
+            logging.info(f"Fetched {len(new_items)} new or recent {kind} for {username} since last refresh")
+        return self.activity_cache.load(username, kind, limit)
+    
+    def _refresh_window(self, username: str, kind: str) -> Tuple[Optional[float], Optional[Set[str]]]:
+        """Return where a cached listing refresh can stop: a cutoff and the ids already stored.
+        
+        The cutoff reaches ACTIVITY_REFRESH_OVERLAP seconds behind the newest
+        cached item, so recent items get fresh scores and items sharing its
+        timestamp are not missed. Paging continues past the cutoff until an
+        already stored item, which fills gaps left by an interrupted scrape.
+        """
+        newest = self.activity_cache.newest_created_utc(username, kind)
+        if newest is None:
+            return None, None
+        return newest - ACTIVITY_REFRESH_OVERLAP, self.activity_cache.item_ids(username, kind)
+    
+    @timed('scrape')
+    def scrape_user_data(self, username: str, on_progress: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Scrape all available data for a Reddit user.
+        
+        The profile is fetched once and shared by both listings, which are
+        scraped concurrently. If given, `on_progress(stage, details)` is called
+        as the posts and comments listings each finish.
+        """
         logging.info(f"Starting data scrape for user: {username}")
         
+        user = self._load_active_user(username)
+        profile_info = self._build_profile_info(username, user)
+        
+        if self.activity_cache:
+            self.activity_cache.evict()
+        
+        def fetch(kind: str, scrape: Callable[..., List[Dict[str, Any]]], limit: Optional[int],
+                  listing_user: praw.models.Redditor) -> List[Dict[str, Any]]:
+            if self.activity_cache:
+                items = self._refresh_cached_activity(username, listing_user, kind, scrape, limit)
+            else:
+                items = scrape(username, user=listing_user)
+            if on_progress:
+                on_progress(f"{kind}_scraped", {'count': len(items)})
+            return items
+        
+        # Scrape posts and comments concurrently, each thread on its own PRAW
+        # client; both share the rate limiter. The comments client's Redditor is
+        # lazy, so it does not fetch the profile again.
+        comments_user = self.comments_reddit.redditor(user.name)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            posts_future = executor.submit(fetch, 'posts', self.scrape_user_posts, MAX_POSTS, user)
+            comments_future = executor.submit(fetch, 'comments', self.scrape_user_comments, MAX_COMMENTS, comments_user)
+            posts = posts_future.result()
+            comments = comments_future.result()
+        
+        if self.activity_cache:
+            self.activity_cache.mark_refreshed(username)
+        
+        # Pack activity into columns; statistics are aggregated as items are added
+        activity = ActivityStore.from_items(posts, comments)
+        
+        return {
+            'profile': profile_info,
+            'posts': activity.posts,
+            'comments': activity.comments,
+            'statistics': activity.statistics(),
+            'activity': activity
+        }
+    
+    def stream_user_data(self, username: str) -> ActivityStream:
+        """Scrape a user's activity lazily, yielding records as listings are paged.
+        
+        Unlike `scrape_user_data`, nothing is accumulated: posts then comments
+        flow through the returned stream one record at a time, are written
+        through to the activity cache in batches, and statistics are computed
+        as they pass, so memory stays flat regardless of account size. As with
+        `scrape_user_data`, a cached user is refreshed incrementally: only new
+        items are fetched, followed by the cached ones.
+        """
+        logging.info(f"Starting streaming scrape for user: {username}")
+        
+        user = self._load_active_user(username)
+        profile_info = self._build_profile_info(username, user)
+        
+        if self.activity_cache:
+            self.activity_cache.evict()
+        
+        def records() -> Iterator[ActivityRecord]:
+            yield from self._stream_listing(username, 'posts', lambda *refresh: self.iter_user_posts(user, *refresh), MAX_POSTS)
+            yield from self._stream_listing(username, 'comments', lambda *refresh: self.iter_user_comments(user, *refresh), MAX_COMMENTS)
+            if self.activity_cache:
+                self.activity_cache.mark_refreshed(username)
+        
+        return ActivityStream(profile_info, records())
+    
+    def _stream_listing(self, username: str, kind: str, iterate: Callable[..., Iterator[Dict[str, Any]]],
+                        limit: Optional[int]) -> Iterator[ActivityRecord]:
+        """Yield one listing's records, fetching only activity newer than the cache, then the cached items.
+        
+        `iterate(since_utc, known_ids)` pages the listing; see `_refresh_window`.
+        At most `limit` records are yielded, the same window `scrape_user_data`
+        loads from the cache.
+        """
+        record_kind = kind[:-1]
+        if not self.activity_cache:
+            for item in iterate():
+                yield record_kind, item
+            return
+        
+        since_utc, known_ids = self._refresh_window(username, kind)
+        fetched = set()
+        for record in self.activity_cache.store_stream(username, ((record_kind, item) for item in iterate(since_utc, known_ids))):
+            fetched.add(record[1]['id'])
+            yield record
+        if since_utc is None:
+            return
+        
+        logging.info(f"Fetched {len(fetched)} new or recent {kind} for {username} since last refresh")
+        remaining = None if limit is None else limit - len(fetched)
+        for item in self.activity_cache.load(username, kind, limit):
+            if remaining is not None and remaining <= 0:
+                break
+            if item['id'] not in fetched:
+                yield record_kind, item
+                if remaining is not None:
+                    remaining -= 1
+    
+    def _load_active_user(self, username: str) -> praw.models.Redditor:
+        """Load a profile, failing fast for missing, suspended or empty accounts."""
         user = self.get_user_profile(username)
         if not user:
-            raise ValueError(f"User {username} not found or profile is private")
+            raise ValueError(f"User {username} not found, suspended or profile is private")
         
-        # Get basic profile info
-        profile_info = {
+        # One cheap probe of the overview listing so empty accounts fail before paging
+        if next(iter(user.new(limit=1)), None) is None:
+            raise ValueError(f"User {username} has no public posts or comments")
+        return user
+    
+    def _build_profile_info(self, username: str, user: praw.models.Redditor) -> Dict[str, Any]:
+        """Extract basic profile info from a loaded Redditor."""
+        return {
             'username': username,
             'created_utc': user.created_utc,
             'comment_karma': user.comment_karma,
@@ -152,36 +427,3 @@ class RedditScraper:
             'has_verified_email': user.has_verified_email,
             'account_age_days': (time.time() - user.created_utc) / (24 * 3600)
         }
-        
-        # Scrape posts and comments
-        posts = self.scrape_user_posts(username)
-        comments = self.scrape_user_comments(username)
-        
-        # Calculate activity statistics
-        total_posts = len(posts)
-        total_comments = len(comments)
-        
-        # Get subreddit activity
-        subreddit_activity = {}
-        for post in posts:
-            subreddit = post['subreddit']
-            subreddit_activity[subreddit] = subreddit_activity.get(subreddit, 0) + 1
-        
-        for comment in comments:
-            subreddit = comment['subreddit']
-            subreddit_activity[subreddit] = subreddit_activity.get(subreddit, 0) + 1
-        
-        # Sort subreddits by activity
-        top_subreddits = sorted(subreddit_activity.items(), key=lambda x: x[1], reverse=True)[:10]
-        
-        return {
-            'profile': profile_info,
-            'posts': posts,
-            'comments': comments,
-            'statistics': {
-                'total_posts': total_posts,
-                'total_comments': total_comments,
-                'total_activity': total_posts + total_comments,
-                'top_subreddits': top_subreddits
-            }
-        }
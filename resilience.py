@@ -0,0 +1,288 @@
+"""Retries, hedged requests and circuit breaking for Gemini calls."""
+
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+import httpx
+from google.genai import errors
+
+from metrics import increment
+
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+RETRY_DELAY_PATTERN = re.compile(r'^(\d+(?:\.\d+)?)s$')  # google.rpc.RetryInfo delays such as "37s"
+LATENCY_WINDOW = 200  # Recent latencies kept per model and stage
+HEDGE_MIN_SAMPLES = 20  # Latencies needed before a model and stage are hedged
+
+T = TypeVar('T')
+CallKey = Tuple[str, str]  # (model, stage)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling Gemini while the circuit breaker is open."""
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when a Gemini call does not finish before its deadline."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Return whether a failed call is worth retrying: throttling, server errors, timeouts and dropped connections."""
+    if isinstance(error, errors.APIError):
+        return error.code in RETRYABLE_STATUS_CODES
+    if isinstance(error, CircuitOpenError):
+        return False
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+def error_reason(error: BaseException) -> str:
+    """Describe a failure as a low-cardinality metric label."""
+    if isinstance(error, errors.APIError):
+        return str(error.code)
+    if isinstance(error, (httpx.TimeoutException, TimeoutError)):
+        return 'timeout'
+    if isinstance(error, (httpx.TransportError, ConnectionError)):
+        return 'connection'
+    return 'other'
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Return the delay the server asked for, from a Retry-After header or a RetryInfo detail."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        value = headers.get('retry-after')
+        if value is not None:
+            return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    
+    body = getattr(error, 'details', None)
+    body = body.get('error') if isinstance(body, dict) else None
+    if isinstance(body, dict):
+        for detail in body.get('details') or []:
+            match = RETRY_DELAY_PATTERN.match(str(detail.get('retryDelay', '')))
+            if match:
+                return float(match.group(1))
+    return None
+
+
+class CircuitBreaker:
+    """Fails Gemini calls fast during an outage instead of letting each one retry until its deadline.
+    
+    After `failure_threshold` consecutive retryable failures the circuit opens
+    and calls raise CircuitOpenError for `cooldown` seconds. Then a single probe
+    call is let through: success closes the circuit, failure reopens it. A
+    threshold of 0 disables the breaker.
+    """
+    
+    def __init__(self, failure_threshold: int, cooldown: float):
+        """Create a closed breaker."""
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.lock = threading.Lock()
+    
+    def before_call(self) -> None:
+        """Let a call through, or raise CircuitOpenError while the circuit is open."""
+        if not self.failure_threshold:
+            return
+        with self.lock:
+            if self.opened_at is None:
+                return
+            waited = time.monotonic() - self.opened_at
+            if self.probing or waited < self.cooldown:
+                increment('gemini_circuit_rejections')
+                raise CircuitOpenError(
+                    f"Gemini circuit breaker is open after {self.failures} consecutive failures; "
+                    f"retrying in {max(0.0, self.cooldown - waited):.0f}s"
+                )
+            self.probing = True
+    
+    def record_success(self) -> None:
+        """Close the circuit after a call that reached Gemini and got an answer."""
+        with self.lock:
+            if self.opened_at is not None:
+                logging.info("Gemini circuit breaker closed")
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+    
+    def record_failure(self) -> None:
+        """Count a retryable failure, opening the circuit at the threshold or when a probe fails."""
+        if not self.failure_threshold:
+            return
+        with self.lock:
+            self.failures += 1
+            if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                if not self.probing:
+                    logging.warning(f"Gemini circuit breaker opened after {self.failures} consecutive failures")
+                    increment('gemini_circuit_opened')
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+class LatencyTracker:
+    """Sliding window of successful call latencies per model and stage."""
+    
+    def __init__(self, window: int = LATENCY_WINDOW):
+        """Create an empty tracker keeping the last `window` latencies per key."""
+        self.window = window
+        self.samples: Dict[CallKey, Deque[float]] = {}
+        self.lock = threading.Lock()
+    
+    def record(self, key: CallKey, seconds: float) -> None:
+        """Add one latency."""
+        with self.lock:
+            samples = self.samples.get(key)
+            if samples is None:
+                samples = self.samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+    
+    def percentile(self, key: CallKey, fraction: float) -> Optional[float]:
+        """Return the latency below which `fraction` of recent calls finished, or None with too few samples."""
+        with self.lock:
+            samples = sorted(self.samples.get(key, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+class ResilientCaller:
+    """Runs Gemini calls with classified retries, jittered backoff, a deadline, hedging and a circuit breaker.
+    
+    Retryable failures (see `is_retryable`) are retried up to `max_attempts`
+    times with full-jitter exponential backoff, waiting at least as long as a
+    Retry-After the server sent. Every attempt, retries included, must finish
+    within `deadline` seconds of the call starting (0 for none). With `hedge`,
+    a duplicate request is sent once an attempt runs longer than the
+    `hedge_percentile` latency of recent calls with the same model and stage,
+    and the first reply wins; the slower request still counts against quota.
+    """
+    
+    def __init__(self, max_attempts: int = 4, backoff_base: float = 1.0, backoff_max: float = 30.0,
+                 deadline: float = 0.0, hedge: bool = False, hedge_percentile: float = 0.95,
+                 breaker: Optional[CircuitBreaker] = None):
+        """Create a caller; pass a shared `breaker` to trip on failures across callers."""
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.breaker = breaker or CircuitBreaker(failure_threshold=0, cooldown=0.0)
+        self.latencies = LatencyTracker()
+    
+    def call(self, fn: Callable[[], T], key: CallKey, streaming: bool = False) -> T:
+        """Call `fn` until it succeeds, fails permanently, runs out of attempts or passes the deadline.
+        
+        `key` is the call's (model, stage), used for hedging delays and metric
+        labels. Streamed calls run on the calling thread, since their chunks are
+        consumed as they arrive, and are never hedged; they must stop at the
+        deadline themselves.
+        """
+        model, stage = key
+        deadline_at = time.monotonic() + self.deadline if self.deadline else None
+        attempt = 0
+        
+        while True:
+            attempt += 1
+            self.breaker.before_call()
+            try:
+                if streaming:
+                    result = self._timed(fn, key)()
+                else:
+                    result = self._attempt(fn, key, deadline_at)
+            except Exception as e:
+                retryable = is_retryable(e)
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()  # Gemini answered, even if it refused the request
+                if not retryable or attempt >= self.max_attempts:
+                    raise
+                
+                delay = self._backoff(attempt, retry_after(e))
+                if deadline_at is not None and time.monotonic() + delay >= deadline_at:
+                    raise
+                increment('gemini_retries', model=model, reason=error_reason(e))
+                logging.warning(
+                    f"Gemini {stage} call failed ({e}); retrying in {delay:.1f}s "
+                    f"(attempt {attempt + 1}/{self.max_attempts})"
+                )
+                time.sleep(delay)
+                continue
+            
+            self.breaker.record_success()
+            return result
+    
+    def _backoff(self, attempt: int, requested: Optional[float]) -> float:
+        """Return the full-jitter delay before the next attempt, no shorter than the server requested."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+        return max(delay, requested) if requested is not None else delay
+    
+    def _timed(self, fn: Callable[[], T], key: CallKey) -> Callable[[], T]:
+        """Wrap `fn` so each successful request's latency feeds the hedging percentile."""
+        def run() -> T:
+            started = time.monotonic()
+            result = fn()
+            self.latencies.record(key, time.monotonic() - started)
+            return result
+        return run
+    
+    def _attempt(self, fn: Callable[[], T], key: CallKey, deadline_at: Optional[float]) -> T:
+        """Make one attempt, hedged if enabled, giving up at the deadline."""
+        hedge_delay = self.latencies.percentile(key, self.hedge_percentile) if self.hedge else None
+        if deadline_at is None and hedge_delay is None:
+            return self._timed(fn, key)()
+        
+        primary = self._start(fn, key)
+        pending = {primary}
+        if hedge_delay is not None:
+            done, _ = wait(pending, timeout=self._time_left(deadline_at, hedge_delay))
+            if not done and (deadline_at is None or time.monotonic() < deadline_at):
+                increment('gemini_hedges', model=key[0])
+                logging.info(f"Hedging Gemini {key[1]} call after {hedge_delay:.1f}s")
+                pending.add(self._start(fn, key))
+        
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, timeout=self._time_left(deadline_at), return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceededError(f"Gemini {key[1]} call did not finish within {self.deadline:g}s")
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        increment('gemini_hedge_wins', model=key[0])
+                    return future.result()
+                error = future.exception()
+        raise error
+    
+    def _start(self, fn: Callable[[], T], key: CallKey) -> Future:
+        """Run one request on a daemon thread, so a request abandoned at the deadline cannot block shutdown."""
+        future: Future = Future()
+        timed_fn = self._timed(fn, key)
+        
+        def run() -> None:
+            try:
+                future.set_result(timed_fn())
+            except BaseException as e:
+                future.set_exception(e)
+        
+        threading.Thread(target=run, name='gemini-call', daemon=True).start()
+        return future
+    
+    @staticmethod
+    def _time_left(deadline_at: Optional[float], limit: Optional[float] = None) -> Optional[float]:
+        """Return seconds until the deadline, capped at `limit`; None means wait indefinitely."""
+        if deadline_at is None:
+            return limit
+        left = max(0.0, deadline_at - time.monotonic())
+        return left if limit is None else min(left, limit)
@@ -0,0 +1,170 @@
+"""Content-addressed cache for Gemini responses."""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from config import RESPONSE_CACHE_BACKEND, RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_ENTRIES
+
+
+class MemoryCacheBackend:
+    """In-process LRU cache backend."""
+    
+    def __init__(self, max_entries: int):
+        """Create an LRU holding at most `max_entries` responses."""
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, str]" = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for `key`, marking it recently used."""
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+    
+    def set(self, key: str, value: str) -> None:
+        """Store a value, evicting the least recently used entry when full."""
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class DiskCacheBackend:
+    """On-disk cache backend storing one file per response."""
+    
+    def __init__(self, directory: str):
+        """Create a backend rooted at `directory`."""
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+    
+    def _path(self, key: str) -> str:
+        """Shard files by key prefix to keep directories small."""
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for `key`, if present."""
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)['value']
+        except (OSError, ValueError, KeyError):
+            return None
+    
+    def set(self, key: str, value: str) -> None:
+        """Write a value atomically so concurrent readers never see partial files."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'value': value}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Failed to write response cache entry: {e}")
+
+
+class TieredCacheBackend:
+    """Chain of backends checked in order, e.g. memory in front of disk."""
+    
+    def __init__(self, backends: List[Any]):
+        """Create a tiered backend from fastest to slowest."""
+        self.backends = backends
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return the first hit, copying it into the faster tiers."""
+        for i, backend in enumerate(self.backends):
+            value = backend.get(key)
+            if value is not None:
+                for faster in self.backends[:i]:
+                    faster.set(key, value)
+                return value
+        return None
+    
+    def set(self, key: str, value: str) -> None:
+        """Store a value in every tier."""
+        for backend in self.backends:
+            backend.set(key, value)
+
+
+class ResponseCache:
+    """Caches Gemini response text keyed on a hash of everything that shapes it."""
+    
+    def __init__(self, backend: Any):
+        """Wrap a backend exposing `get(key)` and `set(key, value)`."""
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(model: str, prompt: str, config: Any) -> str:
+        """Hash the model, system prompt, user prompt and generation config."""
+        schema = getattr(config, 'response_schema', None)
+        if isinstance(schema, type) and issubclass(schema, BaseModel):
+            schema = schema.model_json_schema()
+        
+        key_data = {
+            'model': model,
+            'prompt': prompt,
+            'config': config.model_dump(mode='json', exclude_none=True, exclude={'response_schema'}),
+            'response_schema': schema
+        }
+        encoded = json.dumps(key_data, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Look up a response, updating the hit/miss counters."""
+        value = self.backend.get(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+    
+    def set(self, key: str, value: str) -> None:
+        """Store a response."""
+        self.backend.set(key, value)
+    
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters."""
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+def create_response_cache(backend_name: str = RESPONSE_CACHE_BACKEND) -> Optional[ResponseCache]:
+    """Build a response cache for a backend name, or None when caching is disabled."""
+    if backend_name == "memory":
+        return ResponseCache(MemoryCacheBackend(RESPONSE_CACHE_MAX_ENTRIES))
+    if backend_name == "disk":
+        return ResponseCache(DiskCacheBackend(RESPONSE_CACHE_DIR))
+    if backend_name == "tiered":
+        return ResponseCache(TieredCacheBackend([
+            MemoryCacheBackend(RESPONSE_CACHE_MAX_ENTRIES),
+            DiskCacheBackend(RESPONSE_CACHE_DIR)
+        ]))
+    if backend_name == "none":
+        return None
+    raise ValueError(f"Unknown response cache backend: {backend_name}")
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_response_cache() -> Optional[ResponseCache]:
+    """Return the process-wide response cache, creating it on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = create_response_cache()
+        return _default_cache
@@ -0,0 +1,91 @@
+"""Local BM25 retrieval over a user's posts and comments."""
+
+import re
+from typing import Dict, List, Any, Tuple
+
+import numpy as np
+
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+# Common English words plus words that show up in nearly every persona analysis
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers him his
+how i if in into is it its itself just like may me might more most my no nor not now of off on once only or other our
+out over own same she should so some such than that the their theirs them then there these they this those through to
+too under until up very was we were what when where which while who whom why will with would you your yours
+user users their suggests indicates likely appears seems based analysis evidence reddit posts comments post comment
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase and split text into index terms, dropping stopwords."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+
+class CitationIndex:
+    """BM25 index over one user's posts and comments, built once per citation run.
+    
+    Postings are stored as flat NumPy arrays grouped by term, with BM25 weights
+    precomputed at build time, so a query is a handful of vectorized
+    scatter-adds followed by a partial sort.
+    """
+    
+    def __init__(self, posts: List[Dict[str, Any]], comments: List[Dict[str, Any]], k1: float = 1.5, b: float = 0.75):
+        """Index the title, body and parent title of every post and comment."""
+        self.items: List[Tuple[str, Dict[str, Any]]] = (
+            [('post', post) for post in posts] + [('comment', comment) for comment in comments]
+        )
+        self.vocabulary: Dict[str, int] = {}
+        
+        doc_ids: List[int] = []
+        term_ids: List[int] = []
+        term_counts: List[int] = []
+        doc_lengths = np.zeros(len(self.items), dtype=np.float64)
+        
+        for doc_id, (_, item) in enumerate(self.items):
+            tokens = tokenize(f"{item.get('title', '')} {item.get('body', '')} {item.get('parent_title') or ''}")
+            doc_lengths[doc_id] = len(tokens)
+            counts: Dict[int, int] = {}
+            for token in tokens:
+                term_id = self.vocabulary.setdefault(token, len(self.vocabulary))
+                counts[term_id] = counts.get(term_id, 0) + 1
+            doc_ids.extend([doc_id] * len(counts))
+            term_ids.extend(counts.keys())
+            term_counts.extend(counts.values())
+        
+        docs = np.asarray(doc_ids, dtype=np.int64)
+        terms = np.asarray(term_ids, dtype=np.int64)
+        tf = np.asarray(term_counts, dtype=np.float64)
+        
+        # BM25 weight for every (document, term) posting
+        document_frequency = np.bincount(terms, minlength=len(self.vocabulary))
+        idf = np.log1p((len(self.items) - document_frequency + 0.5) / (document_frequency + 0.5))
+        average_length = doc_lengths.mean() if len(self.items) and doc_lengths.mean() > 0 else 1.0
+        norm = k1 * (1 - b + b * doc_lengths[docs] / average_length)
+        weights = idf[terms] * tf * (k1 + 1) / (tf + norm)
+        
+        # Group postings by term so each query term is one contiguous slice
+        order = np.argsort(terms, kind='stable')
+        self.posting_docs = docs[order]
+        self.posting_weights = weights[order]
+        self.term_offsets = np.concatenate(([0], np.cumsum(document_frequency)))
+    
+    def search(self, query: str, k: int) -> List[Tuple[str, Dict[str, Any]]]:
+        """Return up to `k` `(kind, item)` pairs that best match `query`, best first."""
+        term_ids = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+        if not term_ids or k <= 0:
+            return []
+        
+        scores = np.zeros(len(self.items), dtype=np.float64)
+        for term_id in term_ids:
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            scores[self.posting_docs[start:end]] += self.posting_weights[start:end]
+        
+        k = min(k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [self.items[doc_id] for doc_id in top]
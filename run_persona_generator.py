@@ -8,21 +8,20 @@ import subprocess
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python run_persona_generator.py <reddit_user_url>")
+        print("Usage: python run_persona_generator.py <reddit_user_url> [options]")
+        print("       python run_persona_generator.py --batch <file> [options]")
         print(
             "Example: python run_persona_generator.py https://www.reddit.com/user/kojied/"
         )
         return 1
 
-    reddit_url = sys.argv[1]
-
     # Import and run the main function
     try:
         from reddit_persona_generator import main as generate_main
 
-        # Temporarily replace sys.argv to pass the URL
+        # Temporarily replace sys.argv to pass the arguments through
         original_argv = sys.argv
-        sys.argv = ['reddit_persona_generator.py', reddit_url]
+        sys.argv = ['reddit_persona_generator.py'] + sys.argv[1:]
 
         generate_main()
 
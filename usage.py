@@ -0,0 +1,164 @@
+"""Gemini token usage accounting per user, stage and run, with optional token budgets."""
+
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from prompt_builder import estimate_tokens
+
+
+USAGE_FIELDS = ('prompt', 'cached', 'output', 'thoughts', 'total')
+
+
+class TokenUsage:
+    """Running token counts for one user, stage or run."""
+    
+    __slots__ = USAGE_FIELDS + ('calls', 'estimated_calls', 'cache_hits')
+    
+    def __init__(self):
+        """Start every count at zero."""
+        for field in self.__slots__:
+            setattr(self, field, 0)
+    
+    def add(self, counts: Dict[str, int], estimated: bool) -> None:
+        """Add one Gemini call's token counts."""
+        for field in USAGE_FIELDS:
+            setattr(self, field, getattr(self, field) + counts[field])
+        self.calls += 1
+        self.estimated_calls += estimated
+    
+    def to_dict(self) -> Dict[str, int]:
+        """Return the counts as a plain dict."""
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class UsageTracker:
+    """Aggregates Gemini token usage and answers how much of each budget is left.
+    
+    Counts come from each response's `usage_metadata`; when a response has
+    none, tokens are estimated from the prompt and response text so budgets
+    still apply. A budget of 0 or None is unlimited. The user budget covers
+    one persona (call `reset_user` when a user's run starts); the run budget
+    covers everything this tracker has seen.
+    """
+    
+    def __init__(self, user_budget: Optional[int] = None, run_budget: Optional[int] = None):
+        """Create a tracker with optional per-user and per-run token budgets."""
+        self.user_budget = user_budget or None
+        self.run_budget = run_budget or None
+        self.run = TokenUsage()
+        self.stages: Dict[str, TokenUsage] = {}
+        self.users: Dict[str, TokenUsage] = {}
+        self.user_stages: Dict[Tuple[str, str], TokenUsage] = {}
+        self.degradations: Dict[str, List[str]] = {}
+        self.lock = threading.Lock()
+    
+    def record_response(self, username: Optional[str], stage: str, response: Any, prompt: str) -> Dict[str, int]:
+        """Record the usage of one Gemini response and return its token counts."""
+        metadata = getattr(response, 'usage_metadata', None)
+        if metadata is not None and metadata.prompt_token_count is not None:
+            counts = {
+                'prompt': metadata.prompt_token_count or 0,
+                'cached': metadata.cached_content_token_count or 0,
+                'output': metadata.candidates_token_count or 0,
+                'thoughts': metadata.thoughts_token_count or 0
+            }
+            counts['total'] = metadata.total_token_count or counts['prompt'] + counts['output'] + counts['thoughts']
+            estimated = False
+        else:
+            counts = {'prompt': estimate_tokens(prompt), 'cached': 0,
+                      'output': estimate_tokens(getattr(response, 'text', None) or ""), 'thoughts': 0}
+            counts['total'] = counts['prompt'] + counts['output']
+            estimated = True
+        
+        with self.lock:
+            self.run.add(counts, estimated)
+            self._usage(self.stages, stage).add(counts, estimated)
+            if username:
+                self._usage(self.users, username).add(counts, estimated)
+                self._usage(self.user_stages, (username, stage)).add(counts, estimated)
+        return counts
+    
+    def record_cache_hit(self, username: Optional[str], stage: str) -> None:
+        """Count a call served from the response cache, which costs no tokens."""
+        with self.lock:
+            self.run.cache_hits += 1
+            self._usage(self.stages, stage).cache_hits += 1
+            if username:
+                self._usage(self.users, username).cache_hits += 1
+                self._usage(self.user_stages, (username, stage)).cache_hits += 1
+    
+    @staticmethod
+    def _usage(table: Dict[Any, TokenUsage], key: Any) -> TokenUsage:
+        """Return the usage entry for `key`, creating it. Caller must hold the lock."""
+        usage = table.get(key)
+        if usage is None:
+            usage = table[key] = TokenUsage()
+        return usage
+    
+    def reset_user(self, username: str) -> None:
+        """Start a fresh per-user budget, e.g. when a user's persona run begins."""
+        self.release_user(username)
+    
+    def release_user(self, username: str) -> None:
+        """Forget a user's counts and degradations; run and stage totals keep them."""
+        with self.lock:
+            self.users.pop(username, None)
+            self.degradations.pop(username, None)
+            for key in [key for key in self.user_stages if key[0] == username]:
+                del self.user_stages[key]
+    
+    def remaining(self, username: Optional[str]) -> Optional[int]:
+        """Return the tokens left under the tighter of the user and run budgets, or None if unlimited."""
+        with self.lock:
+            limits = []
+            if self.run_budget:
+                limits.append(self.run_budget - self.run.total)
+            if self.user_budget and username:
+                user_usage = self.users.get(username)
+                limits.append(self.user_budget - (user_usage.total if user_usage else 0))
+        return max(0, min(limits)) if limits else None
+    
+    def note_degradation(self, username: Optional[str], message: str) -> None:
+        """Remember that a budget made a user's run cut back."""
+        with self.lock:
+            self.degradations.setdefault(username or "", []).append(message)
+    
+    def user_summary(self, username: str) -> Dict[str, Any]:
+        """Return a user's token totals, per-stage breakdown and budget state."""
+        remaining = self.remaining(username)
+        with self.lock:
+            usage = self.users.get(username) or TokenUsage()
+            return {
+                **usage.to_dict(),
+                'stages': {stage: stage_usage.to_dict() for (user, stage), stage_usage in self.user_stages.items()
+                           if user == username},
+                'budget': self.user_budget,
+                'remaining': remaining,
+                'degraded': list(self.degradations.get(username, []))
+            }
+    
+    def run_summary(self) -> Dict[str, Any]:
+        """Return run-wide token totals broken down by stage and user."""
+        remaining = self.remaining(None)
+        with self.lock:
+            return {
+                **self.run.to_dict(),
+                'stages': {stage: usage.to_dict() for stage, usage in self.stages.items()},
+                'users': {username: usage.to_dict() for username, usage in self.users.items()},
+                'budget': self.run_budget,
+                'remaining': remaining,
+                'degraded': {username: list(messages) for username, messages in self.degradations.items()}
+            }
+
+
+def format_usage(usage: Dict[str, Any]) -> str:
+    """Summarize token totals on one line."""
+    line = (
+        f"{usage['total']} tokens ({usage['prompt']} prompt, {usage['cached']} cached, "
+        f"{usage['output'] + usage['thoughts']} output) over {usage['calls']} Gemini calls"
+    )
+    if usage['cache_hits']:
+        line += f", {usage['cache_hits']} served from cache"
+    if usage['estimated_calls']:
+        line += f" ({usage['estimated_calls']} estimated)"
+    return line